@@ -1,12 +1,26 @@
-import os
+import sys
+import argparse
 import logging
-from flask import Flask, Response, render_template
-import random
+from flask import Flask, Response, jsonify, render_template, request
 import time
 import threading
-import json
+import numpy as np
 from config import *
-from metrics_manager import MetricsManager
+import pipeline
+from pipeline import (
+    logger, generate_metrics, log_exceedings, display_top_apps, generate_tick, display_current_top_apps,
+    periodic_metrics_generation, start_background_jobs, start_sharded_pipeline, run_generation_process,
+)
+from serving import SharedSnapshotView, serve
+from push import PushQueue, PushDecodeError, decode_push
+from series_store import parse_selector
+from rollups import AGGREGATIONS
+from live import TopAppsBroadcaster, top_rows
+from instrumentation import (
+    timed, TICK_REGISTRY, REQUEST_REGISTRY, SCRAPES_TOTAL, METRICS_REQUEST_SECONDS, PUSHED_SAMPLES_TOTAL,
+    PUSH_REJECTED_TOTAL,
+)
+from exposition import render_prometheus, iter_exposition, negotiate_format, OPENMETRICS_CONTENT_TYPE
 import atexit  # Import atexit to handle cleanup
 
 # Initialize Flask app
@@ -20,119 +34,107 @@ log.setLevel(logging.ERROR)
 from werkzeug.serving import WSGIRequestHandler
 WSGIRequestHandler.log_request = lambda *args, **kwargs: None
 
-# Configure logging
-log_format = '%(asctime)s - %(levelname)s - %(message)s'
-log_level = getattr(logging, LOG_LEVEL.upper(), logging.INFO)  # Convert LOG_LEVEL string to logging level
+# The tick pipeline whose published ticks the web app serves, set by init()
+file_writer = None
+metrics_manager = None
+push_queue = None
 
-# Create a logger
-logger = logging.getLogger(__name__)
-logger.setLevel(log_level)
+# Changes to the top apps pushed to /api/v1/exceeding/stream subscribers after every published tick
+live_updates = TopAppsBroadcaster()
 
-# Add console handler if LOG_TO_CONSOLE is True and LOG_TO_CONSOLE_ONLY_EXCEEDINGS is False
-if LOG_TO_CONSOLE and not LOG_TO_CONSOLE_ONLY_EXCEEDINGS:
-    console_handler = logging.StreamHandler()
-    console_handler.setFormatter(logging.Formatter(log_format))
-    logger.addHandler(console_handler)
-
-# Add file handler if LOG_TO_FILE is True
-if LOG_TO_FILE:
-    # Create the logs directory if it doesn't exist
-    log_dir = os.path.dirname(LOG_FILE_NAME)
-    os.makedirs(log_dir, exist_ok=True)
-
-    file_handler = logging.FileHandler(LOG_FILE_NAME, mode='a', encoding='utf-8')
-    file_handler.setFormatter(logging.Formatter(log_format))
-    logger.addHandler(file_handler)
-
-    # Register a cleanup function to close the file handler on application exit
-    atexit.register(file_handler.close)
-
-# Initialize MetricsManager
-metrics_manager = MetricsManager()
-
-# Delete the previous exceedings file if the option is enabled
-if DELETE_PREVIOUS_EXCEEDINGS_FILE and os.path.exists(EXCEEDINGS_FILE_PATH):
-    os.remove(EXCEEDINGS_FILE_PATH)
-
-def generate_metrics():
-    """Generate random metrics for each app."""
-    metrics = {
-        f"app{i+1}": random.randint(RANDOM_METRIC_MIN, RANDOM_METRIC_MAX)
-        for i in range(NUM_APPS)
-    }
-    return metrics
+def init():
+    """Create the tick pipeline the web app serves, once; importing the app creates nothing."""
+    global file_writer, metrics_manager, push_queue
+    pipeline.init()
+    file_writer = pipeline.file_writer
+    metrics_manager = pipeline.metrics_manager
+    push_queue = pipeline.push_queue
+    if live_updates.publish not in metrics_manager.snapshot_listeners:
+        metrics_manager.snapshot_listeners.append(live_updates.publish)
 
 def format_prometheus_metrics(metrics):
     """Format metrics in Prometheus format."""
-    prometheus_metrics = []
-    for app_name, value in metrics.items():
-        prometheus_metrics.append(f'{METRIC_NAME}{{app_name="{app_name}"}} {value}')
-    return "\n".join(prometheus_metrics)
-
-def log_exceedings(top_apps):
-    """Log the top apps exceeding the threshold to the exceedings_log.txt file."""
-    if WRITE_EXCEEDINGS_TO_FILE and isinstance(top_apps, list):  # Ensure top_apps is a list
-        timestamp = int(time.time())
-        data = {
-            "timestamp": timestamp,
-            "top_apps": top_apps
-        }
-        # Create directory if it doesn't exist
-        os.makedirs(os.path.dirname(EXCEEDINGS_FILE_PATH), exist_ok=True)
-        with open(EXCEEDINGS_FILE_PATH, "a") as file:
-            json.dump(data, file)
-            file.write("\n")  # Add a newline for readability
-            file.flush()  # Force flush to ensure data is written
-
-def display_top_apps(top_apps):
-    """Display the top apps based on the configured DISPLAY_MODE."""
-    if DISPLAY_MODE in ["console", "both"]:
-        if LOG_TO_CONSOLE_ONLY_EXCEEDINGS:
-            # Print directly to the console if only exceedance logs are allowed
-            print(f"Top {TOP_X_APPS} apps exceeding threshold: {top_apps}")
-        else:
-            # Use the logger if all logs are allowed
-            logger.info(f"Top {TOP_X_APPS} apps exceeding threshold: {top_apps}")
+    return render_prometheus(metrics.keys(), metrics.values(), METRIC_NAME)
 
-    # Log the top apps to the exceedings_log.txt file
-    log_exceedings(top_apps)
+if INSTRUMENTATION_ENABLED:
+    @app.before_request
+    def count_request():
+        SCRAPES_TOTAL.inc(request.endpoint or "unknown")
 
-def periodic_metrics_generation(max_iterations=None):
-    """Periodically generate, store, and process metrics."""
-    iteration = 0
-    while True:
+@app.route('/metrics')
+@timed(METRICS_REQUEST_SECONDS)
+def metrics():
+    """Endpoint to serve the last collected metrics in Prometheus or OpenMetrics format."""
+    snapshot = metrics_manager.snapshot  # Take one reference; the generator may publish another meanwhile
+    selectors = request.args.getlist("match[]")
+    if selectors:
         try:
-            if max_iterations is not None and iteration >= max_iterations:
-                break  # Stop after max_iterations
+            series_ids = select_series(snapshot, None, selectors)
+        except ValueError as e:
+            return str(e), 400
+        logger.info("Serving selected series in Prometheus format")  # Log the request
+        body = snapshot.series.render(series_ids) if series_ids is not None else ""
+        return Response(body, mimetype="text/plain")
 
-            metrics = generate_metrics()
-            metrics_manager.store_metrics(metrics)
-            metrics_manager.process_metrics(metrics, THRESHOLD)
-            top_apps = metrics_manager.get_top_exceedance_apps(TOP_X_APPS)
-            display_top_apps(top_apps)
+    exposition_format = negotiate_format(request.accept_mimetypes)
 
-            # Log the iteration message to the file handler only
-            logger.info(f"Iteration {iteration}: Metrics processed and logged.")
+    if snapshot is not None and snapshot.timestamp is not None:
+        if METRICS_STREAMING:
+            logger.info("Streaming metrics in %s format", exposition_format)  # Log the request
+            return stream_exposition_response(snapshot, exposition_format)
 
-            time.sleep(METRICS_INTERVAL)
-            iteration += 1
-        except Exception as e:
-            logger.error(f"Error in periodic_metrics_generation: {e}", exc_info=True)
-            time.sleep(METRICS_INTERVAL)  # Wait before retrying
+        exposition = snapshot.exposition
+        if exposition is not None:
+            selected = exposition.select(exposition_format, request.accept_encodings.quality("gzip") > 0)
+            if selected is not None:
+                logger.info("Serving metrics in Prometheus format")  # Log the request
+                return cached_exposition_response(exposition, exposition_format, *selected)
 
-@app.route('/metrics')
-def metrics():
-    """Endpoint to serve the last collected metrics in Prometheus format."""
-    if metrics_manager.metrics_history:
-        last_metrics = metrics_manager.metrics_history[-1][1]  # Get the latest metrics
+        last_metrics = dict(zip(snapshot.latest_names, snapshot.values.tolist()))
+    elif metrics_manager.metrics_history:
+        last_metrics = metrics_manager.metrics_history[-1][1]  # Get the latest metrics (nothing published yet)
     else:
         last_metrics = generate_metrics()  # Fallback if no metrics are available
 
+    logger.info("Serving metrics in Prometheus format")  # Log the request
+    if exposition_format == "openmetrics":
+        body = "".join(iter_exposition(list(last_metrics), list(last_metrics.values()), METRIC_NAME,
+                                       int(time.time()), openmetrics=True))
+        return Response(body, content_type=OPENMETRICS_CONTENT_TYPE)
+
     # Format the metrics in Prometheus format
     prometheus_metrics = format_prometheus_metrics(last_metrics)
-    logger.info("Serving metrics in Prometheus format")  # Log the request
     return Response(prometheus_metrics, mimetype="text/plain")
 
+def cached_exposition_response(exposition, exposition_format, body, etag, is_gzipped):
+    """Serve a pre-rendered exposition, honouring conditional requests."""
+    headers = {"Last-Modified": exposition.last_modified, "Vary": "Accept, Accept-Encoding"}
+
+    if request.if_none_match.contains(etag) or (
+        not request.if_none_match and request.if_modified_since
+        and request.if_modified_since.timestamp() >= exposition.timestamp
+    ):
+        response = Response(status=304, headers=headers)
+    else:
+        if exposition_format == "openmetrics":
+            response = Response(body, content_type=OPENMETRICS_CONTENT_TYPE, headers=headers)
+        else:
+            response = Response(body, mimetype="text/plain", headers=headers)
+        if is_gzipped:
+            response.headers["Content-Encoding"] = "gzip"
+    response.set_etag(etag)
+    return response
+
+def stream_exposition_response(snapshot, exposition_format):
+    """Stream the latest snapshot in chunks so memory per request stays bounded."""
+    openmetrics = exposition_format == "openmetrics"
+    # The snapshot's arrays are frozen copies, so later ticks cannot change a body mid-stream
+    chunks = iter_exposition(snapshot.latest_names, snapshot.values, METRIC_NAME, snapshot.timestamp,
+                             openmetrics=openmetrics)
+    if openmetrics:
+        return Response(chunks, content_type=OPENMETRICS_CONTENT_TYPE)
+    return Response(chunks, mimetype="text/plain")
+
 @app.route('/exceeding')
 def exceeding():
     """Endpoint to display the top apps exceeding the threshold."""
@@ -140,17 +142,230 @@ def exceeding():
         logger.warning("Display mode is not set to 'page' or 'both'")  # Log the warning
         return "Display mode is not set to 'page' or 'both'.", 404
 
-    top_apps = metrics_manager.get_top_exceedance_apps(TOP_X_APPS)
+    window = request.args.get("window")
+    if window is not None and window not in EXCEEDANCE_WINDOWS:
+        return f"Unknown window '{window}'. Available windows: {', '.join(EXCEEDANCE_WINDOWS)}.", 400
+
+    metric = request.args.get("metric")
+    selectors = request.args.getlist("match[]")
+    overcounts = None  # Maximum overcount of each top app when TOP_X_MODE is "approximate"
+    if metric or selectors:
+        if window is not None:
+            return "Windows apply to the top apps only; remove 'metric' and 'match[]' to use them.", 400
+        snapshot = metrics_manager.snapshot
+        try:
+            series_ids = select_series(snapshot, metric, selectors)
+        except ValueError as e:
+            return str(e), 400
+        top_apps = snapshot.series.top_exceedances(TOP_X_APPS, series_ids) if series_ids is not None else []
+        selection = " or ".join(selectors) if selectors else metric
+    else:
+        top_apps = metrics_manager.get_top_exceedance_apps(TOP_X_APPS, window=window)
+        if TOP_X_MODE == "approximate":
+            overcounts = metrics_manager.get_exceedance_errors(top_apps, window=window)
+        selection = None
     logger.info("Serving top apps exceeding threshold")  # Log the request
-    return render_template('exceeding.html', top_apps=top_apps)
+    return render_template('exceeding.html', top_apps=top_apps, window=window, windows=EXCEEDANCE_WINDOWS,
+                           selection=selection, overcounts=overcounts)
 
-def main():
+@app.route('/api/v1/exceeding')
+def exceeding_api():
+    """Endpoint returning the top apps exceeding the threshold as JSON."""
+    window, error = exceeding_window()
+    if error is not None:
+        return error
+    top_apps = metrics_manager.get_top_exceedance_apps(TOP_X_APPS, window=window)
+    overcounts = metrics_manager.get_exceedance_errors(top_apps, window=window) if TOP_X_MODE == "approximate" else None
+    snapshot = metrics_manager.snapshot
+    return jsonify({
+        "status": "success",
+        "data": {
+            "window": window,
+            "sequence": snapshot.sequence if snapshot is not None else None,
+            "timestamp": snapshot.timestamp if snapshot is not None else None,
+            "rows": top_rows(top_apps, overcounts),
+        },
+    })
+
+@app.route('/api/v1/exceeding/stream')
+def exceeding_stream():
+    """Endpoint streaming the changed top apps rows once per tick as Server-Sent Events."""
+    window, error = exceeding_window()
+    if error is not None:
+        return error
+    subscription = live_updates.subscribe(window)
+    logger.info("Streaming top apps to %d subscribers", len(live_updates))  # Log the request
+    return Response(live_updates.stream(subscription), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def exceeding_window():
+    """Return (window, None) for the request's window parameter, or (None, error response)."""
+    if DISPLAY_MODE not in ["page", "both"]:
+        return None, query_error("Display mode is not set to 'page' or 'both'.", 404)
+    window = request.args.get("window")
+    if window is not None and window not in EXCEEDANCE_WINDOWS:
+        return None, query_error(f"Unknown window '{window}'. Available windows: {', '.join(EXCEEDANCE_WINDOWS)}.")
+    return window, None
+
+def select_series(snapshot, metric, selectors):
+    """Return the IDs of the snapshot's series named metric that match any selector, or None before the first tick.
+
+    Raises ValueError for an invalid selector.
+    """
+    parsed = [parse_selector(selector) for selector in selectors] or [(None, [])]
+    if snapshot is None or snapshot.series is None:
+        return None
+    view = snapshot.series
+    ids = None
+    for selector_metric, matchers in parsed:
+        if metric is not None:
+            matchers = matchers + [("__name__", "=", metric)]
+        selected = view.select(selector_metric, matchers)
+        ids = selected if ids is None else np.union1d(ids, selected)
+    return ids
+
+@app.route('/api/v1/write', methods=['POST'])
+def push_write():
+    """Endpoint accepting pushed samples as JSON lines or Prometheus remote-write."""
+    if push_queue is None:
+        return "Push ingestion is disabled; set INGESTION_MODE to 'push'.", 404
+
+    body = request.stream.read(PUSH_MAX_BODY_BYTES + 1)  # Bounded even without a Content-Length
+    if len(body) > PUSH_MAX_BODY_BYTES:
+        if INSTRUMENTATION_ENABLED:
+            PUSH_REJECTED_TOTAL.inc("too_large")
+        return f"Push bodies are limited to {PUSH_MAX_BODY_BYTES} bytes.", 413
+    series = {} if SERIES_ALL_METRICS else None
+    try:
+        app_names, values = decode_push(body, request.mimetype, request.headers.get("Content-Encoding", "").lower(),
+                                        series)
+    except PushDecodeError as e:
+        if INSTRUMENTATION_ENABLED:
+            PUSH_REJECTED_TOTAL.inc("invalid")
+        return str(e), 400
+
+    if not push_queue.put(app_names, values, series):
+        # Ticks are not draining pushes fast enough; the client should retry after the next one
+        if INSTRUMENTATION_ENABLED:
+            PUSH_REJECTED_TOTAL.inc("queue_full")
+        return "Push queue is full, retry later.", 429, {"Retry-After": str(METRICS_INTERVAL)}
+    if INSTRUMENTATION_ENABLED:
+        PUSHED_SAMPLES_TOTAL.inc(amount=len(values))
+    return "", 204
+
+@app.route('/api/v1/query_range')
+def query_range():
+    """Endpoint returning the stored values of chosen apps over a time range, aggregated per step."""
+    if isinstance(metrics_manager, SharedSnapshotView):
+        return query_error("History is kept by the generator process; range queries need the development server.", 501)
+
+    app_names = request.args.getlist("app")
+    aggregation = request.args.get("agg", "avg")
+    try:
+        end = int(float(request.args.get("end", time.time())))
+        start = int(float(request.args.get("start", end - QUERY_DEFAULT_RANGE)))
+        step = int(float(request.args.get("step", METRICS_INTERVAL)))
+    except ValueError:
+        return query_error("start, end and step must be numbers of seconds.")
+    if not app_names:
+        return query_error("Name at least one app with the 'app' parameter.")
+    if aggregation not in AGGREGATIONS:
+        return query_error(f"Unknown aggregation '{aggregation}'. Available: {', '.join(AGGREGATIONS)}.")
+    if step < 1 or end < start:
+        return query_error("step must be at least 1 and end must not be before start.")
+    if (end - start) // step + 1 > QUERY_MAX_POINTS:
+        return query_error(f"The range spans more than {QUERY_MAX_POINTS} steps; use a larger step.")
+
+    source, result = metrics_manager.query_range(app_names, start, end, step, aggregation)
+    logger.info("Serving range query over %d apps from %s", len(result), source)  # Log the request
+    return jsonify({
+        "status": "success",
+        "data": {
+            "resultType": "matrix",
+            "source": source,
+            "result": [{"metric": {"__name__": METRIC_NAME, "app_name": name}, "values": values}
+                       for name, values in result.items()],
+        },
+    })
+
+@app.route('/api/v1/stats')
+def app_stats():
+    """Endpoint returning the streaming statistics and current threshold of chosen apps."""
+    if isinstance(metrics_manager, SharedSnapshotView):
+        return query_error("Statistics are kept by the generator process; they need the development server.", 501)
+    if metrics_manager.statistics is None:
+        return query_error("Statistics are disabled; set STATS_ENABLED or an adaptive THRESHOLD_MODE.", 404)
+    app_names = request.args.getlist("app")
+    if not app_names:
+        return query_error("Name at least one app with the 'app' parameter.")
+
+    result = metrics_manager.app_statistics(app_names, THRESHOLD)
+    return jsonify({
+        "status": "success",
+        "data": {
+            "thresholdMode": metrics_manager.threshold_mode,
+            "result": [dict(summary, app_name=name) for name, summary in result.items()],
+        },
+    })
+
+def query_error(message, status=400):
+    return jsonify({"status": "error", "error": message}), status
+
+@app.route('/internal/metrics')
+def internal_metrics():
+    """Endpoint to serve the app's own timings and state in Prometheus format."""
+    if not INSTRUMENTATION_ENABLED:
+        return "Instrumentation is disabled.", 404
+
+    if isinstance(metrics_manager, SharedSnapshotView):
+        # Production worker: tick figures are rendered by the generator process and published with each tick
+        snapshot = metrics_manager.snapshot
+        tick_metrics = snapshot.internal_metrics if snapshot is not None else None
+    else:
+        tick_metrics = TICK_REGISTRY.render()
+    return Response((tick_metrics or "") + REQUEST_REGISTRY.render(), mimetype="text/plain")
+
+def use_shared_snapshots(buffer):
+    """Serve this worker's requests from the snapshots the generator process publishes."""
+    global metrics_manager
+    metrics_manager = SharedSnapshotView(buffer)
+    threading.Thread(target=live_updates.follow, args=(buffer.read,), daemon=True).start()
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(description="Generate app metrics and serve them over HTTP.")
+    parser.add_argument("--server", choices=["development", "production"], default=SERVER_MODE,
+                        help="Flask's built-in server or gunicorn workers sharing one generator")
+    parser.add_argument("--host", default=FLASK_HOST)
+    parser.add_argument("--port", type=int, default=FLASK_PORT)
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS, help="Worker processes in production mode")
+    parser.add_argument("--threads", type=int, default=SERVER_THREADS, help="Threads per worker in production mode")
+    return parser.parse_args(argv)
+
+def main(argv=()):
     """Main function to start the metrics generation and Flask app."""
+    args = parse_arguments(argv)
+    pipeline.init_logging()  # Route the app logger through the queued LOG_* handlers before anything logs
+    init()
+
+    if args.server == "production":
+        global push_queue
+        if push_queue is not None:
+            # Workers hand pushed batches to the generator process
+            push_queue = pipeline.push_queue = PushQueue(processes=True)
+        if pipeline.checkpointer is not None:
+            atexit.unregister(pipeline.checkpointer.save)  # Only the generator process holds state worth saving
+        logger.info("Starting %d workers with %d threads on %s:%s", args.workers, args.threads, args.host, args.port)
+        serve(app, metrics_manager, run_generation_process, use_shared_snapshots, host=args.host,
+              port=args.port, workers=args.workers, threads=args.threads)
+        return
+
+    start_sharded_pipeline()  # Shards are forked, so before any other thread exists
+    start_background_jobs()
     # Start the periodic metrics generation in a separate thread
     threading.Thread(target=periodic_metrics_generation, daemon=True).start()
     # Run the Flask app
-    logger.info(f"Starting Flask app on {FLASK_HOST}:{FLASK_PORT}")  # Log the app start
-    app.run(host=FLASK_HOST, port=FLASK_PORT)
+    logger.info("Starting Flask app on %s:%s", args.host, args.port)  # Log the app start
+    app.run(host=args.host, port=args.port)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main(sys.argv[1:])
\ No newline at end of file
@@ -0,0 +1,75 @@
+"""Compare the dict-based and vectorized exceedance paths at several app counts.
+
+Run from the repository root:
+    python benchmarks/bench_exceedance.py [--apps 1000 100000 1000000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+from metrics_manager import MetricsManager  # noqa: E402
+
+THRESHOLD = 10000
+TOP_X = 5
+
+def legacy_process(exceedance_count, metrics):
+    """The original per-app Python loop."""
+    for app_name, value in metrics.items():
+        if value > THRESHOLD:
+            exceedance_count[app_name] += 1
+
+def legacy_top(exceedance_count):
+    """The original full sort."""
+    return sorted(exceedance_count.items(), key=lambda x: x[1], reverse=True)[:TOP_X]
+
+def best_of(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def run(num_apps, repeat):
+    metrics = {f"app{i+1}": random.randint(1, 12000) for i in range(num_apps)}
+
+    legacy_counts = defaultdict(int)
+    legacy_process(legacy_counts, metrics)
+    manager = MetricsManager(history_max_ticks=1)
+    manager.process_metrics(metrics, THRESHOLD)
+    app_names = tuple(metrics)
+    values = np.fromiter(metrics.values(), dtype=np.int64, count=num_apps)
+
+    return {
+        "legacy_process": best_of(lambda: legacy_process(legacy_counts, metrics), repeat),
+        "vector_process": best_of(lambda: manager.process_metrics(metrics, THRESHOLD), repeat),
+        "array_process": best_of(lambda: manager.process_values(app_names, values, THRESHOLD), repeat),
+        "legacy_top": best_of(lambda: legacy_top(legacy_counts), repeat),
+        "vector_top": best_of(lambda: manager.get_top_exceedance_apps(TOP_X), repeat),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--apps", type=int, nargs="+", default=[1000, 100000, 1000000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'apps':>9} {'stage':>15} {'legacy ms':>10} {'vector ms':>10} {'speedup':>8}")
+    for num_apps in args.apps:
+        result = run(num_apps, args.repeat)
+        rows = [
+            ("process (dict)", result["legacy_process"], result["vector_process"]),
+            ("process (array)", result["legacy_process"], result["array_process"]),
+            ("top", result["legacy_top"], result["vector_top"]),
+        ]
+        for stage, legacy, vector in rows:
+            print(f"{num_apps:>9} {stage:>15} {legacy * 1000:>10.2f} {vector * 1000:>10.2f} {legacy / vector:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""Measure generation ticks per second for each distribution at several app counts.
+
+Run from the repository root:
+    python benchmarks/bench_generation.py [--apps 10000 100000 1000000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generation import DISTRIBUTIONS, MetricsGenerator  # noqa: E402
+
+def legacy_generate(num_apps):
+    """The original per-app dict comprehension."""
+    return {f"app{i+1}": random.randint(1, 12000) for i in range(num_apps)}
+
+def ticks_per_second(func, min_time):
+    ticks = 0
+    start = time.perf_counter()
+    while True:
+        func()
+        ticks += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return ticks / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--apps", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--min-time", type=float, default=1.0, help="Seconds to run each case")
+    args = parser.parse_args()
+
+    print(f"{'apps':>9} {'engine':>16} {'ticks/s':>10}")
+    for num_apps in args.apps:
+        rate = ticks_per_second(lambda: legacy_generate(num_apps), args.min_time)
+        print(f"{num_apps:>9} {'legacy':>16} {rate:>10.1f}")
+        for name in DISTRIBUTIONS:
+            generator = MetricsGenerator(num_apps=num_apps, distribution=name, seed=0)
+            rate = ticks_per_second(generator.generate, args.min_time)
+            print(f"{num_apps:>9} {name:>16} {rate:>10.1f}")
+        generator = MetricsGenerator(num_apps=num_apps, seed=0)
+        rate = ticks_per_second(generator.generate_dict, args.min_time)
+        print(f"{num_apps:>9} {'uniform (dict)':>16} {rate:>10.1f}")
+
+if __name__ == "__main__":
+    main()
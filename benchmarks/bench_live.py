@@ -0,0 +1,45 @@
+"""Time one tick's fan-out of top-X changes to many live subscribers.
+
+Run from the repository root:
+    python benchmarks/bench_live.py [--subscribers 100 1000 10000]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from live import TopAppsBroadcaster  # noqa: E402
+from metrics_manager import MetricsManager  # noqa: E402
+
+def run(num_subscribers, num_apps, ticks):
+    manager = MetricsManager(history_max_ticks=1)
+    manager.write_to_file = False
+    broadcaster = TopAppsBroadcaster(queue_size=ticks)
+    subscriptions = [broadcaster.subscribe() for _ in range(num_subscribers)]
+    timings = []
+    for tick in range(ticks):
+        # Rotate which apps exceed so the ranking changes every tick
+        manager.process_metrics({f"app{i}": 20 if (i + tick) % 3 else 0 for i in range(num_apps)}, 10)
+        snapshot = manager.publish_snapshot()
+        start = time.perf_counter()
+        broadcaster.publish(snapshot)
+        timings.append(time.perf_counter() - start)
+    assert all(subscription.queue.qsize() == ticks for subscription in subscriptions[:10])
+    return min(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--subscribers", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--apps", type=int, default=1000)
+    parser.add_argument("--ticks", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'subscribers':>11} {'publish ms':>11} {'us/subscriber':>14}")
+    for num_subscribers in args.subscribers:
+        seconds = run(num_subscribers, args.apps, args.ticks)
+        print(f"{num_subscribers:>11} {seconds * 1000:>11.2f} {seconds * 1e6 / num_subscribers:>14.2f}")
+
+if __name__ == "__main__":
+    main()
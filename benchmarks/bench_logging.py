@@ -0,0 +1,78 @@
+"""Compare request latency with synchronous and queued logging to a slow log disk.
+
+Run from the repository root:
+    python benchmarks/bench_logging.py [--delays 0 1 10] [--requests 200]
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+import app as app_module  # noqa: E402
+from log_pipeline import LogPipeline  # noqa: E402
+
+class SlowHandler(logging.Handler):
+    """Formats each record, then stalls for delay seconds like a write to a busy disk."""
+
+    def __init__(self, delay):
+        super().__init__()
+        self.delay = delay
+        self.written = 0
+
+    def emit(self, record):
+        self.format(record)
+        time.sleep(self.delay)
+        self.written += 1
+
+def measure(client, num_requests):
+    timings = []
+    for _ in range(num_requests):
+        start = time.perf_counter()
+        client.get('/metrics')
+        timings.append(time.perf_counter() - start)
+    return np.percentile(timings, [50, 99]) * 1000
+
+def run(mode, delay, num_requests):
+    logger = app_module.logger
+    saved = logger.handlers[:]
+    for handler in saved:
+        logger.removeHandler(handler)
+    handler = SlowHandler(delay)
+    pipeline = None
+    if mode == "sync":
+        logger.addHandler(handler)
+    else:
+        pipeline = LogPipeline([handler], rate_limit=0)  # Every record written, as in the synchronous run
+        pipeline.attach(logger)
+    try:
+        p50, p99 = measure(app_module.app.test_client(), num_requests)
+    finally:
+        for current in logger.handlers[:]:
+            logger.removeHandler(current)
+        for original in saved:
+            logger.addHandler(original)
+        if pipeline is not None:
+            pipeline.stop()  # Waits for the slow handler to catch up
+    assert handler.written == num_requests
+    return p50, p99
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--delays", type=float, nargs="+", default=[0, 1, 10], help="Write stall per record (in ms)")
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    app_module.init()
+    app_module.generate_tick()  # One published tick to serve
+    print(f"{'delay ms':>8} {'mode':>6} {'p50 ms':>8} {'p99 ms':>8}")
+    for delay in args.delays:
+        for mode in ("sync", "queued"):
+            p50, p99 = run(mode, delay / 1000, args.requests)
+            print(f"{delay:>8g} {mode:>6} {p50:>8.3f} {p99:>8.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""JSON reports and baseline comparison shared by bench_suite.py and bench_startup.py.
+
+Each result is a dict with a "best" time in seconds plus the fields that
+identify it, such as the stage and app count. A baseline is read before the
+new results are written, so a run can never be compared against itself.
+"""
+import json
+import os
+import platform
+import time
+
+def load_baseline(parser, baseline_path, output_path):
+    """Return the JSON report at baseline_path, or None without one; fails when it is also output_path."""
+    if not baseline_path:
+        return None
+    if os.path.exists(output_path) and os.path.samefile(baseline_path, output_path):
+        parser.error("--compare and --output name the same file; write the new results elsewhere")
+    with open(baseline_path) as file:
+        return json.load(file)
+
+def write_report(path, results, repeat, **details):
+    """Write results as JSON with the interpreter and platform they were measured on."""
+    report = {
+        "python": platform.python_version(),
+        **details,
+        "platform": platform.platform(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "repeat": repeat,
+        "results": results,
+    }
+    with open(path, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"Results written to {path}")
+
+def compare(results, baseline, tolerance, fields, scale=1e6, unit="us"):
+    """Print the change of each result against baseline and return the regressed ones.
+
+    fields lists the (name, column width) pairs identifying a result; times
+    are printed multiplied by scale, in unit.
+    """
+    def key(result):
+        return tuple(result[name] for name, _ in fields)
+
+    previous = {key(result): result["best"] for result in baseline["results"]}
+    regressions = []
+    print("\n" + " ".join(f"{name:>{width}}" for name, width in fields)
+          + f" {'base ' + unit:>12} {'now ' + unit:>12} {'change':>8}")
+    for result in results:
+        before = previous.get(key(result))
+        if before is None:
+            continue
+        change = result["best"] / before - 1
+        regressed = change > tolerance
+        if regressed:
+            regressions.append(result)
+        print(" ".join(f"{result[name]:>{width}}" for name, width in fields)
+              + f" {before * scale:>12.1f} {result['best'] * scale:>12.1f} {change:>+7.0%}"
+              + ("  REGRESSED" if regressed else ""))
+    return regressions
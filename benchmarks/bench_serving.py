@@ -0,0 +1,95 @@
+"""Compare /metrics throughput and latency of the development and production servers.
+
+Each server is started as `python app.py --server <mode>` on a free port and
+loaded by keep-alive client threads for a fixed duration.
+
+Run from the repository root:
+    python benchmarks/bench_serving.py [--clients 32] [--duration 10] [--workers 4]
+"""
+import argparse
+import http.client
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def wait_until_ready(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            connection.request("GET", "/metrics")
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server on port {port} did not start")
+
+def client(port, path, stop, latencies, errors):
+    """Send requests over one keep-alive connection until stop is set."""
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            connection.request("GET", path)
+            response = connection.getresponse()
+            response.read()
+            if response.will_close:
+                connection.close()
+            latencies.append(time.perf_counter() - start)
+        except (OSError, http.client.HTTPException):
+            errors.append(1)
+            connection.close()
+
+def load(port, path, clients, duration):
+    stop = threading.Event()
+    latencies, errors = [], []
+    threads = [threading.Thread(target=client, args=(port, path, stop, latencies, errors)) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99)] if latencies else float("nan")
+    return len(latencies) / duration, p99, len(errors)
+
+def run(mode, args):
+    port = free_port()
+    command = [sys.executable, "app.py", "--server", mode, "--host", "127.0.0.1", "--port", str(port),
+               "--workers", str(args.workers), "--threads", str(args.threads)]
+    server = subprocess.Popen(command, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_ready(port)
+        return load(port, args.path, args.clients, args.duration)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modes", nargs="+", default=["development", "production"])
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--path", default="/metrics")
+    args = parser.parse_args()
+
+    print(f"{'server':>12} {'req/s':>10} {'p99 ms':>10} {'errors':>7}")
+    for mode in args.modes:
+        throughput, p99, errors = run(mode, args)
+        print(f"{mode:>12} {throughput:>10.0f} {p99 * 1000:>10.2f} {errors:>7}")
+
+if __name__ == "__main__":
+    main()
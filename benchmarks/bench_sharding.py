@@ -0,0 +1,93 @@
+"""Measure tick latency of the single-threaded loop and the sharded pipeline.
+
+The shard column covers generation, threshold processing and the lifetime and
+windowed top-X rankings, which the shards split between them. The store,
+render and publish columns are the coordinator's own stages: storing the
+values in the history, rendering the /metrics body and publishing the
+snapshot. They stay serial and O(apps) in one process however many shards
+run, so they bound the speedup of the whole tick.
+
+Run from the repository root:
+    python benchmarks/bench_sharding.py [--apps 1000000] [--shards 1 2 4 8]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import EXCEEDANCE_WINDOWS, THRESHOLD, TOP_X_APPS  # noqa: E402
+from generation import MetricsGenerator  # noqa: E402
+from metrics_manager import MetricsManager  # noqa: E402
+from sharding import ShardedPipeline  # noqa: E402
+
+def best_of(func, repeat):
+    func()  # Warm up
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def coordinator_stages(manager, app_names, values):
+    """Time the stages the coordinator runs after the counting, whichever way it counted."""
+    start = time.perf_counter()
+    manager.store_values(app_names, values)
+    stored = time.perf_counter()
+    manager.render_exposition()
+    rendered = time.perf_counter()
+    manager.publish_snapshot()
+    return stored - start, rendered - stored, time.perf_counter() - rendered
+
+def single_process_tick(num_apps, repeat):
+    generator = MetricsGenerator(num_apps)
+    manager = MetricsManager(history_max_ticks=2)
+    manager.write_to_file = False
+
+    def tick():
+        values = generator.generate()
+        manager.process_values(generator.app_names, values, THRESHOLD)
+        manager.get_top_exceedance_apps(TOP_X_APPS)
+        for window in EXCEEDANCE_WINDOWS:
+            manager.get_top_exceedance_apps(TOP_X_APPS, window=window)
+
+    counting = best_of(tick, repeat)
+    stages = [coordinator_stages(manager, generator.app_names, generator.values) for _ in range(repeat)]
+    return (counting, *map(min, zip(*stages)))
+
+def sharded_tick(num_apps, shards, repeat):
+    pipeline = ShardedPipeline(num_apps, shards)
+    manager = MetricsManager(history_max_ticks=2)
+    manager.write_to_file = False
+    pipeline.attach(manager)
+    try:
+        counting = best_of(lambda: pipeline.tick(THRESHOLD), repeat)
+        stages = [coordinator_stages(manager, pipeline.app_names, pipeline.values) for _ in range(repeat)]
+        return (counting, *map(min, zip(*stages)))
+    finally:
+        pipeline.close()
+
+def print_row(num_apps, shards, timings, baseline):
+    total = sum(timings)
+    stages = " ".join(f"{elapsed * 1000:>9.2f}" for elapsed in timings)
+    print(f"{num_apps:>9} {shards:>7} {stages} {total * 1000:>9.2f} {sum(baseline) / total:>7.1f}x")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--apps", type=int, nargs="+", default=[1000000])
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    print(f"{'apps':>9} {'shards':>7} {'shard ms':>9} {'store ms':>9} {'render ms':>9} {'publish ms':>9} "
+          f"{'tick ms':>9} {'speedup':>8}  (cores: {os.cpu_count()})")
+    for num_apps in args.apps:
+        baseline = single_process_tick(num_apps, args.repeat)
+        print_row(num_apps, "-", baseline, baseline)
+        for shards in args.shards:
+            print_row(num_apps, shards, sharded_tick(num_apps, shards, args.repeat), baseline)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Compare the exact and approximate top-X counters on a skewed exceedance load.
+
+Apps exceed with a Zipf-like probability, so a few apps exceed in most ticks
+and the long tail rarely does. Reports the memory held by the lifetime
+counter, the time per tick and per ranking, the recall of the true top X and
+the largest overcount among the reported top X.
+
+Run from the repository root:
+    python benchmarks/bench_sketch.py [--apps 100000 1000000] [--capacity 1000]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+from exceedance import ExceedanceCounter  # noqa: E402
+from metrics_history import AppIndex  # noqa: E402
+from sketches import SpaceSavingCounter  # noqa: E402
+
+def run(num_apps, ticks, capacity, top_x, exponent):
+    rng = np.random.default_rng(0)
+    probabilities = np.minimum(1.0, 3 / np.arange(1, num_apps + 1) ** exponent)
+    index = AppIndex()
+    columns = index.columns([f"app{i}" for i in range(num_apps)])
+    exact = ExceedanceCounter(index)
+    approximate = SpaceSavingCounter(index, capacity)
+
+    exact_seconds = approximate_seconds = 0.0
+    for _ in range(ticks):
+        exceeded = rng.random(num_apps) < probabilities
+        start = time.perf_counter()
+        exact.add(columns, exceeded)
+        exact_seconds += time.perf_counter() - start
+        start = time.perf_counter()
+        approximate.add(columns, exceeded)
+        approximate_seconds += time.perf_counter() - start
+
+    start = time.perf_counter()
+    true_top = exact.top(top_x)
+    exact_top_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    summary = approximate.summary()
+    reported_columns, reported_counts, _ = summary.top(top_x)
+    approximate_top_seconds = time.perf_counter() - start
+
+    true_names = {name for name, _ in true_top}
+    reported_names = {index.names[c] for c in reported_columns.tolist()}
+    overcount = reported_counts - exact.counts[reported_columns]
+    return {
+        "exact_bytes": exact.counts.nbytes,
+        "approximate_bytes": approximate.nbytes,
+        "exact_tick": exact_seconds / ticks,
+        "approximate_tick": approximate_seconds / ticks,
+        "exact_top": exact_top_seconds,
+        "approximate_top": approximate_top_seconds,
+        "recall": len(true_names & reported_names) / max(len(true_names), 1),
+        "max_overcount": int(overcount.max()) if len(overcount) else 0,
+        "max_bound": int(summary.errors.max()) if len(summary.errors) else 0,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--apps", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--ticks", type=int, default=200)
+    parser.add_argument("--capacity", type=int, default=1000)
+    parser.add_argument("--top", type=int, default=100)
+    parser.add_argument("--exponent", type=float, default=1.1, help="Zipf exponent of the exceedance probability")
+    args = parser.parse_args()
+
+    print(f"{'apps':>9} {'mode':>12} {'memory KiB':>11} {'tick ms':>8} {'top ms':>7} "
+          f"{'recall':>7} {'max over':>9} {'bound':>6}")
+    for num_apps in args.apps:
+        result = run(num_apps, args.ticks, args.capacity, args.top, args.exponent)
+        print(f"{num_apps:>9} {'exact':>12} {result['exact_bytes'] / 1024:>11.1f} "
+              f"{result['exact_tick'] * 1000:>8.2f} {result['exact_top'] * 1000:>7.2f} {1:>7.2f} {0:>9} {0:>6}")
+        print(f"{num_apps:>9} {'approximate':>12} {result['approximate_bytes'] / 1024:>11.1f} "
+              f"{result['approximate_tick'] * 1000:>8.2f} {result['approximate_top'] * 1000:>7.2f} "
+              f"{result['recall']:>7.2f} {result['max_overcount']:>9} {result['max_bound']:>6}")
+
+if __name__ == "__main__":
+    main()
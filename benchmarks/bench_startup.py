@@ -0,0 +1,93 @@
+"""Time the startup and import cost of each entry point in fresh interpreters.
+
+Every case runs in its own Python process, started in an empty directory so
+logs and data files land there: importing the pipeline, the web app and the
+CLI, a headless run up to its first processed tick and an analysis of an
+empty log. Results are written as JSON; --compare checks them against an
+earlier run and exits with status 1 when a case got slower than the
+tolerance allows, or when a headless case loaded Flask.
+
+Run from the repository root:
+    python benchmarks/bench_startup.py [--repeat 5] [--output startup_results.json]
+    python benchmarks/bench_startup.py --compare baseline.json [--tolerance 0.25]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from bench_report import load_baseline, write_report, compare
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Case name -> (statement run in the fresh process, whether it may load Flask)
+CASES = {
+    "import pipeline": ("import pipeline", False),
+    "import metrics_app": ("import metrics_app", False),
+    "import app": ("import app", True),
+    "init app": ("import app; app.init()", True),
+    "run 1 tick": ("import metrics_app; metrics_app.main(['run', '--ticks', '1'])", False),
+    "analyze": ("import metrics_app; metrics_app.main(['analyze'])", False),
+}
+
+PROBE = """
+import sys, time, json
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "modules": len(sys.modules), "flask": "flask" in sys.modules}}))
+"""
+
+def measure(statement, repeat):
+    """Return the best in-process time, best process wall time, module count and Flask use over repeat runs."""
+    env = dict(os.environ, PYTHONPATH=ROOT, PYTHONDONTWRITEBYTECODE="1")
+    best, best_wall, probe = None, None, None
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as directory:
+            start = time.perf_counter()
+            output = subprocess.run([sys.executable, "-c", PROBE.format(statement=statement)], cwd=directory, env=env,
+                                    capture_output=True, text=True, check=True).stdout
+            wall = time.perf_counter() - start
+        probe = json.loads(output.strip().splitlines()[-1])  # Earlier lines are the app's own console output
+        best = probe["seconds"] if best is None else min(best, probe["seconds"])
+        best_wall = wall if best_wall is None else min(best_wall, wall)
+    return best, best_wall, probe["modules"], probe["flask"]
+
+def run_cases(repeat):
+    results = []
+    for name, (statement, allows_flask) in CASES.items():
+        seconds, wall, modules, flask = measure(statement, repeat)
+        results.append({"case": name, "best": seconds, "wall": wall, "modules": modules, "flask": flask,
+                        "allows_flask": allows_flask})
+        print(f"{name:>20} {seconds * 1000:>10.1f} {wall * 1000:>10.1f} {modules:>8} {'yes' if flask else 'no':>6}")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default="startup_results.json", help="JSON file the results are written to")
+    parser.add_argument("--compare", metavar="BASELINE", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed slowdown of a case's best time before it counts as a regression")
+    args = parser.parse_args()
+    baseline = load_baseline(parser, args.compare, args.output)  # Read before the new results are written
+
+    print(f"{'case':>20} {'import ms':>10} {'wall ms':>10} {'modules':>8} {'flask':>6}")
+    results = run_cases(args.repeat)
+    write_report(args.output, results, args.repeat)
+
+    failures = [result for result in results if result["flask"] and not result["allows_flask"]]
+    for result in failures:
+        print(f"{result['case']} loaded Flask")
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance, [("case", 20)], scale=1e3, unit="ms")
+        if regressions:
+            print(f"{len(regressions)} cases regressed by more than {args.tolerance:.0%}")
+        failures += regressions
+    if failures:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
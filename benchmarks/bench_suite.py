@@ -0,0 +1,126 @@
+"""Time every pipeline stage and HTTP route at several app counts and history lengths.
+
+Stages run offline with seeded metrics: generation, storage, threshold
+processing, top-X ranking, Prometheus formatting, log file writes, and
+/metrics and /exceeding through the Flask test client. Results are written as
+JSON; --compare checks them against an earlier run and exits with status 1
+when a stage got slower than the tolerance allows.
+
+Run from the repository root:
+    python benchmarks/bench_suite.py [--apps 100 1000 10000] [--history 120 2880] [--output bench_results.json]
+    python benchmarks/bench_suite.py --compare baseline.json [--tolerance 0.25]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+import app as app_module  # noqa: E402
+from config import THRESHOLD, TOP_X_APPS  # noqa: E402
+from file_writer import BackgroundWriter  # noqa: E402
+from generation import MetricsGenerator  # noqa: E402
+from metrics_manager import MetricsManager  # noqa: E402
+from bench_report import load_baseline, write_report, compare  # noqa: E402
+
+SEED = 0
+
+def measure(func, repeat, min_time=0.005):
+    """Return the best and median time per call over repeat rounds of at least min_time each."""
+    func()  # Warm up
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        if time.perf_counter() - start >= min_time:
+            break
+        number *= 2
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        timings.append((time.perf_counter() - start) / number)
+    return min(timings), statistics.median(timings)
+
+def build_manager(generator, history):
+    """A manager whose history is full at history ticks, as after a long run."""
+    manager = MetricsManager(history_max_ticks=history, delete_previous=False)
+    manager.write_to_file = False
+    columns = manager.app_index.columns(generator.app_names)
+    timestamp = int(time.time()) - history
+    for tick in range(history):
+        values = generator.generate()
+        manager.metrics_history.append_values(timestamp + tick, columns, values)
+        manager.process_values(generator.app_names, values, THRESHOLD, timestamp + tick)
+    return manager
+
+def stages(num_apps, history, directory):
+    """Yield (stage, func) pairs timed at num_apps apps and history ticks."""
+    generator = MetricsGenerator(num_apps, seed=SEED)
+    manager = build_manager(generator, history)
+    metrics = generator.generate_dict()
+    writer = BackgroundWriter(background=False, durability="flush")
+    path = os.path.join(directory, f"metrics_{num_apps}_{history}.txt")
+    record = {"timestamp": int(time.time()), "metrics": metrics}
+
+    yield "generate_metrics", generator.generate_dict
+    yield "store_metrics", lambda: manager.store_metrics(metrics)
+    yield "process_metrics", lambda: manager.process_metrics(metrics, THRESHOLD)
+    yield "get_top_exceedance_apps", lambda: manager.get_top_exceedance_apps(TOP_X_APPS)  # Live counters
+    yield "format_prometheus_metrics", lambda: app_module.format_prometheus_metrics(metrics)
+    yield "file_write", lambda: writer.write_json(path, record)
+    writer.close()
+
+    # Routes answer from a published tick, like a running server between ticks
+    manager.render_exposition()
+    manager.publish_snapshot()
+    app_module.metrics_manager = manager
+    client = app_module.app.test_client()
+    yield "http_metrics", lambda: client.get("/metrics")
+    yield "http_exceeding", lambda: client.get("/exceeding")
+    query = "&".join(f"app={name}" for name in generator.app_names[:10])
+    start = int(time.time()) - history
+    yield "http_query_range", lambda: client.get(f"/api/v1/query_range?{query}&start={start}&step=60")
+
+def run_suite(apps, histories, repeat):
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for num_apps in apps:
+            for history in histories:
+                for stage, func in stages(num_apps, history, directory):
+                    best, median = measure(func, repeat)
+                    results.append({"stage": stage, "apps": num_apps, "history": history,
+                                    "best": best, "median": median})
+                    print(f"{stage:>26} {num_apps:>8} {history:>8} {best * 1e6:>12.1f} {median * 1e6:>12.1f}")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--apps", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--history", type=int, nargs="+", default=[120, 2880], help="Ticks kept in memory")
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--output", default="bench_results.json", help="JSON file the results are written to")
+    parser.add_argument("--compare", metavar="BASELINE", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed slowdown of a stage's best time before it counts as a regression")
+    args = parser.parse_args()
+    baseline = load_baseline(parser, args.compare, args.output)  # Read before the new results are written
+
+    print(f"{'stage':>26} {'apps':>8} {'history':>8} {'best us':>12} {'median us':>12}")
+    results = run_suite(args.apps, args.history, args.repeat)
+    write_report(args.output, results, args.repeat, numpy=np.__version__, cpu_count=os.cpu_count())
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance, [("stage", 26), ("apps", 8), ("history", 8)])
+        if regressions:
+            print(f"{len(regressions)} stages regressed by more than {args.tolerance:.0%}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+import os
+import json
+import threading
+import numpy as np
+from config import CHECKPOINT_PATH, CHECKPOINT_INTERVAL, CHECKPOINT_HISTORY_TICKS
+from columnar_log import ColumnarLogReader
+from retention import json_chunk_paths, read_json_ticks
+
+CHECKPOINT_VERSION = 1
+
+def capture_state(manager, history_ticks=CHECKPOINT_HISTORY_TICKS):
+    """Copy what a checkpoint needs from the manager; cheap enough for the generation thread."""
+    timestamps, values, present = manager.metrics_history.tail(history_ticks)
+    names = list(manager.app_index.names)
+    counts = manager.exceedance_count.counts[:len(names)].copy()
+    log_offset = 0
+    log_inode = None
+    if manager.columnar_log is None and os.path.exists(manager.metrics_file):
+        # Everything on disk right now belongs to ticks already captured, so
+        # replaying from here can never skip a later tick.
+        log_offset = os.path.getsize(manager.metrics_file)
+        log_inode = os.stat(manager.metrics_file).st_ino  # Tells whether the log was rotated since
+    arrays = {"counts": counts, "timestamps": timestamps, "values": values, "present": present}
+    windows = {}
+    for index, (name, window) in enumerate(manager.exceedance_windows.items()):
+        windows[name] = {"span": window.span, "buckets": window.buckets, "current": window.current, "array": index}
+        arrays[f"window_{index}"] = window.ring[:, :len(names)].copy()
+    meta = {
+        "version": CHECKPOINT_VERSION,
+        "app_names": names,
+        "timestamp": int(timestamps[-1]) if len(timestamps) else None,
+        "log_format": manager.file_format,
+        "log_offset": log_offset,
+        "log_inode": log_inode,
+        "windows": windows,
+    }
+    return meta, arrays
+
+def write_checkpoint(path, meta, arrays):
+    """Atomically replace the checkpoint file with the captured state."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as file:
+        np.savez(file, meta=np.frombuffer(json.dumps(meta).encode("utf-8"), dtype=np.uint8), **arrays)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, path)
+
+def save_checkpoint(manager, path=CHECKPOINT_PATH, history_ticks=CHECKPOINT_HISTORY_TICKS):
+    """Persist counters and recent history of manager to path."""
+    meta, arrays = capture_state(manager, history_ticks)
+    write_checkpoint(path, meta, arrays)
+
+def restore_checkpoint(manager, threshold, path=CHECKPOINT_PATH):
+    """Load a checkpoint into a fresh manager, then replay only the metrics log written after it.
+
+    Returns the number of log ticks replayed, or None if there was no checkpoint.
+    """
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        meta = json.loads(data["meta"].tobytes().decode("utf-8"))
+        counts = data["counts"]
+        timestamps, values, present = data["timestamps"], data["values"], data["present"]
+        window_rings = {name: data[f"window_{saved['array']}"] for name, saved in meta.get("windows", {}).items()}
+
+    columns = manager.app_index.columns(meta["app_names"])
+    manager.exceedance_count.load(columns, counts)
+    for name, window in manager.exceedance_windows.items():
+        saved = meta.get("windows", {}).get(name)
+        # A window whose length or bucket count changed since the checkpoint starts empty
+        if saved and saved["span"] == window.span and saved["buckets"] == window.buckets and saved["current"] is not None:
+            window.load(columns, window_rings[name], saved["current"])
+    for timestamp, row_values, row_present in zip(timestamps.tolist(), values, present):
+        manager.metrics_history.append_values(timestamp, columns[row_present], row_values[row_present])
+
+    since = meta["timestamp"]
+    replayed = 0
+    for timestamp, metrics in _log_tail(manager, meta):
+        if since is not None and timestamp <= since:
+            continue
+        tick_columns = manager.app_index.columns(metrics.keys())
+        tick_values = np.fromiter(metrics.values(), dtype=np.float64, count=len(metrics))
+        manager.metrics_history.append_values(timestamp, tick_columns, manager.metrics_history.storage_values(tick_values))
+        manager.process_values(metrics.keys(), tick_values, threshold, timestamp)
+        replayed += 1
+    return replayed
+
+def _log_tail(manager, meta):
+    """Yield (timestamp, metrics) ticks from the metrics log written after the checkpoint."""
+    if manager.columnar_log is not None:
+        since = meta["timestamp"]
+        yield from ColumnarLogReader(manager.columnar_log.directory).iter_ticks(start=None if since is None else since + 1)
+        return
+    since = meta["timestamp"]
+    exists = os.path.exists(manager.metrics_file)
+    offset = meta["log_offset"] if meta.get("log_format") == "json" else 0
+    if meta.get("log_inode") not in (None, os.stat(manager.metrics_file).st_ino if exists else None):
+        # Rotated by retention since the checkpoint: later ticks may be in chunks, filtered by timestamp
+        offset = 0
+        for rotated, path in json_chunk_paths(manager.metrics_file):
+            if since is None or rotated > since:
+                yield from read_json_ticks(path)
+    if not exists:
+        return
+    with open(manager.metrics_file, "rb") as file:
+        if offset > os.path.getsize(manager.metrics_file):
+            offset = 0  # The log was replaced since the checkpoint; filter by timestamp instead
+        if offset:
+            file.seek(offset - 1)
+            if file.read(1) != b"\n":
+                file.readline()  # The offset fell inside a record that the checkpoint already covers
+        for line in file:
+            try:
+                data = json.loads(line)
+            except ValueError:
+                continue  # Partially written last line
+            yield data["timestamp"], data["metrics"]
+
+class Checkpointer:
+    """Periodically capture manager state and write it off the generation thread."""
+
+    def __init__(self, manager, path=CHECKPOINT_PATH, interval=CHECKPOINT_INTERVAL,
+                 history_ticks=CHECKPOINT_HISTORY_TICKS):
+        self.manager = manager
+        self.path = path
+        self.interval = interval  # None to save only when requested
+        self.history_ticks = history_ticks
+        self._last_capture = None
+        self._thread = None
+        self._requested = threading.Event()
+
+    def request(self):
+        """Ask for a checkpoint at the next maybe_save, e.g. from a scheduler job on another thread."""
+        self._requested.set()
+
+    def maybe_save(self, now):
+        """Start a checkpoint if one was requested or interval seconds passed, and none is running."""
+        requested = self._requested.is_set()
+        if not requested and (self.interval is None or (
+                self._last_capture is not None and now - self._last_capture < self.interval)):
+            return False
+        if self._thread is not None and self._thread.is_alive():
+            return False
+        self._requested.clear()
+        self._last_capture = now
+        meta, arrays = capture_state(self.manager, self.history_ticks)
+        self._thread = threading.Thread(target=write_checkpoint, args=(self.path, meta, arrays),
+                                        name="checkpoint-writer", daemon=True)
+        self._thread.start()
+        return True
+
+    def save(self):
+        """Write a checkpoint synchronously, e.g. at shutdown."""
+        if self._thread is not None:
+            self._thread.join()
+        save_checkpoint(self.manager, self.path, self.history_ticks)
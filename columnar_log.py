@@ -0,0 +1,229 @@
+"""Append-only, segmented binary log of metric ticks.
+
+Each segment file starts with a header holding the app name dictionary and
+the value dtype, followed by fixed-width records of one int64 timestamp and
+one value per app in dictionary order. Apps that did not report in a tick
+hold a missing-value sentinel. A new segment is started when new apps
+appear or the current one reaches its tick limit, so existing segments
+never change once written and can be memory-mapped for range queries.
+
+Convert an existing JSON-lines log with:
+    python columnar_log.py convert data/metrics_log.txt data/metrics_columnar
+"""
+import os
+import re
+import sys
+import json
+import struct
+import argparse
+import numpy as np
+from config import METRICS_COLUMNAR_DIR, COLUMNAR_SEGMENT_MAX_TICKS, HISTORY_VALUE_DTYPE
+
+MAGIC = b"MCOLSEG1"
+HEADER_LENGTH = struct.Struct("<I")
+SEGMENT_PATTERN = re.compile(r"^segment-(\d{8})\.mcol$")
+
+def missing_value(dtype):
+    """Return the sentinel stored for apps that did not report in a tick."""
+    dtype = np.dtype(dtype)
+    if dtype.kind == "f":
+        return np.nan
+    return np.iinfo(dtype).min
+
+def record_dtype(num_apps, dtype):
+    return np.dtype([("timestamp", "<i8"), ("values", np.dtype(dtype).newbyteorder("<"), (num_apps,))])
+
+def encode_header(app_names, dtype):
+    """Return the segment header bytes, padded so records start 8-byte aligned."""
+    header = json.dumps({"version": 1, "dtype": np.dtype(dtype).newbyteorder("<").str, "apps": list(app_names)})
+    payload = MAGIC + HEADER_LENGTH.pack(len(header)) + header.encode("utf-8")
+    return payload + b"\0" * (-len(payload) % 8)
+
+def segment_paths(directory):
+    """Return the segment files in directory, oldest first."""
+    if not os.path.isdir(directory):
+        return []
+    names = sorted(name for name in os.listdir(directory) if SEGMENT_PATTERN.match(name))
+    return [os.path.join(directory, name) for name in names]
+
+class ColumnarLogWriter:
+    """Append ticks to segment files through a file writer.
+
+    Values are passed as app columns of an AppIndex plus their values; the
+    segment dictionary is the index's name table when the segment starts.
+    """
+
+    def __init__(self, directory=METRICS_COLUMNAR_DIR, writer=None, dtype=HISTORY_VALUE_DTYPE,
+                 max_ticks=COLUMNAR_SEGMENT_MAX_TICKS):
+        self.directory = directory
+        self.writer = writer
+        self.dtype = np.dtype(dtype)
+        self.max_ticks = max_ticks
+        self.path = None  # Segment currently being appended to
+        self._segment_apps = 0
+        self._segment_ticks = 0
+        existing = segment_paths(directory)
+        self._sequence = int(SEGMENT_PATTERN.match(os.path.basename(existing[-1])).group(1)) if existing else 0
+        self._record = None
+
+    def append(self, timestamp, app_names, columns, values):
+        """Append one tick; app_names is the full name table the columns refer to."""
+        width = len(app_names)
+        if self.path is None or width > self._segment_apps or self._segment_ticks >= self.max_ticks:
+            self._start_segment(app_names)
+
+        record = self._record
+        record["timestamp"] = timestamp
+        row = record["values"][0]
+        if len(columns) < self._segment_apps:
+            row.fill(missing_value(self.dtype))
+        row[columns] = values
+        self._write(self.path, record.tobytes())
+        self._segment_ticks += 1
+
+    def remove_segments(self):
+        """Delete every segment in the directory, as DELETE_PREVIOUS_METRICS_FILE does for JSON."""
+        for path in segment_paths(self.directory):
+            if self.writer is not None:
+                self.writer.release(path)
+            os.remove(path)
+        self.path = None
+        self._sequence = 0
+
+    def _start_segment(self, app_names):
+        self._sequence += 1
+        self.path = os.path.join(self.directory, f"segment-{self._sequence:08d}.mcol")
+        self._segment_apps = len(app_names)
+        self._segment_ticks = 0
+        self._record = np.zeros(1, dtype=record_dtype(self._segment_apps, self.dtype))
+        self._write(self.path, encode_header(app_names, self.dtype))
+
+    def _write(self, path, data):
+        if self.writer is not None:
+            self.writer.write(path, data)
+            return
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "ab") as file:
+            file.write(data)
+
+class Segment:
+    """A memory-mapped, read-only view of one segment file."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as file:
+            prefix = file.read(len(MAGIC) + HEADER_LENGTH.size)
+            if len(prefix) < len(MAGIC) + HEADER_LENGTH.size or not prefix.startswith(MAGIC):
+                raise ValueError(f"Not a metrics segment: {path}")
+            (length,) = HEADER_LENGTH.unpack(prefix[len(MAGIC):])
+            header = json.loads(file.read(length).decode("utf-8"))
+        self.app_names = header["apps"]
+        self.dtype = np.dtype(header["dtype"])
+        self.data_offset = len(prefix) + length + (-(len(prefix) + length) % 8)
+        self.record_dtype = record_dtype(len(self.app_names), self.dtype)
+        # A trailing partial record (writer still buffering or a crash) is ignored
+        count = max(os.path.getsize(path) - self.data_offset, 0) // self.record_dtype.itemsize
+        if count:
+            self.records = np.memmap(path, dtype=self.record_dtype, mode="r", offset=self.data_offset, shape=(count,))
+        else:
+            self.records = np.zeros(0, dtype=self.record_dtype)
+        self.timestamps = self.records["timestamp"]
+        self.values = self.records["values"]
+
+    def __len__(self):
+        return len(self.records)
+
+    def range(self, start=None, end=None):
+        """Return (timestamps, values) views for start <= timestamp <= end, without copying."""
+        low = 0 if start is None else int(np.searchsorted(self.timestamps, start, side="left"))
+        high = len(self) if end is None else int(np.searchsorted(self.timestamps, end, side="right"))
+        return self.timestamps[low:high], self.values[low:high]
+
+class ColumnarLogReader:
+    """Range queries over every segment in a directory."""
+
+    def __init__(self, directory=METRICS_COLUMNAR_DIR):
+        self.directory = directory
+        self.segments = []
+        for path in segment_paths(directory):
+            try:
+                segment = Segment(path)
+            except (ValueError, OSError, UnicodeDecodeError, json.JSONDecodeError):
+                continue  # Header not fully written yet
+            if len(segment):
+                self.segments.append(segment)
+
+    def range(self, start=None, end=None):
+        """Yield (app_names, timestamps, values) views for each segment overlapping the range."""
+        for segment in self.segments:
+            if start is not None and segment.timestamps[-1] < start:
+                continue
+            if end is not None and segment.timestamps[0] > end:
+                break
+            timestamps, values = segment.range(start, end)
+            if len(timestamps):
+                yield segment.app_names, timestamps, values
+
+    def app_series(self, app_name, start=None, end=None):
+        """Return (timestamps, values) arrays for one app over a time range."""
+        timestamps, values = [], []
+        for app_names, segment_timestamps, segment_values in self.range(start, end):
+            if app_name not in app_names:
+                continue
+            column = segment_values[:, app_names.index(app_name)]
+            present = column != missing_value(column.dtype) if column.dtype.kind != "f" else ~np.isnan(column)
+            timestamps.append(segment_timestamps[present])
+            values.append(column[present])
+        if not timestamps:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        return np.concatenate(timestamps), np.concatenate(values)
+
+    def iter_ticks(self, start=None, end=None):
+        """Yield (timestamp, {app: value}) for every stored tick, oldest first."""
+        for app_names, timestamps, values in self.range(start, end):
+            sentinel = missing_value(values.dtype)
+            for timestamp, row in zip(timestamps.tolist(), values):
+                if values.dtype.kind == "f":
+                    present = ~np.isnan(row)
+                else:
+                    present = row != sentinel
+                if present.all():
+                    yield timestamp, dict(zip(app_names, row.tolist()))
+                else:
+                    yield timestamp, {app_names[c]: row[c].item() for c in np.flatnonzero(present)}
+
+def convert_json_log(json_path, directory, dtype=HISTORY_VALUE_DTYPE, max_ticks=COLUMNAR_SEGMENT_MAX_TICKS):
+    """Convert a JSON-lines metrics log into columnar segments, returning the number of ticks."""
+    from metrics_history import AppIndex, storage_values
+
+    app_index = AppIndex()
+    log_writer = ColumnarLogWriter(directory, dtype=dtype, max_ticks=max_ticks)
+    ticks = 0
+    with open(json_path, "r") as file:
+        for line in file:
+            if not line.strip():
+                continue
+            data = json.loads(line)
+            metrics = data["metrics"]
+            columns = app_index.columns(metrics.keys())
+            values = np.fromiter(metrics.values(), dtype=np.float64, count=len(metrics))
+            values = storage_values(values, log_writer.dtype)  # Rounded like the live history's values
+            log_writer.append(data["timestamp"], app_index.names, columns, values)
+            ticks += 1
+    return ticks
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Columnar metrics log tools.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    convert = subparsers.add_parser("convert", help="Convert a JSON-lines metrics log to columnar segments")
+    convert.add_argument("json_path")
+    convert.add_argument("directory", nargs="?", default=METRICS_COLUMNAR_DIR)
+    convert.add_argument("--max-ticks", type=int, default=COLUMNAR_SEGMENT_MAX_TICKS)
+    args = parser.parse_args(argv)
+
+    ticks = convert_json_log(args.json_path, args.directory, max_ticks=args.max_ticks)
+    print(f"Converted {ticks} ticks from {args.json_path} into {args.directory}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
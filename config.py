@@ -5,18 +5,82 @@ NUM_APPS = 30
 
 # Threshold value for metrics
 THRESHOLD = 10000
+METRIC_THRESHOLDS = {}  # Thresholds of other ingested metrics by name, e.g. {"http_errors_total": 50}; others use THRESHOLD
+
+# Per-app adaptive thresholds: "static" uses THRESHOLD, "sigma" STATS_SIGMAS deviations above each app's EWMA
+# baseline, "quantile" each app's own STATS_QUANTILE; apps with fewer than STATS_WARMUP_TICKS values use THRESHOLD
+THRESHOLD_MODE = "static"
+STATS_ENABLED = False  # Set to True to keep per-app statistics (served at /api/v1/stats) even with static thresholds
+STATS_EWMA_ALPHA = 0.05  # Weight of the newest value in the EWMA baseline and variance
+STATS_SIGMAS = 3  # Standard deviations above the baseline for the "sigma" mode
+STATS_QUANTILE = 0.99  # Quantile of an app's own values for the "quantile" mode
+STATS_WARMUP_TICKS = 30  # Values an app needs before its adaptive threshold applies
+STATS_HISTOGRAM_BINS = 64  # Logarithmic bins per app for quantiles (2 bytes each); 0 disables quantiles
+STATS_HISTOGRAM_RANGE = (1, 1e7)  # Values tracked by the bins; values outside fall into the first or last bin
 
 # Interval (in seconds) for generating and storing metrics
 METRICS_INTERVAL = 30
 
+# Tick scheduling: jobs run on fixed wall-clock multiples of their interval
+DISPLAY_INTERVAL = None  # Interval (in seconds) between top-X displays, None to display after every generated tick
+SCHEDULER_OVERRUN_POLICY = "skip"  # When a run ends after the next was due: "skip" the missed ticks or "catch_up"
+SCHEDULER_MAX_CATCH_UP = 5  # Maximum missed ticks run back to back with "catch_up"; older ones are skipped
+
 # Number of top apps to display for threshold exceedance
 TOP_X_APPS = 5
 
+# Worker processes that generate and count slices of the apps in parallel (0 runs every tick on one thread)
+SHARD_PROCESSES = 0
+
+# Sliding windows for top exceedance rankings, as name -> length in seconds (selected with /exceeding?window=5m)
+EXCEEDANCE_WINDOWS = {"5m": 300, "1h": 3600, "24h": 86400}
+EXCEEDANCE_WINDOW_BUCKETS = 60  # Number of time buckets per window; more buckets give finer expiry
+
+# Top-X counting: "exact" keeps a count per app, "approximate" keeps SKETCH_CAPACITY candidates in fixed memory
+# (the counters only: the app index and the history still grow with the number of apps)
+TOP_X_MODE = "exact"
+SKETCH_CAPACITY = 1000  # Apps monitored by the approximate counters; counts above total / capacity are never missed
+SKETCH_WIDTH = 1 << 14  # Count-Min sketch columns (a power of two) bounding the count of newly monitored apps
+SKETCH_DEPTH = 4  # Count-Min sketch rows; more rows make a large overestimate less likely
+
 # File storage configuration
 WRITE_METRICS_TO_FILE = False  # Set to False to disable writing to a file
 METRICS_FILE_PATH = "data/metrics_log.txt"  # Custom file path
+METRICS_FILE_FORMAT = "json"  # "json" for one JSON line per tick, "columnar" for compact binary segments
+METRICS_COLUMNAR_DIR = "data/metrics_columnar"  # Directory of the columnar segment files
+COLUMNAR_SEGMENT_MAX_TICKS = 2880  # Ticks per columnar segment before a new one is started
 DELETE_PREVIOUS_METRICS_FILE = True  # Set to False to keep the previous file
 
+# Background file writer used for the metrics and exceedings logs
+FILE_WRITER_BACKGROUND = True  # Write log files from a background thread instead of the generation thread
+FILE_WRITER_DURABILITY = "flush"  # "none" (OS decides), "flush" (flush each batch) or "fsync" (fsync each batch)
+FILE_WRITER_BATCH_SIZE = 64  # Maximum number of records written per batch
+FILE_WRITER_FLUSH_INTERVAL = 1.0  # Maximum time (in seconds) a record waits before its batch is written
+FILE_WRITER_QUEUE_SIZE = 1024  # Maximum number of queued records before writers block
+
+# In-memory metrics history retention
+HISTORY_MAX_TICKS = 2880  # Maximum number of ticks kept in memory (24h at a 30s interval)
+HISTORY_MAX_AGE = None  # Maximum age (in seconds) of a kept tick, None to keep RETENTION_RAW_SECONDS
+HISTORY_VALUE_DTYPE = "int64"  # NumPy dtype used to store metric values; fractional values are rounded to fit an integer dtype
+HISTORY_ROLLUPS = {"1h": (3600, 720)}  # Downsampled history as name -> (bucket seconds, buckets kept): 30 days of hours
+QUERY_DEFAULT_RANGE = 3600  # Time range (in seconds) of a /api/v1/query_range request without a start
+QUERY_MAX_POINTS = 11000  # Maximum number of steps one /api/v1/query_range request may span
+
+# Tiered retention: raw ticks for a while, then coarser rollups kept longer
+RETENTION_ENABLED = True  # Compact and expire the metrics log files in the background
+RETENTION_RAW_SECONDS = 86400  # Raw ticks kept in memory and on disk; older ones are compacted into RETENTION_TIERS
+RETENTION_CHUNK_SECONDS = 3600  # Age of the JSON metrics log at which it is rotated into a chunk for later compaction
+RETENTION_TIERS = {"1m": (60, 7 * 86400), "1h": (3600, 365 * 86400)}  # Rollup files as name -> (bucket seconds, seconds kept)
+RETENTION_DIR = "data/metrics_rollups"  # Directory of the rollup files, one subdirectory per tier
+COMPACTION_INTERVAL = 300  # Interval (in seconds) between compaction runs
+COMPACTION_MAX_BYTES = 64 << 20  # Raw log bytes compacted per run at most; the oldest chunk is always compacted
+
+# Checkpoints for a warm restart
+CHECKPOINT_ENABLED = False  # Set to True to persist counters and recent history and restore them at startup
+CHECKPOINT_PATH = "data/checkpoint.npz"  # Path of the checkpoint file
+CHECKPOINT_INTERVAL = 300  # Interval (in seconds) between checkpoints
+CHECKPOINT_HISTORY_TICKS = 120  # Number of recent ticks stored in each checkpoint
+
 # Exceedings log configuration
 WRITE_EXCEEDINGS_TO_FILE = False  # Set to False to disable writing to a file
 EXCEEDINGS_FILE_PATH = "data/exceedings_log.txt"  # Path to the exceedings log file
@@ -29,17 +93,63 @@ DISPLAY_MODE = "both"  # Change to "console" or "page" as needed
 # Configuration for random metric generation
 RANDOM_METRIC_MIN = 1  # Minimum value for random metrics
 RANDOM_METRIC_MAX = 12000          # Maximum value for random metrics
+METRIC_DISTRIBUTION = "uniform"  # Shape of generated values: "uniform", "normal", "bursty" or "seasonal"
+RANDOM_SEED = None  # Seed for reproducible metrics, None for a random seed
+BURST_PROBABILITY = 0.05  # Chance per app and tick of a burst with the "bursty" distribution
+SEASONAL_PERIOD_TICKS = 120  # Length of one cycle, in ticks, with the "seasonal" distribution
+
+# Ingestion: where each tick's metrics come from
+INGESTION_MODE = "generate"  # "generate" for random metrics, "scrape" to fetch them from SCRAPE_TARGETS, "push" to accept them at /api/v1/write
+SCRAPE_TARGETS = []  # Exporter URLs serving Prometheus text exposition, e.g. ["http://10.0.0.5:9100/metrics"]
+SCRAPE_TIMEOUT = 5  # Maximum time (in seconds) one target may take before it is marked down for the tick
+SCRAPE_CONCURRENCY = 64  # Maximum number of targets fetched at once
+SCRAPE_METRIC_NAME = "bigquery_written_bytes"  # Metric read from the scraped targets; other metrics are ignored
+SCRAPE_APP_LABEL = "app_name"  # Label whose value identifies the app of a scraped or remote-written sample
+SERIES_ALL_METRICS = False  # Also keep every other metric of scraped targets and remote-write pushes, with all labels
+PUSH_QUEUE_SIZE = 64  # Maximum number of pushed batches waiting for the next tick; pushes get 429 when it is full
+PUSH_MAX_BODY_BYTES = 16 << 20  # Largest accepted push request body
+PUSH_MAX_DECODED_BYTES = 64 << 20  # Largest accepted remote-write body after snappy decompression
 
 # Metric name to use in Prometheus format
 METRIC_NAME = "bigquery_written_bytes"  # Change this to your desired metric name
+METRIC_HELP = "Bytes written to BigQuery per app."  # HELP text used in the OpenMetrics format
+
+# Pre-rendered /metrics exposition
+EXPOSITION_GZIP = True  # Also keep a gzip-compressed copy for clients sending Accept-Encoding: gzip
+EXPOSITION_GZIP_LEVEL = 6  # Compression level (1-9) used once per tick for the gzip copy
+EXPOSITION_OPENMETRICS = True  # Also pre-render the OpenMetrics format for clients that negotiate it
+METRICS_STREAMING = False  # Set to True to stream /metrics in chunks instead of caching the whole body
+METRICS_STREAM_CHUNK_LINES = 5000  # Number of samples per streamed chunk
+
+# Live /exceeding updates pushed to dashboards as Server-Sent Events
+LIVE_QUEUE_SIZE = 16  # Events buffered per subscriber; a subscriber further behind is disconnected and resyncs
+LIVE_KEEPALIVE = 15  # Seconds without an update before a keep-alive comment is sent
+LIVE_POLL_INTERVAL = 0.5  # Seconds between checks for a new snapshot in production workers
 
 # Flask server configuration
 FLASK_HOST = "0.0.0.0"  # Host to run the Flask app (e.g., "0.0.0.0" for all interfaces)
 FLASK_PORT = 5000       # Port to run the Flask app
+SERVER_MODE = "development"  # "development" for Flask's built-in server, "production" for gunicorn workers
+SERVER_WORKERS = 4  # Number of worker processes in production mode
+SERVER_THREADS = 8  # Request threads per worker process in production mode
+SERVER_KEEPALIVE = 5  # Seconds an idle keep-alive connection stays open in production mode
+SHARED_SNAPSHOT_BYTES = 1 << 20  # Initial size of each shared-memory snapshot slot; grows when a tick needs more
+
+# Self-instrumentation served at /internal/metrics
+INSTRUMENTATION_ENABLED = True  # Set to False to remove every internal timer and the /internal/metrics endpoint
+INSTRUMENTATION_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)  # Histogram bucket bounds (in seconds)
 
 # Logging Configuration
 LOG_TO_CONSOLE = True  # Print logs to the console
 LOG_TO_FILE = True     # Write logs to a file
 LOG_FILE_NAME = "log/app.log"  # Name of the log file
 LOG_LEVEL = "INFO"     # Log level (DEBUG, INFO, WARNING, ERROR, CRITICAL)
-LOG_TO_CONSOLE_ONLY_EXCEEDINGS = True  # Set to True to only log exceedances to the console
\ No newline at end of file
+LOG_TO_CONSOLE_ONLY_EXCEEDINGS = True  # Set to True to only log exceedances to the console
+LOG_FORMAT = "text"    # "text" for plain lines or "json" for one JSON object per record
+LOG_ROTATION = "size"  # Rotate the log file by "size", by "time", or None to never rotate it
+LOG_MAX_BYTES = 10 * 1024 * 1024  # Size at which the log file is rotated (with LOG_ROTATION = "size")
+LOG_ROTATE_WHEN = "midnight"  # When the log file is rotated (with LOG_ROTATION = "time"), as in TimedRotatingFileHandler
+LOG_BACKUP_COUNT = 5   # Rotated log files kept
+LOG_QUEUE_SIZE = 10000  # Records waiting to be written; records logged while it is full are dropped
+LOG_RATE_LIMIT = 10    # Records per message type written every LOG_RATE_LIMIT_INTERVAL (warnings and errors are never limited); 0 to disable
+LOG_RATE_LIMIT_INTERVAL = 1  # Length of each rate limit interval (in seconds)
@@ -0,0 +1,186 @@
+import numpy as np
+from metrics_history import AppIndex
+
+def top_k(counts, k):
+    """Return the columns of the k largest non-zero counts, highest first.
+
+    Uses a partial selection instead of a full sort; ties are broken by column
+    so apps that were registered first keep ranking first.
+    """
+    if k <= 0:
+        return np.zeros(0, dtype=np.intp)
+    candidates = np.flatnonzero(counts)
+    values = counts[candidates]
+    if k < len(candidates):
+        kth_largest = np.partition(values, len(values) - k)[len(values) - k]
+        keep = values >= kth_largest  # Keep every tie at the boundary so the tie-break stays stable
+        candidates = candidates[keep]
+        values = values[keep]
+    order = np.lexsort((candidates, -values))[:k]
+    return candidates[order]
+
+def merge_top_k(columns, counts, k):
+    """Merge partial top-k results from disjoint column ranges into the global top k.
+
+    Each part must hold its own top k ordered like top_k, which guarantees it
+    contains every global winner from its range. Returns (columns, counts).
+    """
+    keep = counts > 0
+    columns, counts = columns[keep], counts[keep]
+    order = np.lexsort((columns, -counts))[:k]
+    return columns[order], counts[order]
+
+class ExceedanceCounter:
+    """Per-app threshold exceedance counts kept in one contiguous array.
+
+    Behaves like the ``defaultdict(int)`` it replaces: unknown apps read as 0,
+    and ``items()``/``len()`` only cover apps that exceeded at least once.
+    """
+
+    def __init__(self, app_index=None, dtype=np.int64, counts=None):
+        self.app_index = app_index if app_index is not None else AppIndex()
+        # Column position -> exceedance count; counts may be an existing array such as a shared memory view
+        self.counts = counts if counts is not None else np.zeros(0, dtype=dtype)
+
+    def __getitem__(self, app_name):
+        position = self.app_index.positions.get(app_name)
+        if position is None or position >= len(self.counts):
+            return 0
+        return int(self.counts[position])
+
+    def __setitem__(self, app_name, count):
+        position = self.app_index.intern(app_name)
+        self._ensure_capacity(len(self.app_index))
+        self.counts[position] = count
+
+    def __contains__(self, app_name):
+        return self[app_name] != 0
+
+    def __len__(self):
+        return int(np.count_nonzero(self.counts))
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def get(self, app_name, default=None):
+        count = self[app_name]
+        return count if count else default
+
+    def keys(self):
+        return [name for name, _ in self.items()]
+
+    def items(self):
+        names = self.app_index.names
+        columns = np.flatnonzero(self.counts)
+        return list(zip([names[c] for c in columns], self.counts[columns].tolist()))
+
+    def update(self, counts):
+        """Set counts from a mapping of app name to count."""
+        for app_name, count in counts.items():
+            self[app_name] = count
+
+    def clear(self):
+        self.counts[:] = 0
+
+    def load(self, columns, counts):
+        """Set the counts of already resolved app columns, e.g. from a checkpoint."""
+        self._ensure_capacity(len(self.app_index))
+        self.counts[columns] = counts
+
+    def record(self, columns, values, threshold):
+        """Count every value above threshold in one vectorized pass."""
+        self.add(columns, values > threshold)
+
+    def add(self, columns, exceeded):
+        """Add a boolean exceedance mask for a snapshot resolved to app columns."""
+        self._ensure_capacity(len(self.app_index))
+        # Columns are unique within a snapshot, so a fancy-indexed add is safe here.
+        self.counts[columns] += exceeded
+
+    def top(self, top_x):
+        """Return the top X (app_name, count) pairs, highest count first."""
+        names = self.app_index.names
+        columns = top_k(self.counts, top_x)
+        return list(zip([names[c] for c in columns], self.counts[columns].tolist()))
+
+    def _ensure_capacity(self, width):
+        if width > len(self.counts):
+            counts = np.zeros(max(width, len(self.counts) * 2, 16), dtype=self.counts.dtype)
+            counts[:len(self.counts)] = self.counts
+            self.counts = counts
+
+class ExceedanceWindow:
+    """Exceedance counts over a sliding time window, kept as a ring of time buckets.
+
+    Each bucket holds per-app counts for span / buckets seconds. Moving to a
+    new bucket subtracts the expired bucket from the running totals and clears
+    it, so a tick costs the same whatever the window length, and the history
+    is never rescanned.
+    """
+
+    def __init__(self, span, buckets, app_index=None, counts=None):
+        self.span = span
+        self.buckets = buckets
+        self.bucket_width = span / buckets
+        self.app_index = app_index if app_index is not None else AppIndex()
+        # Running total over the live buckets; counts may be an existing array such as a shared memory view
+        self.counts = counts if counts is not None else np.zeros(0, dtype=np.int64)
+        self.ring = np.zeros((buckets, len(self.counts)), dtype=np.uint32)  # Bucket slot -> per-app counts, too wide to wrap
+        self.current = None  # Absolute number of the newest bucket
+
+    def __getitem__(self, app_name):
+        position = self.app_index.positions.get(app_name)
+        if position is None or position >= len(self.counts):
+            return 0
+        return int(self.counts[position])
+
+    def add(self, timestamp, columns, exceeded):
+        """Count a snapshot's exceedance mask in the bucket covering timestamp."""
+        self._ensure_capacity(len(self.app_index))
+        self.advance(timestamp)
+        self.ring[self.current % self.buckets, columns] += exceeded
+        self.counts[columns] += exceeded
+
+    def advance(self, timestamp):
+        """Expire every bucket that fell out of the window by timestamp."""
+        bucket = int(timestamp // self.bucket_width)
+        if self.current is None:
+            self.current = bucket
+            return
+        if bucket <= self.current:
+            return  # Late or same-bucket ticks count towards the newest bucket
+        for expired in range(self.current + 1, self.current + 1 + min(bucket - self.current, self.buckets)):
+            row = self.ring[expired % self.buckets]
+            self.counts[:len(row)] -= row
+            row[:] = 0
+        self.current = bucket
+
+    def top(self, top_x, now=None):
+        """Return the top X (app_name, count) pairs inside the window ending at now."""
+        if now is not None:
+            self.advance(now)
+        names = self.app_index.names
+        columns = top_k(self.counts, top_x)
+        return list(zip([names[c] for c in columns], self.counts[columns].tolist()))
+
+    def load(self, columns, ring, current):
+        """Restore the bucket ring for already resolved app columns."""
+        self._ensure_capacity(len(self.app_index))
+        self.ring[:, columns] = ring
+        self.counts[columns] = ring.sum(axis=0, dtype=np.int64)
+        self.current = current
+
+    def clear(self):
+        self.ring[:] = 0
+        self.counts[:] = 0
+        self.current = None
+
+    def _ensure_capacity(self, width):
+        if width > len(self.counts):
+            capacity = max(width, len(self.counts) * 2, 16)
+            ring = np.zeros((self.buckets, capacity), dtype=self.ring.dtype)
+            ring[:, :self.ring.shape[1]] = self.ring
+            counts = np.zeros(capacity, dtype=self.counts.dtype)
+            counts[:len(self.counts)] = self.counts
+            self.ring = ring
+            self.counts = counts
@@ -0,0 +1,119 @@
+import gzip
+from config import (
+    METRIC_NAME, METRIC_HELP, EXPOSITION_GZIP, EXPOSITION_GZIP_LEVEL,
+    EXPOSITION_OPENMETRICS, METRICS_STREAM_CHUNK_LINES,
+)
+from series_store import _escape
+
+PROMETHEUS_MIMETYPE = "text/plain"
+OPENMETRICS_MIMETYPE = "application/openmetrics-text"
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+def negotiate_format(accept_mimetypes):
+    """Return "openmetrics" when the client prefers it over the text format, else "prometheus"."""
+    openmetrics_quality = text_quality = 0
+    for value, quality in accept_mimetypes:
+        mimetype = value.split(";", 1)[0].strip().lower()  # Prometheus sends version parameters
+        if mimetype == OPENMETRICS_MIMETYPE:
+            openmetrics_quality = max(openmetrics_quality, quality)
+        elif mimetype in (PROMETHEUS_MIMETYPE, "text/*", "*/*"):
+            text_quality = max(text_quality, quality)
+    return "openmetrics" if openmetrics_quality and openmetrics_quality >= text_quality else "prometheus"
+
+def _label_values(app_names):
+    """Return app_names escaped for use as label values; scraped or pushed names may hold quotes and newlines."""
+    joined = "".join(app_names)  # One C-level scan; names almost never need escaping
+    if '"' in joined or "\\" in joined or "\n" in joined:
+        return [_escape(app_name) for app_name in app_names]
+    return app_names
+
+def render_prometheus(app_names, values, metric_name=METRIC_NAME):
+    """Render one metric sample per app in the Prometheus text format."""
+    prefix = f'{metric_name}{{app_name="'
+    app_names = _label_values(app_names)
+    return "\n".join([f'{prefix}{app_name}"}} {value}' for app_name, value in zip(app_names, values)])
+
+def iter_exposition(app_names, values, metric_name=METRIC_NAME, timestamp=None, openmetrics=False,
+                    chunk_lines=METRICS_STREAM_CHUNK_LINES):
+    """Yield the exposition in chunks of at most chunk_lines samples.
+
+    Only one chunk of lines exists at a time, so memory per response stays
+    bounded regardless of the number of apps. OpenMetrics output carries the
+    HELP/TYPE metadata, a timestamp on every sample and the closing # EOF.
+    """
+    count = min(len(app_names), len(values))
+    prefix = f'{metric_name}{{app_name="'
+    suffix = f" {timestamp}\n" if openmetrics and timestamp is not None else "\n"
+    if openmetrics:
+        yield f"# HELP {metric_name} {METRIC_HELP}\n# TYPE {metric_name} gauge\n"
+    for start in range(0, count, chunk_lines):
+        end = min(start + chunk_lines, count)
+        chunk_values = values[start:end]
+        if hasattr(chunk_values, "tolist"):
+            chunk_values = chunk_values.tolist()
+        yield "".join([f'{prefix}{app_name}"}} {value}{suffix}'
+                       for app_name, value in zip(_label_values(app_names[start:end]), chunk_values)])
+    if openmetrics:
+        yield "# EOF\n"
+
+class RenderedExposition:
+    """Immutable, pre-encoded exposition bodies for one generation tick."""
+
+    __slots__ = ("body", "gzip_body", "openmetrics_body", "openmetrics_gzip_body", "etag", "last_modified", "timestamp")
+
+    def __init__(self, text, timestamp, sequence, openmetrics_text=None, compress=EXPOSITION_GZIP):
+        encode = self._compress if compress else lambda body: None
+        self.body = text.encode("utf-8")
+        self.gzip_body = encode(self.body)
+        self.openmetrics_body = openmetrics_text.encode("utf-8") if openmetrics_text is not None else None
+        self.openmetrics_gzip_body = encode(self.openmetrics_body) if self.openmetrics_body is not None else None
+        self.etag = f"{timestamp:x}-{sequence:x}"
+        from email.utils import formatdate  # Loaded on first use, not by every importer of this module
+        self.last_modified = formatdate(timestamp, usegmt=True)
+        self.timestamp = timestamp
+
+    def __setattr__(self, name, value):
+        if hasattr(self, name):
+            raise AttributeError(f"{type(self).__name__} is immutable")
+        object.__setattr__(self, name, value)
+
+    @staticmethod
+    def _compress(body):
+        return gzip.compress(body, compresslevel=EXPOSITION_GZIP_LEVEL, mtime=0)
+
+    def select(self, exposition_format="prometheus", use_gzip=False):
+        """Return (body, etag, is_gzipped) for a representation, or None if it was not rendered."""
+        if exposition_format == "openmetrics":
+            body, gzip_body, etag = self.openmetrics_body, self.openmetrics_gzip_body, f"{self.etag}-om"
+        else:
+            body, gzip_body, etag = self.body, self.gzip_body, self.etag
+        if body is None:
+            return None
+        if use_gzip and gzip_body is not None:
+            return gzip_body, f"{etag}-gz", True  # Each encoding is a distinct representation
+        return body, etag, False
+
+class ExpositionCache:
+    """Holds the exposition rendered for the latest tick so scrapes only copy bytes."""
+
+    def __init__(self, metric_name=METRIC_NAME, openmetrics=EXPOSITION_OPENMETRICS):
+        self.metric_name = metric_name
+        self.openmetrics = openmetrics
+        self.current = None  # Swapped as a whole, never mutated in place
+        self._sequence = 0
+
+    def update(self, timestamp, app_names, values):
+        """Render and cache the exposition for a tick, returning it."""
+        if hasattr(values, "tolist"):
+            values = values.tolist()
+        self._sequence += 1
+        text = render_prometheus(app_names, values, self.metric_name)
+        openmetrics_text = None
+        if self.openmetrics:
+            openmetrics_text = "".join(iter_exposition(app_names, values, self.metric_name, timestamp,
+                                                       openmetrics=True, chunk_lines=max(len(values), 1)))
+        self.current = RenderedExposition(text, timestamp, self._sequence, openmetrics_text)
+        return self.current
+
+    def clear(self):
+        self.current = None
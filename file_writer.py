@@ -0,0 +1,233 @@
+import os
+import json
+import time
+import queue
+import logging
+import threading
+from config import (
+    FILE_WRITER_BACKGROUND, FILE_WRITER_DURABILITY, FILE_WRITER_BATCH_SIZE,
+    FILE_WRITER_FLUSH_INTERVAL, FILE_WRITER_QUEUE_SIZE, INSTRUMENTATION_ENABLED,
+)
+from instrumentation import FILE_WRITE_SECONDS
+
+logger = logging.getLogger("app.file_writer")
+
+DURABILITY_LEVELS = ("none", "flush", "fsync")
+
+class _Marker:
+    """Queue item asking the writer thread to do something and signal when done."""
+
+    def __init__(self, action, path=None):
+        self.action = action  # "flush", "release" or "stop"
+        self.path = path
+        self.done = threading.Event()
+
+class BackgroundWriter:
+    """Append records to files from one background thread.
+
+    File handles stay open between ticks, records are batched per file, and
+    each batch is made durable according to the durability level:
+    "none" leaves data in the file buffer, "flush" hands it to the OS and
+    "fsync" also forces it to disk. With background=False records are written
+    on the calling thread with the same handle reuse and durability.
+    """
+
+    def __init__(self, background=FILE_WRITER_BACKGROUND, durability=FILE_WRITER_DURABILITY,
+                 batch_size=FILE_WRITER_BATCH_SIZE, flush_interval=FILE_WRITER_FLUSH_INTERVAL,
+                 queue_size=FILE_WRITER_QUEUE_SIZE):
+        if durability not in DURABILITY_LEVELS:
+            raise ValueError(f"Unknown durability level: {durability}")
+        self.background = background
+        self.durability = durability
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(queue_size)  # Bounded, so a stalled disk pushes back on producers
+        self._files = {}  # Path -> open file handle
+        self._lock = threading.Lock()  # Serializes file access between the thread and sync callers
+        self._thread = None
+        self.records_written = 0
+        self.batches_written = 0
+        self.write_errors = 0  # Batches or markers that failed on the writer thread; the thread keeps running
+        self.last_write_latency = 0.0
+        self.max_write_latency = 0.0
+        self.total_write_latency = 0.0
+
+    def write(self, path, data):
+        """Append a str or bytes record to path."""
+        self._submit(path, data)
+
+    def write_json(self, path, record):
+        """Append record as one JSON line; serialization happens on the writer thread.
+
+        The record must not be mutated after it is handed over.
+        """
+        self._submit(path, record)
+
+    def flush(self, timeout=None):
+        """Block until everything queued so far has been written and made durable."""
+        return self._control("flush", timeout=timeout)
+
+    def release(self, path, timeout=None):
+        """Write pending records and close the handle for path, e.g. before it is removed."""
+        return self._control("release", path, timeout)
+
+    def close(self, timeout=None):
+        """Flush every queued record, stop the thread and close all handles."""
+        if self._thread is not None and self._thread.is_alive():
+            marker = _Marker("stop")
+            self._queue.put(marker)
+            marker.done.wait(timeout)
+            self._thread.join(timeout)
+        self._thread = None
+        with self._lock:
+            self._close_files()
+
+    def stats(self):
+        """Return queue depth and write latency figures for monitoring."""
+        return {
+            "queue_depth": self._queue.qsize(),
+            "records_written": self.records_written,
+            "batches_written": self.batches_written,
+            "write_errors": self.write_errors,
+            "last_write_latency": self.last_write_latency,
+            "max_write_latency": self.max_write_latency,
+            "avg_write_latency": self.total_write_latency / self.batches_written if self.batches_written else 0.0,
+        }
+
+    def _submit(self, path, data):
+        if not self.background:
+            with self._lock:
+                self._write_batch([(path, data)])
+            return
+        self._ensure_thread()
+        self._queue.put((path, data))
+
+    def _control(self, action, path=None, timeout=None):
+        if not self.background or self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                self._sync_files(self._files.values() if path is None else [self._files.get(path)])
+                if action == "release":
+                    self._close_file(path)
+            return True
+        marker = _Marker(action, path)
+        self._queue.put(marker)
+        return marker.done.wait(timeout)
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="background-writer", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        """Collect records until the batch is full or flush_interval passes, then write them."""
+        while True:
+            batch = []
+            marker = None
+            item = self._queue.get()
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if isinstance(item, _Marker):
+                    marker = item
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+
+            # A failed write is logged and dropped: ending the thread would leave flush() and close() waiting forever
+            with self._lock:
+                if batch:
+                    try:
+                        self._write_batch(batch)
+                    except Exception:
+                        self.write_errors += 1
+                        logger.exception("Background writer dropped a batch of %d records", len(batch))
+                if marker is not None:
+                    try:
+                        self._sync_files(self._files.values())
+                    except Exception:
+                        self.write_errors += 1
+                        logger.exception("Background writer failed to %s files", marker.action)
+                    if marker.action == "release":
+                        self._close_file(marker.path)
+                    elif marker.action == "stop":
+                        self._close_files()
+            if marker is not None:
+                marker.done.set()
+                if marker.action == "stop":
+                    return
+
+    def _write_batch(self, batch):
+        start = time.perf_counter()
+        by_path = {}
+        for path, data in batch:
+            if isinstance(data, (dict, list)):
+                data = json.dumps(data) + "\n"
+            by_path.setdefault(path, []).append(data)
+
+        for path, chunks in by_path.items():
+            handle = self._open(path, binary=isinstance(chunks[0], bytes))
+            handle.write(chunks[0][:0].join(chunks))
+            self._sync_files([handle])
+
+        elapsed = time.perf_counter() - start
+        self.records_written += len(batch)
+        self.batches_written += 1
+        self.last_write_latency = elapsed
+        self.max_write_latency = max(self.max_write_latency, elapsed)
+        self.total_write_latency += elapsed
+        if INSTRUMENTATION_ENABLED:
+            FILE_WRITE_SECONDS.observe(elapsed)
+
+    def _sync_files(self, handles):
+        if self.durability == "none":
+            return
+        for handle in handles:
+            if handle is None:
+                continue
+            handle.flush()
+            if self.durability == "fsync":
+                os.fsync(handle.fileno())
+
+    def _open(self, path, binary=False):
+        """Return an open append handle for path, reopening it if the file was removed or replaced."""
+        handle = self._files.get(path)
+        if handle is not None:
+            try:
+                replaced = os.stat(path).st_ino != os.fstat(handle.fileno()).st_ino
+            except (OSError, ValueError):
+                replaced = True
+            if not replaced and ("b" in handle.mode) == binary:
+                return handle
+            self._close_file(path)
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        handle = open(path, "ab") if binary else open(path, "a")
+        self._files[path] = handle
+        return handle
+
+    def _close_file(self, path):
+        handle = self._files.pop(path, None)
+        if handle is not None:
+            try:
+                handle.close()
+            except (OSError, ValueError):
+                pass
+
+    def _close_files(self):
+        for path in list(self._files):
+            self._close_file(path)
+
+_default_writer = None
+
+def get_default_writer():
+    """Return the writer shared by MetricsManager and the exceedings log."""
+    global _default_writer
+    if _default_writer is None:
+        _default_writer = BackgroundWriter()
+    return _default_writer
@@ -0,0 +1,117 @@
+import sys
+import numpy as np
+from config import (
+    NUM_APPS, RANDOM_METRIC_MIN, RANDOM_METRIC_MAX, METRIC_DISTRIBUTION, RANDOM_SEED,
+    BURST_PROBABILITY, SEASONAL_PERIOD_TICKS,
+)
+from instrumentation import timed, GENERATE_SECONDS
+
+class UniformDistribution:
+    """Integers drawn uniformly from [low, high], the original generator's behaviour."""
+
+    def __init__(self, num_apps, low, high):
+        self.low = low
+        self.span = high - low + 1
+
+    def sample(self, rng, out, tick):
+        rng.random(out=out)
+        out *= self.span
+        out += self.low
+
+class NormalDistribution:
+    """Values centred between low and high with most of the mass inside the range."""
+
+    def __init__(self, num_apps, low, high):
+        self.mean = (low + high) / 2
+        self.stddev = (high - low) / 6
+
+    def sample(self, rng, out, tick):
+        rng.standard_normal(out=out)
+        out *= self.stddev
+        out += self.mean
+
+class BurstyDistribution:
+    """A quiet baseline in the lower half of the range with random bursts near the top."""
+
+    def __init__(self, num_apps, low, high):
+        self.low = low
+        self.high = high
+        self.half_span = (high - low) / 2
+        self._draw = np.empty(num_apps)
+
+    def sample(self, rng, out, tick):
+        rng.random(out=out)
+        out *= self.half_span
+        out += self.low
+        rng.random(out=self._draw)
+        bursting = self._draw < BURST_PROBABILITY
+        out[bursting] = self.high - self._draw[bursting] * self.half_span / 4
+
+class SeasonalDistribution:
+    """A sine wave over SEASONAL_PERIOD_TICKS with a fixed phase per app plus noise."""
+
+    def __init__(self, num_apps, low, high):
+        self.mid = (low + high) / 2
+        self.amplitude = (high - low) / 3
+        self.noise = (high - low) / 12
+        self.phases = np.linspace(0, 2 * np.pi, num_apps, endpoint=False)
+        self._wave = np.empty(num_apps)
+
+    def sample(self, rng, out, tick):
+        angle = 2 * np.pi * tick / SEASONAL_PERIOD_TICKS
+        np.add(self.phases, angle, out=self._wave)
+        np.sin(self._wave, out=self._wave)
+        rng.standard_normal(out=out)
+        out *= self.noise
+        out += self.mid
+        self._wave *= self.amplitude
+        out += self._wave
+
+DISTRIBUTIONS = {
+    "uniform": UniformDistribution,
+    "normal": NormalDistribution,
+    "bursty": BurstyDistribution,
+    "seasonal": SeasonalDistribution,
+}
+
+def register_distribution(name, distribution_class):
+    """Make a distribution available to MetricsGenerator under name.
+
+    The class is built with (num_apps, low, high) and its sample(rng, out, tick)
+    method must fill the float64 array out in place.
+    """
+    DISTRIBUTIONS[name] = distribution_class
+
+class MetricsGenerator:
+    """Generate a whole tick of app metrics with one vectorized draw."""
+
+    def __init__(self, num_apps=NUM_APPS, low=RANDOM_METRIC_MIN, high=RANDOM_METRIC_MAX,
+                 distribution=METRIC_DISTRIBUTION, seed=RANDOM_SEED):
+        if distribution not in DISTRIBUTIONS:
+            raise ValueError(f"Unknown metric distribution: {distribution}")
+        self.app_names = tuple(sys.intern(f"app{i+1}") for i in range(num_apps))  # Built once, never per tick
+        self.low = low
+        self.high = high
+        self.distribution = DISTRIBUTIONS[distribution](num_apps, low, high)
+        self.rng = np.random.default_rng(seed)
+        self.tick = 0
+        self._samples = np.empty(num_apps)  # Float scratch buffer the distribution draws into
+        self.values = np.empty(num_apps, dtype=np.int64)  # Reused output buffer
+
+    @timed(GENERATE_SECONDS)
+    def generate(self, out=None):
+        """Draw the next tick into the reusable values buffer, or into out, and return it.
+
+        The returned array is overwritten by the next call; copy it to keep it.
+        """
+        values = self.values if out is None else out
+        self.distribution.sample(self.rng, self._samples, self.tick)
+        np.clip(self._samples, self.low, self.high, out=self._samples)
+        np.floor(self._samples, out=self._samples)
+        values[:] = self._samples
+        self.tick += 1
+        return values
+
+    def generate_dict(self):
+        """Draw the next tick as an {app_name: value} dict."""
+        return dict(zip(self.app_names, self.generate().tolist()))
@@ -0,0 +1,264 @@
+"""Ingest metrics by scraping Prometheus text exposition from remote targets.
+
+With INGESTION_MODE = "scrape" every tick fetches SCRAPE_TARGETS concurrently
+and feeds the samples of SCRAPE_METRIC_NAME, keyed by their SCRAPE_APP_LABEL
+label, into the same store and threshold pipeline as generated metrics.
+"""
+import re
+import ssl
+import gzip
+import math
+import zlib
+import time
+import asyncio
+import logging
+from urllib.parse import urlsplit
+from config import (
+    SCRAPE_TARGETS, SCRAPE_TIMEOUT, SCRAPE_CONCURRENCY, SCRAPE_METRIC_NAME, SCRAPE_APP_LABEL, SERIES_ALL_METRICS,
+)
+
+logger = logging.getLogger("app.ingestion")
+
+_LABEL_VALUE = r'"(?:[^"\\\n]|\\.)*"'  # Quoted label value, may contain escaped quotes and braces
+_UNESCAPE = re.compile(r'\\(.)')
+_ANY_SAMPLE = re.compile(rf'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{{((?:[^"}}\n]|{_LABEL_VALUE})*)\}})?[ \t]+(\S+)', re.M)
+_LABEL_PAIR = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)\s*=\s*"((?:[^"\\\n]|\\.)*)"')
+_sample_patterns = {}  # (metric name, app label) -> compiled sample and label patterns
+
+class ScrapeError(Exception):
+    """A target answered with something other than a 200 exposition."""
+
+def _patterns(metric_name, app_label):
+    patterns = _sample_patterns.get((metric_name, app_label))
+    if patterns is None:
+        # One pass of C regex matching over the body finds every sample of the metric
+        sample = re.compile(rf'^{re.escape(metric_name)}\{{((?:[^"}}\n]|{_LABEL_VALUE})*)\}}[ \t]+(\S+)', re.M)
+        label = re.compile(rf'(?:^|,)\s*{re.escape(app_label)}\s*=\s*({_LABEL_VALUE})')
+        patterns = _sample_patterns[(metric_name, app_label)] = (sample, label)
+    return patterns
+
+def parse_exposition(text, metric_name=SCRAPE_METRIC_NAME, app_label=SCRAPE_APP_LABEL):
+    """Parse Prometheus text exposition into {app: value} for one metric.
+
+    Samples without the app label, other metrics, comments and non-finite
+    values are ignored; series of the same app are summed.
+    """
+    sample_pattern, label_pattern = _patterns(metric_name, app_label)
+    metrics = {}
+    for labels, value in sample_pattern.findall(text):
+        label = label_pattern.search(labels)
+        if label is None:
+            continue
+        try:
+            value = float(value)
+        except ValueError:
+            continue
+        if not math.isfinite(value):
+            continue
+        app = label.group(1)[1:-1]
+        if "\\" in app:
+            app = _unescape(app)
+        metrics[app] = metrics.get(app, 0) + value
+    return metrics
+
+def _unescape(value):
+    return _UNESCAPE.sub(lambda match: "\n" if match.group(1) == "n" else match.group(1), value)
+
+def parse_series(text, series=None):
+    """Add every sample of a Prometheus text exposition to series, {metric: (label sets, values)}.
+
+    Label sets are tuples of (name, value) pairs sorted by name, as the series
+    store interns them. Returns series.
+    """
+    series = {} if series is None else series
+    for metric, labels, value in _ANY_SAMPLE.findall(text):
+        try:
+            value = float(value)
+        except ValueError:
+            continue
+        if not math.isfinite(value):
+            continue
+        pairs = _LABEL_PAIR.findall(labels) if labels else ()
+        if "\\" in labels:
+            pairs = [(name, _unescape(label_value)) for name, label_value in pairs]
+        label_sets, values = series.setdefault(metric, ([], []))
+        label_sets.append(tuple(sorted(pairs)))
+        values.append(value)
+    return series
+
+class ScrapeTarget:
+    """One exporter URL, its kept-alive connection and its last scrape figures."""
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise ValueError(f"Unsupported scrape target: {url}")
+        self.url = url
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == "https" else 80)
+        self.ssl = ssl.create_default_context() if parts.scheme == "https" else None
+        path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        self.request = (f"GET {path} HTTP/1.1\r\nHost: {parts.netloc}\r\nAccept: text/plain\r\n"
+                        f"Accept-Encoding: gzip\r\nConnection: keep-alive\r\n\r\n").encode("ascii")
+        self.reader = None
+        self.writer = None
+        self.up = False
+        self.connections = 0  # Connections opened; stays at 1 while keep-alive holds
+        self.errors = 0
+        self.last_error = None
+        self.last_duration = 0.0
+        self.series = 0
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+    async def fetch(self):
+        """Return the exposition body, reusing the open connection when the target kept it."""
+        reused = self.writer is not None and not self.writer.is_closing()
+        if not reused:
+            await self._connect()
+        try:
+            return await self._request()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            if not reused:
+                raise
+            # The target closed the idle connection; retry once on a new one
+            self.close()
+            await self._connect()
+            return await self._request()
+
+    async def _connect(self):
+        self.close()
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port, ssl=self.ssl)
+        self.connections += 1
+
+    async def _request(self):
+        self.writer.write(self.request)
+        await self.writer.drain()
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionResetError("Connection closed before the response")
+        parts = status_line.split(None, 2)
+        status = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 0
+
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            body = await self._read_chunked()
+        elif "content-length" in headers:
+            body = await self.reader.readexactly(int(headers["content-length"]))
+        else:
+            body = await self.reader.read()  # Delimited by the end of the connection
+            headers["connection"] = "close"
+        if headers.get("connection", "").lower() == "close":
+            self.close()
+
+        if status != 200:
+            raise ScrapeError(f"HTTP {status}")
+        if headers.get("content-encoding", "").lower() == "gzip":
+            try:
+                body = gzip.decompress(body)
+            except (OSError, EOFError, zlib.error) as e:  # Only this target is marked down
+                raise ScrapeError(f"Invalid gzip body: {e}") from e
+        return body.decode("utf-8")
+
+    async def _read_chunked(self):
+        chunks = []
+        while True:
+            size = int((await self.reader.readline()).split(b";")[0], 16)
+            if size == 0:
+                while (await self.reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass  # Trailers
+                return b"".join(chunks)
+            chunks.append(await self.reader.readexactly(size))
+            await self.reader.readexactly(2)  # CRLF after each chunk
+
+class AsyncScraper:
+    """Scrape every target concurrently each tick and merge their samples.
+
+    The event loop is created on the first scrape and kept, so connections
+    stay open between ticks; scrape() must always be called from one thread.
+    A target that fails or exceeds timeout is marked down and left out of
+    that tick.
+    """
+
+    def __init__(self, targets=SCRAPE_TARGETS, timeout=SCRAPE_TIMEOUT, concurrency=SCRAPE_CONCURRENCY,
+                 metric_name=SCRAPE_METRIC_NAME, app_label=SCRAPE_APP_LABEL, all_metrics=SERIES_ALL_METRICS):
+        self.targets = [ScrapeTarget(url) for url in targets]
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.metric_name = metric_name
+        self.app_label = app_label
+        self.all_metrics = all_metrics
+        self.series = {}  # With all_metrics, every sample of the last scrape as {metric: (label sets, values)}
+        self._loop = None
+
+    def scrape(self):
+        """Fetch all targets and return their samples as {app: value}, summed across targets."""
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+        bodies = self._loop.run_until_complete(self._fetch_all())
+        metrics = {}
+        self.series = {}
+        for target, body in zip(self.targets, bodies):
+            if body is None:
+                continue
+            if self.all_metrics:
+                parse_series(body, self.series)
+            samples = parse_exposition(body, self.metric_name, self.app_label)
+            target.series = len(samples)
+            for app, value in samples.items():
+                metrics[app] = metrics.get(app, 0) + value
+        return metrics
+
+    async def _fetch_all(self):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        return await asyncio.gather(*(self._fetch(target, semaphore) for target in self.targets))
+
+    async def _fetch(self, target, semaphore):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                body = await asyncio.wait_for(target.fetch(), self.timeout)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ScrapeError, ValueError) as e:
+                target.close()  # The response state is unknown, so the connection cannot be reused
+                target.up = False
+                target.errors += 1
+                target.last_error = str(e) or type(e).__name__
+                logger.warning("Scrape of %s failed: %s", target.url, target.last_error)
+                body = None
+            else:
+                target.up = True
+            target.last_duration = time.perf_counter() - start
+            return body
+
+    def stats(self):
+        """Return per-target state for monitoring."""
+        return {
+            target.url: {
+                "up": target.up,
+                "series": target.series,
+                "connections": target.connections,
+                "errors": target.errors,
+                "last_error": target.last_error,
+                "last_duration": target.last_duration,
+            }
+            for target in self.targets
+        }
+
+    def close(self):
+        """Close every connection and the event loop."""
+        for target in self.targets:
+            target.close()
+        if self._loop is not None:
+            self._loop.run_until_complete(asyncio.sleep(0))  # Let the transports finish closing
+            self._loop.close()
+            self._loop = None
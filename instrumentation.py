@@ -0,0 +1,168 @@
+"""Internal timings and state of the app itself, in Prometheus format.
+
+Tick metrics are recorded where ticks are generated; request metrics where
+requests are served. With INSTRUMENTATION_ENABLED off, timed() returns the
+wrapped functions unchanged, so the hot paths carry no overhead at all.
+"""
+import math
+import time
+import bisect
+import functools
+import threading
+from config import INSTRUMENTATION_ENABLED, INSTRUMENTATION_BUCKETS
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, values)) + "}"
+
+class Histogram:
+    """Cumulative latency histogram with fixed bucket bounds, in seconds."""
+
+    type = "histogram"
+
+    def __init__(self, name, help_text, buckets=INSTRUMENTATION_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.bounds = sorted(buckets)
+        self.counts = [0] * (len(self.bounds) + 1)  # Per bucket, the last one is +Inf
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.bounds, value)  # First bucket whose bound is >= value
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self):
+        """Context manager observing the duration of its block."""
+        return _Timer(self)
+
+    def samples(self):
+        with self._lock:
+            counts, total = list(self.counts), self.sum
+        cumulative = 0
+        for bound, count in zip(self.bounds + [math.inf], counts):
+            cumulative += count
+            yield f'{self.name}_bucket{{le="{_format_value(bound)}"}}', cumulative
+        yield f"{self.name}_sum", total
+        yield f"{self.name}_count", cumulative
+
+class _Timer:
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+class Counter:
+    """Monotonic count, optionally per label values or read from func at render time."""
+
+    type = "counter"
+
+    def __init__(self, name, help_text, labelnames=(), func=None):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.func = func  # Returns a number, or {label values tuple: number} with labelnames
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self.values[labelvalues] = self.values.get(labelvalues, 0) + amount
+
+    def samples(self):
+        if self.func is not None:
+            values = self.func()
+            values = values if self.labelnames else {(): values}
+        else:
+            with self._lock:
+                values = dict(self.values)
+        for labelvalues, value in values.items():
+            yield self.name + _format_labels(self.labelnames, labelvalues), value
+
+class Gauge(Counter):
+    """Current value, set explicitly or read from func at render time."""
+
+    type = "gauge"
+
+    def set(self, value, *labelvalues):
+        with self._lock:
+            self.values[labelvalues] = value
+
+class Registry:
+    """An ordered set of metrics rendered together."""
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, buckets=INSTRUMENTATION_BUCKETS):
+        return self.register(Histogram(name, help_text, buckets))
+
+    def counter(self, name, help_text, labelnames=(), func=None):
+        return self.register(Counter(name, help_text, labelnames, func))
+
+    def gauge(self, name, help_text, labelnames=(), func=None):
+        return self.register(Gauge(name, help_text, labelnames, func))
+
+    def render(self):
+        """Return every metric in the Prometheus text format."""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(f"{name} {_format_value(value)}" for name, value in metric.samples())
+        return "\n".join(lines) + "\n" if lines else ""
+
+def timed(histogram):
+    """Decorator observing each call's duration in histogram; returns the function as is when disabled."""
+    def decorate(func):
+        if not INSTRUMENTATION_ENABLED:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+# Recorded by the process that generates ticks
+TICK_REGISTRY = Registry()
+GENERATE_SECONDS = TICK_REGISTRY.histogram("metrics_app_generate_seconds", "Time to generate one tick of metrics.")
+STORE_SECONDS = TICK_REGISTRY.histogram("metrics_app_store_seconds", "Time to store one tick in history and the log.")
+PROCESS_SECONDS = TICK_REGISTRY.histogram("metrics_app_process_seconds", "Time to apply the threshold to one tick.")
+TOP_APPS_SECONDS = TICK_REGISTRY.histogram("metrics_app_top_apps_seconds", "Time to rank the top exceeding apps.")
+RENDER_SECONDS = TICK_REGISTRY.histogram("metrics_app_render_seconds", "Time to pre-render the /metrics exposition.")
+SHARD_TICK_SECONDS = TICK_REGISTRY.histogram("metrics_app_shard_tick_seconds",
+                                            "Time for the shard processes to generate and count one tick.")
+FILE_WRITE_SECONDS = TICK_REGISTRY.histogram("metrics_app_file_write_seconds", "Time to write one batch of log records.")
+
+# Recorded by the process that serves requests
+REQUEST_REGISTRY = Registry()
+SCRAPES_TOTAL = REQUEST_REGISTRY.counter("metrics_app_scrapes_total", "Requests served, by endpoint.", ["endpoint"])
+PUSHED_SAMPLES_TOTAL = REQUEST_REGISTRY.counter("metrics_app_pushed_samples_total", "Samples accepted at /api/v1/write.")
+PUSH_REJECTED_TOTAL = REQUEST_REGISTRY.counter("metrics_app_push_rejected_total", "Pushes refused, by reason.", ["reason"])
+LOG_RECORDS_DROPPED_TOTAL = REQUEST_REGISTRY.counter("metrics_app_log_records_dropped_total",
+                                                     "Log records not written, by reason.", ["reason"])
+METRICS_REQUEST_SECONDS = REQUEST_REGISTRY.histogram("metrics_app_metrics_request_seconds",
+                                                     "Time to build a /metrics response.")
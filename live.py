@@ -0,0 +1,140 @@
+"""Live top-X updates for dashboards, pushed as Server-Sent Events.
+
+Once per published snapshot, the broadcaster ranks the top X of each window
+with subscribers, compares it with the previous tick's ranking and encodes
+the changed rows as a single SSE event. Every subscriber then receives that
+same byte string through a bounded queue, so one subscriber costs one queue
+write per tick. A subscriber too slow to drain its queue is disconnected;
+EventSource reconnects on its own and starts again from the full ranking.
+"""
+import json
+import queue
+import logging
+import threading
+from config import TOP_X_APPS, LIVE_QUEUE_SIZE, LIVE_KEEPALIVE, LIVE_POLL_INTERVAL
+
+logger = logging.getLogger("app.live")
+
+KEEPALIVE_EVENT = b": keepalive\n\n"  # SSE comment, ignored by clients but keeps proxies from closing the stream
+
+def top_rows(top_apps, overcounts=None):
+    """Return the ranked rows of a top-X list as JSON-ready dicts."""
+    rows = [{"rank": rank, "app_name": app_name, "count": count}
+            for rank, (app_name, count) in enumerate(top_apps, start=1)]
+    if overcounts is not None:
+        for row, overcount in zip(rows, overcounts):
+            row["overcount"] = overcount
+    return rows
+
+def format_event(event, data, event_id=None):
+    """Encode one SSE event carrying data as JSON."""
+    lines = [f"event: {event}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'))}")
+    return ("\n".join(lines) + "\n\n").encode()
+
+class Subscription:
+    """One client's bounded queue of encoded events."""
+
+    def __init__(self, window, queue_size=LIVE_QUEUE_SIZE):
+        self.window = window
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.overflowed = False  # Set when an event was dropped; the stream then ends so the client resyncs
+
+    def push(self, payload):
+        try:
+            self.queue.put_nowait(payload)
+        except queue.Full:
+            self.overflowed = True
+
+class TopAppsBroadcaster:
+    """Fan out the changes to each window's top X from one computed result to every subscriber."""
+
+    def __init__(self, top_x=TOP_X_APPS, queue_size=LIVE_QUEUE_SIZE):
+        self.top_x = top_x
+        self.queue_size = queue_size
+        self._snapshot = None  # Latest snapshot seen, to prime new subscribers
+        self._rows = {}  # Window -> rows last sent to its subscribers
+        self._subscribers = {}  # Window -> set of Subscriptions
+        self._lock = threading.Lock()  # Serializes publishes and (un)subscribes, so no subscriber misses a diff
+
+    def __len__(self):
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def publish(self, snapshot):
+        """Send the changed rows of every subscribed window; meant as a snapshot listener."""
+        with self._lock:
+            self._snapshot = snapshot
+            for window, subscribers in self._subscribers.items():
+                previous = self._rows.get(window)
+                rows = self._rank(snapshot, window)
+                if rows == previous:
+                    continue
+                self._rows[window] = rows
+                changed = [row for index, row in enumerate(rows)
+                           if previous is None or index >= len(previous) or previous[index] != row]
+                payload = self._event(snapshot, window, rows, changed)
+                for subscriber in subscribers:
+                    subscriber.push(payload)
+
+    def subscribe(self, window=None):
+        """Register a subscriber to window, primed with the full current ranking."""
+        subscription = Subscription(window, self.queue_size)
+        with self._lock:
+            subscribers = self._subscribers.setdefault(window, set())
+            if not subscribers:
+                self._rows.pop(window, None)  # Not kept up to date while nobody listened
+            if self._snapshot is not None:
+                rows = self._rows.get(window)
+                if rows is None:
+                    rows = self._rows[window] = self._rank(self._snapshot, window)
+                subscription.push(self._event(self._snapshot, window, rows, rows))
+            subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.window)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.window]
+
+    def stream(self, subscription, keepalive=LIVE_KEEPALIVE):
+        """Yield the encoded events of a subscription until the client leaves or falls behind."""
+        try:
+            while not subscription.overflowed:
+                try:
+                    yield subscription.queue.get(timeout=keepalive)
+                except queue.Empty:
+                    yield KEEPALIVE_EVENT
+        finally:
+            self.unsubscribe(subscription)
+
+    def follow(self, read_snapshot, interval=LIVE_POLL_INTERVAL, stop=None):
+        """Publish every new snapshot read_snapshot() returns, polling every interval seconds.
+
+        Used by serving workers, whose snapshots arrive through shared memory
+        instead of the generator's snapshot listeners.
+        """
+        stop = stop if stop is not None else threading.Event()
+        last = None
+        while not stop.wait(interval):
+            try:
+                snapshot = read_snapshot()
+                if snapshot is not None and snapshot is not last:
+                    last = snapshot
+                    self.publish(snapshot)
+            except Exception:
+                logger.exception("Failed to publish live top apps")
+
+    def _rank(self, snapshot, window):
+        top_apps = snapshot.get_top_exceedance_apps(self.top_x, window)
+        return top_rows(top_apps, snapshot.get_exceedance_errors(top_apps, window))
+
+    @staticmethod
+    def _event(snapshot, window, rows, changed):
+        data = {"sequence": snapshot.sequence, "timestamp": snapshot.timestamp, "window": window,
+                "size": len(rows), "rows": changed}
+        return format_event("update", data, snapshot.sequence)
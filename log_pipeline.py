@@ -0,0 +1,220 @@
+"""Non-blocking logging: callers only enqueue records, one thread formats and writes them.
+
+Logging calls on the tick loop and in request handlers build a LogRecord,
+pass the rate limiter and put the record on a bounded queue; the message is
+formatted and written by a QueueListener thread, so a slow disk or console
+delays the log, never the caller. Records that would overflow the queue are
+dropped and counted instead of blocking. A forked child does not inherit the
+listener thread, so every running pipeline starts a new one in the child.
+"""
+import os
+import json
+import queue
+import atexit
+import logging
+import threading
+import weakref
+import logging.handlers
+from config import (
+    LOG_LEVEL, LOG_TO_CONSOLE, LOG_TO_CONSOLE_ONLY_EXCEEDINGS, LOG_TO_FILE, LOG_FILE_NAME, LOG_QUEUE_SIZE,
+    LOG_RATE_LIMIT, LOG_RATE_LIMIT_INTERVAL, LOG_FORMAT, LOG_ROTATION, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_ROTATE_WHEN,
+)
+from instrumentation import LOG_RECORDS_DROPPED_TOTAL
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+_running = weakref.WeakSet()  # Started pipelines, restarted in forked children
+
+class JsonFormatter(logging.Formatter):
+    """Format each record as one JSON object per line."""
+
+    def format(self, record):
+        data = {
+            "timestamp": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            data["suppressed"] = suppressed
+        return json.dumps(data, default=str)
+
+class TextFormatter(logging.Formatter):
+    """The standard text format, noting how many similar records the rate limiter dropped before this one."""
+
+    def formatMessage(self, record):
+        message = super().formatMessage(record)
+        suppressed = getattr(record, "suppressed", 0)
+        return f"{message} ({suppressed} similar messages suppressed)" if suppressed else message
+
+class RateLimitFilter(logging.Filter):
+    """Let through at most limit records per message template every interval seconds.
+
+    Records are grouped by logger, level and unformatted message, so every
+    request logging "Serving metrics in %s format" shares one budget. Warnings
+    and above always pass. The first record after a suppression carries the
+    number of records dropped in its suppressed attribute, which the text and
+    JSON formatters report; the record's message is left as it is for every
+    other handler.
+    """
+
+    def __init__(self, limit=LOG_RATE_LIMIT, interval=LOG_RATE_LIMIT_INTERVAL):
+        super().__init__()
+        self.limit = limit
+        self.interval = interval
+        self._windows = {}  # (logger, level, template) -> [window start, records passed, records suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if not self.limit or record.levelno >= logging.WARNING:
+            return True
+        key = (record.name, record.levelno, str(record.msg))  # msg may be any object, even an unhashable one
+        now = record.created
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window is not None else 0
+                self._windows[key] = [now, 1, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+                return True
+            if window[1] < self.limit:
+                window[1] += 1
+                return True
+            window[2] += 1
+        LOG_RECORDS_DROPPED_TOTAL.inc("rate_limited")
+        return False
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Enqueue records without formatting them, dropping them when the queue is full."""
+
+    def prepare(self, record):
+        # The listener thread formats the record; the caller only hands it over
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED_TOTAL.inc("queue_full")
+
+class DrainingQueueListener(logging.handlers.QueueListener):
+    """A QueueListener whose stop() waits for room in a full queue instead of failing."""
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+def file_handler(path, rotation=LOG_ROTATION, max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT,
+                 when=LOG_ROTATE_WHEN):
+    """Return a handler appending to path, rotated by "size", by "time" or never (None)."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if rotation == "size":
+        return logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count,
+                                                    encoding="utf-8")
+    if rotation == "time":
+        return logging.handlers.TimedRotatingFileHandler(path, when=when, backupCount=backup_count, encoding="utf-8")
+    if rotation is None:
+        return logging.FileHandler(path, mode="a", encoding="utf-8")
+    raise ValueError(f"Unknown log rotation: {rotation}")
+
+def make_formatter(log_format=LOG_FORMAT, text_format=TEXT_FORMAT):
+    if log_format == "json":
+        return JsonFormatter()
+    if log_format == "text":
+        return TextFormatter(text_format)
+    raise ValueError(f"Unknown log format: {log_format}")
+
+class LogPipeline:
+    """A bounded queue in front of the given handlers, drained by one listener thread.
+
+    attach(logger) routes a logger through the queue; stop() writes what is
+    still queued and joins the thread.
+    """
+
+    def __init__(self, handlers, queue_size=LOG_QUEUE_SIZE, rate_limit=LOG_RATE_LIMIT,
+                 rate_limit_interval=LOG_RATE_LIMIT_INTERVAL):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.handlers = list(handlers)
+        self.rate_limit = RateLimitFilter(rate_limit, rate_limit_interval)
+        self._queue_handlers = weakref.WeakSet()  # Handlers feeding self.queue, moved to a new queue after a fork
+        self.listener = DrainingQueueListener(self.queue, *self.handlers, respect_handler_level=True)
+        self.listener.start()
+        _running.add(self)
+
+    def handler(self):
+        """Return a new queue handler feeding this pipeline, with the rate limiter applied."""
+        handler = DroppingQueueHandler(self.queue)
+        handler.addFilter(self.rate_limit)
+        self._queue_handlers.add(handler)
+        return handler
+
+    def attach(self, logger):
+        """Route logger's records through this pipeline, replacing the queue handler of an earlier one."""
+        for handler in logger.handlers[:]:
+            if isinstance(handler, DroppingQueueHandler):
+                logger.removeHandler(handler)
+        handler = self.handler()
+        logger.addHandler(handler)
+        return handler
+
+    def stop(self):
+        """Write every queued record, then stop the listener thread and close the handlers."""
+        if self.listener._thread is None:
+            return
+        _running.discard(self)
+        self.listener.stop()
+        for handler in self.handlers:
+            handler.close()
+
+    def _restart_in_child(self):
+        """Start a listener in a forked child, on a new queue; records queued before the fork are the parent's."""
+        self.queue = queue.Queue(maxsize=self.queue.maxsize)  # The old one's lock may have been held at the fork
+        for handler in self._queue_handlers:
+            handler.queue = self.queue
+        self.rate_limit._lock = threading.Lock()
+        self.listener = DrainingQueueListener(self.queue, *self.handlers, respect_handler_level=True)
+        self.listener.start()
+
+def _restart_after_fork():
+    for pipeline in list(_running):
+        pipeline._restart_in_child()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_after_fork)
+
+def stop_pipelines():
+    """Stop every running pipeline after writing its queued records; for processes that exit with os._exit."""
+    for pipeline in list(_running):
+        pipeline.stop()
+
+def setup_logging(logger, level=LOG_LEVEL, to_console=LOG_TO_CONSOLE, console_only_exceedings=LOG_TO_CONSOLE_ONLY_EXCEEDINGS,
+                  to_file=LOG_TO_FILE, file_name=LOG_FILE_NAME, log_format=LOG_FORMAT):
+    """Route logger through a new LogPipeline writing to the console and the log file; return the pipeline.
+
+    With console_only_exceedings, only records of the logger's "exceedings"
+    child reach the console, as bare messages. The pipeline is stopped on exit,
+    after writing what is still queued.
+    """
+    logger.setLevel(getattr(logging, level.upper(), logging.INFO))  # Convert the level name to a logging level
+    handlers = []
+    if to_console and not console_only_exceedings:
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(make_formatter(log_format))
+        handlers.append(console_handler)
+    elif console_only_exceedings:
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(make_formatter(log_format, '%(message)s'))
+        console_handler.addFilter(logging.Filter(f"{logger.name}.exceedings"))
+        handlers.append(console_handler)
+    if to_file:
+        log_file_handler = file_handler(file_name)  # Rotated per LOG_ROTATION
+        log_file_handler.setFormatter(make_formatter(log_format))
+        handlers.append(log_file_handler)
+
+    pipeline = LogPipeline(handlers)
+    pipeline.attach(logger)
+    atexit.register(pipeline.stop)
+    return pipeline
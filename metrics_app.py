@@ -0,0 +1,105 @@
+"""Command-line entry point: python -m metrics_app run|serve|analyze.
+
+Each command imports only what it needs. "run" ticks the generation and
+processing pipeline headless, without loading Flask; "serve" starts the web
+app (the same as python app.py); "analyze" replays the metrics log on disk and
+prints the apps that exceeded a threshold most often, without starting anything.
+"""
+import os
+import sys
+import argparse
+import numpy as np
+from config import INGESTION_MODE, THRESHOLD, TOP_X_APPS, METRICS_FILE_PATH, METRICS_FILE_FORMAT, METRICS_COLUMNAR_DIR
+
+def run(args):
+    """Run the tick loop in this process until interrupted, or process --ticks ticks and exit."""
+    if INGESTION_MODE == "push":
+        print("INGESTION_MODE = \"push\" needs the web server to receive pushes; use serve", file=sys.stderr)
+        return 2
+    import pipeline
+    pipeline.init_logging()
+    pipeline.init(serve=False)
+    try:
+        pipeline.run_generation_process(args.ticks)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+def serve(args):
+    import app
+    app.main(args.server_args)
+    return 0
+
+def analyze_log(threshold=THRESHOLD, metrics_file=METRICS_FILE_PATH, file_format=METRICS_FILE_FORMAT,
+                columnar_dir=METRICS_COLUMNAR_DIR):
+    """Count, per app, the logged ticks above threshold; return (ticks, first, last timestamp, counter).
+
+    Reads the raw ticks still on disk: the JSON log and its rotated chunks, or
+    the columnar segments. Ticks already compacted into rollups are not counted.
+    """
+    from metrics_history import AppIndex
+    from exceedance import ExceedanceCounter
+
+    app_index = AppIndex()
+    counter = ExceedanceCounter(app_index)
+    ticks, first, last = 0, None, None
+    if file_format == "columnar":
+        from columnar_log import ColumnarLogReader
+        for app_names, timestamps, values in ColumnarLogReader(columnar_dir).range():
+            # Missing values are NaN or the dtype's minimum, so they never exceed; one pass per segment
+            counter.add(app_index.columns(app_names), (values > threshold).sum(axis=0))
+            ticks += len(timestamps)
+            first = timestamps[0].item() if first is None else first
+            last = timestamps[-1].item()
+    else:
+        from retention import json_chunk_paths, read_json_ticks
+        paths = [path for _, path in json_chunk_paths(metrics_file)]
+        if os.path.exists(metrics_file):
+            paths.append(metrics_file)
+        for path in paths:
+            for timestamp, metrics in read_json_ticks(path):
+                values = np.fromiter(metrics.values(), dtype=np.float64, count=len(metrics))
+                counter.record(app_index.columns(metrics.keys()), values, threshold)
+                ticks += 1
+                first = timestamp if first is None else first
+                last = timestamp
+    return ticks, first, last, counter
+
+def analyze(args):
+    ticks, first, last, counter = analyze_log(args.threshold)
+    if not ticks:
+        print(f"No logged ticks in {METRICS_COLUMNAR_DIR if METRICS_FILE_FORMAT == 'columnar' else METRICS_FILE_PATH}")
+        return 1
+    print(f"{ticks} ticks from {first} to {last}, threshold {args.threshold:g}")
+    print(f"{'rank':>4} {'app':<20} {'exceedances':>11}")
+    for rank, (app_name, count) in enumerate(counter.top(args.top), start=1):
+        if count:
+            print(f"{rank:>4} {app_name:<20} {count:>11}")
+    return 0
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(prog="python -m metrics_app", description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run_parser = subparsers.add_parser("run", help="Generate and process metrics headless, without a web server")
+    run_parser.add_argument("--ticks", type=int,
+                            help="Process this many ticks back to back and exit, instead of every METRICS_INTERVAL")
+    run_parser.set_defaults(handler=run)
+    serve_parser = subparsers.add_parser("serve", add_help=False,
+                                         help="Start the web app; further arguments, such as --server, go to app.py")
+    serve_parser.set_defaults(handler=serve)
+    analyze_parser = subparsers.add_parser("analyze", help="Rank the apps exceeding the threshold in the metrics log")
+    analyze_parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    analyze_parser.add_argument("--top", type=int, default=TOP_X_APPS)
+    analyze_parser.set_defaults(handler=analyze)
+    args, server_args = parser.parse_known_args(argv)
+    if args.command != "serve" and server_args:
+        parser.error(f"unrecognized arguments: {' '.join(server_args)}")
+    args.server_args = server_args  # Parsed by app.py itself
+    return args
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    return args.handler(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,286 @@
+import sys
+import threading
+import numpy as np
+from config import (
+    HISTORY_MAX_TICKS, HISTORY_MAX_AGE, HISTORY_VALUE_DTYPE, HISTORY_ROLLUPS, RETENTION_ENABLED, RETENTION_RAW_SECONDS,
+)
+from rollups import MIN, MAX, SUM, COUNT, Rollup, downsample, empty_stats, ring_rows
+
+def storage_values(values, dtype):
+    """Return values converted to dtype, as they are stored.
+
+    Fractional values are rounded to the nearest integer for an integer
+    dtype rather than truncated. Thresholds are applied to the values as
+    received, before this conversion.
+    """
+    values = np.asarray(values)
+    dtype = np.dtype(dtype)
+    if dtype.kind in "iu" and values.dtype.kind == "f":
+        return np.rint(values).astype(dtype)
+    return values.astype(dtype, copy=False)
+
+class AppIndex:
+    """Intern app names once and map each one to a stable column position."""
+
+    def __init__(self):
+        self.names = []  # Column position -> interned app name
+        self.positions = {}  # App name -> column position
+        self._last_keys = None  # Key layout of the last snapshot that was resolved
+        self._last_columns = None
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.positions
+
+    def intern(self, name):
+        """Return the column position of name, registering it if it is new."""
+        position = self.positions.get(name)
+        if position is None:
+            position = len(self.names)
+            name = sys.intern(name) if isinstance(name, str) else name
+            self.names.append(name)
+            self.positions[name] = position
+        return position
+
+    def columns(self, names):
+        """Return the column positions for an ordered sequence of app names."""
+        keys = tuple(names)
+        # Snapshots almost always repeat the previous key layout, so compare the
+        # tuples (a C-level identity check per name) before resolving anything.
+        # A caller passing the same tuple again skips even that comparison.
+        if keys is self._last_keys or keys == self._last_keys:
+            return self._last_columns
+
+        columns = np.fromiter((self.intern(name) for name in keys), dtype=np.intp, count=len(keys))
+        self._last_keys = keys
+        self._last_columns = columns
+        return columns
+
+class MetricsHistory:
+    """Fixed-capacity ring buffer of metric snapshots indexed by (tick, app)."""
+
+    def __init__(self, max_ticks=None, max_age=None, dtype=None, app_index=None, rollups=None):
+        self.max_ticks = max_ticks if max_ticks is not None else HISTORY_MAX_TICKS
+        if max_age is None:
+            max_age = HISTORY_MAX_AGE if HISTORY_MAX_AGE is not None or not RETENTION_ENABLED else RETENTION_RAW_SECONDS
+        self.max_age = max_age
+        self.dtype = np.dtype(dtype if dtype is not None else HISTORY_VALUE_DTYPE)
+        self.app_index = app_index if app_index is not None else AppIndex()
+        if self.max_ticks < 1:
+            raise ValueError("max_ticks must be at least 1")
+
+        self._timestamps = np.zeros(self.max_ticks, dtype=np.int64)
+        self._values = np.zeros((self.max_ticks, 0), dtype=self.dtype)
+        self._present = np.zeros((self.max_ticks, 0), dtype=bool)  # Which apps reported in each tick
+        self._widths = np.zeros(self.max_ticks, dtype=np.intp)  # Number of known apps when each tick was stored
+        self._start = 0  # Physical row of the oldest tick
+        self._size = 0
+        self.rollups = {  # Downsampled statistics by name, e.g. per hour
+            name: Rollup(resolution, max_buckets, self.app_index)
+            for name, (resolution, max_buckets) in (HISTORY_ROLLUPS if rollups is None else rollups).items()
+        }
+        self.lock = threading.Lock()  # Held by appends and range queries, which run on different threads
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        for i in range(self._size):
+            yield self._entry(self._physical(i))
+
+    def __getitem__(self, index):
+        """Return (timestamp, {app: value}) entries, oldest first, like the old list."""
+        if isinstance(index, slice):
+            return [self._entry(self._physical(i)) for i in range(*index.indices(self._size))]
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError("metrics history index out of range")
+        return self._entry(self._physical(index))
+
+    @property
+    def capacity(self):
+        """Number of app columns currently allocated per tick."""
+        return self._values.shape[1]
+
+    @property
+    def nbytes(self):
+        """Memory held by the preallocated history arrays and the rollups."""
+        return (self._timestamps.nbytes + self._values.nbytes + self._present.nbytes + self._widths.nbytes
+                + sum(rollup.nbytes for rollup in self.rollups.values()))
+
+    def append(self, timestamp, metrics):
+        """Store a {app: value} snapshot taken at timestamp."""
+        columns = self.app_index.columns(metrics.keys())
+        values = np.fromiter(metrics.values(), dtype=np.float64, count=len(metrics))
+        self.append_values(timestamp, columns, self.storage_values(values))
+
+    def storage_values(self, values):
+        """Return values converted to the history's dtype; see storage_values()."""
+        return storage_values(values, self.dtype)
+
+    def append_values(self, timestamp, columns, values):
+        """Store values already resolved to app columns, evicting expired ticks first."""
+        with self.lock:
+            self._append(timestamp, columns, values)
+            if self.rollups:
+                values = np.asarray(values, dtype=np.float64)  # Converted once for every rollup
+            for rollup in self.rollups.values():
+                rollup.add(timestamp, columns, values)
+
+    def _append(self, timestamp, columns, values):
+        self._ensure_capacity(len(self.app_index))
+        if self.max_age:
+            self._evict_older_than(timestamp - self.max_age)
+        if self._size == self.max_ticks:
+            self._drop_oldest()
+
+        row = self._physical(self._size)
+        width = len(self.app_index)
+        self._timestamps[row] = timestamp
+        self._widths[row] = width
+        self._present[row, :width] = False
+        self._present[row, columns] = True
+        self._values[row, columns] = values
+        self._size += 1
+
+    def latest(self):
+        """Return (timestamp, app_names, values) for the newest tick, or None if empty."""
+        if not self._size:
+            return None
+        return self.row(self._size - 1)
+
+    def row(self, index):
+        """Return (timestamp, app_names, values) for the tick at a logical index."""
+        if index < 0:
+            index += self._size
+        row = self._physical(index)
+        width = self._widths[row]
+        present = self._present[row, :width]
+        values = self._values[row, :width]
+        names = self.app_index.names
+        if present.all():
+            # Avoid copying the name table when every known app reported
+            return int(self._timestamps[row]), names if width == len(names) else names[:width], values
+        columns = np.flatnonzero(present)
+        return int(self._timestamps[row]), [names[c] for c in columns], values[columns]
+
+    def timestamps(self):
+        """Return the stored timestamps, oldest first."""
+        return np.roll(self._timestamps, -self._start)[:self._size]
+
+    def tail(self, count):
+        """Return copies of (timestamps, values, present) for the newest count ticks, oldest first.
+
+        values and present have one column per known app; apps that did not
+        report in a tick are False in present.
+        """
+        count = min(count, self._size)
+        width = min(len(self.app_index), self.capacity)
+        rows = [self._physical(i) for i in range(self._size - count, self._size)]
+        values = self._values[rows, :width]
+        present = self._present[rows, :width]
+        present &= np.arange(width) < self._widths[rows][:, None]  # Columns registered after a tick are absent
+        return self._timestamps[rows], values, present
+
+    def stats(self, lo, hi, columns):
+        """Return (timestamps, (ticks, 4, len(columns)) statistics) of the stored ticks in [lo, hi).
+
+        Each tick counts as one value per app that reported in it, in the
+        min, max, sum and count layout of the rollups.
+        """
+        rows = ring_rows(self._timestamps, self._start, self._size, lo, hi)
+        stats = empty_stats(len(rows), len(columns))
+        if not len(rows):
+            return self._timestamps[rows], stats
+        cells = np.ix_(rows, np.minimum(columns, self.capacity - 1))
+        known = self._present[cells] & (columns < self._widths[rows][:, None])  # Reported in the tick
+        values = self._values[cells].astype(np.float64)
+        stats[:, MIN] = np.where(known, values, np.inf)
+        stats[:, MAX] = np.where(known, values, -np.inf)
+        stats[:, SUM] = np.where(known, values, 0)
+        stats[:, COUNT] = known
+        return self._timestamps[rows], stats
+
+    def query_range(self, columns, start, end, step):
+        """Return (source, bucket starts, statistics) of the app columns in [start, end], merged per step seconds.
+
+        Buckets start on multiples of step. The coarsest rollup whose buckets
+        fit in a step and that reaches back to start is read; otherwise the
+        source reaching back furthest, the raw ticks included, is read.
+        """
+        columns = np.asarray(columns, dtype=np.intp)
+        lo = start - start % step
+        hi = end - end % step + step
+        with self.lock:
+            sources = self._sources(step)
+            oldest = [source.oldest for _, source in sources]
+            covering = [i for i, first in enumerate(oldest) if first is not None and first <= lo]
+            if covering:
+                chosen = covering[0]
+            else:
+                known = [i for i, first in enumerate(oldest) if first is not None]
+                chosen = min(known, key=lambda i: oldest[i]) if known else len(sources) - 1
+            name, source = sources[chosen]
+            timestamps, stats = source.stats(lo, hi, columns)
+        return (name,) + downsample(timestamps, stats, lo, step)
+
+    def reach(self, step):
+        """Return the oldest time a query_range with step can read from memory, or None when nothing is stored."""
+        with self.lock:
+            known = [source.oldest for _, source in self._sources(step) if source.oldest is not None]
+        return min(known) if known else None
+
+    def _sources(self, step):
+        """Return (name, source) of the rollups whose buckets fit in step, coarsest first, then the raw ticks."""
+        sources = [(name, rollup) for name, rollup in self.rollups.items()
+                   if rollup.resolution <= step and step % rollup.resolution == 0]
+        sources.sort(key=lambda source: -source[1].resolution)
+        sources.append(("raw", self))
+        return sources
+
+    @property
+    def oldest(self):
+        """Timestamp of the oldest stored tick, or None when empty."""
+        return int(self._timestamps[self._start]) if self._size else None
+
+    def clear(self):
+        """Drop every stored tick and rollup while keeping the allocated buffers."""
+        self._start = 0
+        self._size = 0
+        for rollup in self.rollups.values():
+            rollup.clear()
+
+    def _physical(self, index):
+        return (self._start + index) % self.max_ticks
+
+    def _entry(self, row):
+        width = self._widths[row]
+        present = self._present[row, :width]
+        values = self._values[row, :width].tolist()
+        names = self.app_index.names
+        if present.all():
+            return int(self._timestamps[row]), dict(zip(names, values))
+        return int(self._timestamps[row]), {names[c]: values[c] for c in np.flatnonzero(present)}
+
+    def _drop_oldest(self):
+        self._start = (self._start + 1) % self.max_ticks
+        self._size -= 1
+
+    def _evict_older_than(self, cutoff):
+        while self._size and self._timestamps[self._start] < cutoff:
+            self._drop_oldest()
+
+    def _ensure_capacity(self, width):
+        """Grow the app dimension geometrically when new apps have been interned."""
+        if width <= self.capacity:
+            return
+        new_capacity = max(width, self.capacity * 2, 16)
+        values = np.zeros((self.max_ticks, new_capacity), dtype=self.dtype)
+        present = np.zeros((self.max_ticks, new_capacity), dtype=bool)
+        values[:, :self.capacity] = self._values
+        present[:, :self.capacity] = self._present
+        self._values = values
+        self._present = present
@@ -1,28 +1,126 @@
 import time
 import os
-import json
-from collections import defaultdict
-from config import WRITE_METRICS_TO_FILE, METRICS_FILE_PATH, DELETE_PREVIOUS_METRICS_FILE
+import numpy as np
+from config import (
+    WRITE_METRICS_TO_FILE, METRICS_FILE_PATH, DELETE_PREVIOUS_METRICS_FILE,
+    METRICS_FILE_FORMAT, METRICS_COLUMNAR_DIR, EXCEEDANCE_WINDOWS, EXCEEDANCE_WINDOW_BUCKETS, METRIC_NAME,
+    METRIC_THRESHOLDS, TOP_X_MODE, THRESHOLD_MODE, STATS_ENABLED,
+)
+from metrics_history import AppIndex, MetricsHistory
+from exceedance import ExceedanceCounter, ExceedanceWindow
+from exposition import ExpositionCache
+from file_writer import get_default_writer
+from snapshot import MetricsSnapshot
+from series_store import SeriesStore
+from rollups import COUNT, aggregate, downsample, empty_stats
+from instrumentation import timed, STORE_SECONDS, PROCESS_SECONDS, TOP_APPS_SECONDS, RENDER_SECONDS
 
 class MetricsManager:
-    def __init__(self, metrics_file=None):
-        self.metrics_history = []  # List to store all metrics with timestamps
-        self.exceedance_count = defaultdict(int)  # Track threshold exceedances per app
+    def __init__(self, metrics_file=None, history_max_ticks=None, history_max_age=None, writer=None,
+                 delete_previous=DELETE_PREVIOUS_METRICS_FILE, top_x_mode=None, threshold_mode=None):
+        self.top_x_mode = top_x_mode if top_x_mode is not None else TOP_X_MODE
+        if self.top_x_mode not in ("exact", "approximate"):
+            raise ValueError(f"Unknown top-X mode: {self.top_x_mode}")
+        if self.top_x_mode == "exact":
+            counter, window = ExceedanceCounter, ExceedanceWindow
+        else:
+            from sketches import SpaceSavingCounter, SpaceSavingWindow  # Only loaded for approximate top-X
+            counter, window = SpaceSavingCounter, SpaceSavingWindow
+        self.app_index = AppIndex()  # App names interned once and shared by every store
+        self.metrics_history = MetricsHistory(history_max_ticks, history_max_age, app_index=self.app_index)  # Bounded ring buffer of timestamped snapshots
+        self._counter_class = counter
+        self._exceedances = counter(self.app_index)  # Track threshold exceedances per app
+        self.exceedance_windows = {  # Sliding-window exceedance counts, by window name
+            name: window(span, EXCEEDANCE_WINDOW_BUCKETS, self.app_index)
+            for name, span in EXCEEDANCE_WINDOWS.items()
+        }
+        self.threshold_mode = threshold_mode if threshold_mode is not None else THRESHOLD_MODE
+        self.statistics = None  # Streaming per-app statistics, kept for adaptive thresholds or STATS_ENABLED
+        if STATS_ENABLED or self.threshold_mode != "static":
+            from stats import AppStatistics, THRESHOLD_MODES  # Only loaded when statistics are kept
+            if self.threshold_mode not in THRESHOLD_MODES:
+                raise ValueError(f"Unknown threshold mode: {self.threshold_mode}")
+            self.statistics = AppStatistics(self.app_index)
+        self.series = SeriesStore()  # Every other metric and label set, for selection by label matchers
+        self.archive = None  # RollupArchive of the history compacted to disk, read by range queries older than memory
+        self.exposition = ExpositionCache()  # Prometheus body pre-rendered once per tick
+        self.snapshot = None  # Immutable state of the last published tick, read by request handlers
+        self._snapshot_sequence = 0
+        self.snapshot_listeners = []  # Callables given every published snapshot, e.g. to share it across processes
+        self._app_names = ()  # Tuple of app_index.names, rebuilt only when new apps appear
         self.write_to_file = WRITE_METRICS_TO_FILE
         self.metrics_file = metrics_file if metrics_file is not None else METRICS_FILE_PATH  # Use custom file path if provided
+        self.writer = writer if writer is not None else get_default_writer()  # Batched writer shared with the exceedings log
+        self.file_format = METRICS_FILE_FORMAT  # "json" lines or "columnar" binary segments
+        self.columnar_log = None
+        if self.file_format == "columnar":
+            from columnar_log import ColumnarLogWriter  # Only loaded for the columnar format
+            self.columnar_log = ColumnarLogWriter(METRICS_COLUMNAR_DIR, self.writer, self.metrics_history.dtype)
 
         # Delete the previous metrics file if the option is enabled
-        if DELETE_PREVIOUS_METRICS_FILE and os.path.exists(self.metrics_file):
+        if delete_previous and os.path.exists(self.metrics_file):
+            self.writer.release(self.metrics_file)  # Write and close anything still pending for the old file
             os.remove(self.metrics_file)
+        if delete_previous:
+            from retention import json_chunk_paths
+            for _, chunk in json_chunk_paths(self.metrics_file):  # Chunks rotated out of it by retention
+                os.remove(chunk)
+        if delete_previous and self.columnar_log is not None:
+            self.columnar_log.remove_segments()
 
+    @timed(STORE_SECONDS)
     def store_metrics(self, metrics):
         """Store metrics with a timestamp and optionally save them to a JSON file."""
         timestamp = int(time.time())
-        self.metrics_history.append((timestamp, metrics))
+        columns = self.app_index.columns(metrics.keys())
+        values = np.fromiter(metrics.values(), dtype=np.float64, count=len(metrics))
+        stored = self.metrics_history.storage_values(values)  # Rounded for an integer HISTORY_VALUE_DTYPE
+        self.metrics_history.append_values(timestamp, columns, stored)
+
+        # Save metrics to the configured file format if enabled
+        if self.write_to_file:
+            if self.columnar_log is not None:
+                self.columnar_log.append(timestamp, self.app_index.names, columns, stored)
+            else:
+                self._write_json(timestamp, metrics)
+
+    @timed(STORE_SECONDS)
+    def store_values(self, app_names, values):
+        """Store a snapshot given as parallel app names and values arrays.
+
+        Passing the same app_names tuple every tick lets the app columns be
+        reused without resolving any name.
+        """
+        timestamp = int(time.time())
+        columns = self.app_index.columns(app_names)
+        stored = self.metrics_history.storage_values(values)  # Rounded for an integer HISTORY_VALUE_DTYPE
+        self.metrics_history.append_values(timestamp, columns, stored)
 
-        # Save metrics to the JSON file if enabled
         if self.write_to_file:
-            self._write_json(timestamp, metrics)
+            if self.columnar_log is not None:
+                self.columnar_log.append(timestamp, self.app_index.names, columns, stored)
+            else:
+                self._write_json(timestamp, dict(zip(app_names, values.tolist())))
+
+    def store_series(self, series):
+        """Store samples of other metrics, given as {metric: (label sets, values)}.
+
+        Each label set is a tuple of (name, value) pairs sorted by name.
+        METRIC_NAME itself is stored by store_metrics and store_values, and
+        snapshots read its series from the history and the exceedance counts.
+        """
+        for metric, (label_sets, values) in series.items():
+            if metric != METRIC_NAME:
+                self.series.store(metric, label_sets, values)
+
+    @timed(RENDER_SECONDS)
+    def render_exposition(self):
+        """Pre-render the latest snapshot in Prometheus format for /metrics scrapes."""
+        latest = self.metrics_history.latest()
+        if latest is None:
+            self.exposition.clear()
+            return None
+        return self.exposition.update(*latest)
 
     def _write_json(self, timestamp, metrics):
         """Write metrics to the file in JSON format if write_to_file is True."""
@@ -33,19 +131,148 @@ class MetricsManager:
             "timestamp": timestamp,
             "metrics": metrics
         }
-        # Create directory if it doesn't exist
-        os.makedirs(os.path.dirname(self.metrics_file), exist_ok=True)
-        with open(self.metrics_file, "a") as file:
-            json.dump(data, file)
-            file.write("\n")  # Add a newline for readability
+        # The writer creates the directory, keeps the file open and appends one JSON line per record
+        self.writer.write_json(self.metrics_file, data)
+
+    @property
+    def exceedance_count(self):
+        """Per-app exceedance counts, readable like a dict of app name to count."""
+        return self._exceedances
+
+    @exceedance_count.setter
+    def exceedance_count(self, counts):
+        self._exceedances = self._counter_class(self.app_index)  # Of the top-X mode chosen at construction
+        self._exceedances.update(counts)
+
+    def attach_counts(self, counter, windows):
+        """Read exceedance counts maintained elsewhere, e.g. by shard processes, instead of counting here."""
+        self._exceedances = counter
+        self.exceedance_windows = windows
 
-    def process_metrics(self, metrics, threshold):
+    def process_metrics(self, metrics, threshold, timestamp=None):
         """Process metrics to check for threshold exceedances."""
-        for app_name, value in metrics.items():
-            if value > threshold:
-                self.exceedance_count[app_name] += 1
-
-    def get_top_exceedance_apps(self, top_x):
-        """Retrieve the top X apps with the most threshold exceedances."""
-        sorted_apps = sorted(self.exceedance_count.items(), key=lambda x: x[1], reverse=True)
-        return sorted_apps[:top_x]
\ No newline at end of file
+        # Compared as received: a scraped 10000.9 exceeds 10000 even though the history stores integers
+        values = np.fromiter(metrics.values(), dtype=np.float64, count=len(metrics))
+        self.process_values(metrics.keys(), values, threshold, timestamp)
+
+    @timed(PROCESS_SECONDS)
+    def process_values(self, app_names, values, threshold, timestamp=None):
+        """Apply the threshold, or each app's adaptive one under THRESHOLD_MODE, to a snapshot of parallel app names and values."""
+        columns = self.app_index.columns(app_names)
+        if self.statistics is not None:
+            # Each value is compared with the baseline of the values before it, then folded in
+            exceeded = values > self.statistics.thresholds(columns, self.threshold_mode, threshold)
+            self.statistics.update(columns, values)
+        else:
+            exceeded = values > threshold
+        self._exceedances.add(columns, exceeded)
+        if self.exceedance_windows:
+            timestamp = time.time() if timestamp is None else timestamp
+            for window in self.exceedance_windows.values():
+                window.add(timestamp, columns, exceeded)
+
+    def process_series(self, default_threshold):
+        """Apply METRIC_THRESHOLDS, or default_threshold, to every other metric stored this tick."""
+        for metric in self.series.pending():
+            self.series.process(metric, METRIC_THRESHOLDS.get(metric, default_threshold))
+
+    def query_range(self, app_names, start, end, step, aggregation="avg"):
+        """Return (source, {app: [(timestamp, value)]}) of the stored values of app_names in [start, end].
+
+        Values are aggregated per bucket of step seconds, each point stamped
+        with the start of its bucket; source names the rollup that was read,
+        or "raw". The part of the range older than the in-memory history is
+        read from the archive's rollup files when there is one, and source
+        then also names their tier, e.g. "1h (disk)+raw". Apps with no stored
+        values are left out. Safe to call from request threads.
+        """
+        known = [name for name in app_names if name in self.app_index]
+        columns = [self.app_index.positions[name] for name in known]
+        source, starts, stats = self.metrics_history.query_range(columns, start, end, step)
+        lo = start - start % step
+        reach = self.metrics_history.reach(step)
+        if self.archive is not None and (reach is None or lo < reach):
+            hi = end - end % step + step
+            names = list(dict.fromkeys(app_names))  # Apps compacted before a restart may not be known in memory
+            archived = self.archive.stats(names, lo, hi if reach is None else min(reach, hi), step)
+            if archived is not None:
+                tier, archived_starts, archived_stats = archived
+                archived_starts, archived_stats = downsample(archived_starts, archived_stats, lo, step)
+                memory_stats = empty_stats(len(starts), len(names))
+                memory_stats[:, :, [names.index(name) for name in known]] = stats
+                # The step bucket holding reach may have rows on disk and in memory; downsample merges them
+                starts, stats = downsample(np.concatenate([archived_starts, starts]),
+                                           np.concatenate([archived_stats, memory_stats]), lo, step)
+                source = f"{tier} (disk)" if reach is None else f"{tier} (disk)+{source}"
+                known = [name for column, name in enumerate(names)
+                         if name in self.app_index or archived_stats[:, COUNT, column].any()]
+                stats = stats[:, :, [names.index(name) for name in known]]
+        values = aggregate(stats, aggregation)
+        result = {}
+        for name, column in zip(known, values.T):
+            present = ~np.isnan(column)
+            result[name] = list(zip(starts[present].tolist(), column[present].tolist()))
+        return source, result
+
+    def app_statistics(self, app_names, threshold):
+        """Return {app: summary} of the streaming statistics of app_names, each with its current threshold.
+
+        Apps never stored are left out. Safe to call from request threads.
+        """
+        result = {}
+        for name in app_names:
+            summary = self.statistics.summary(name)
+            if summary is not None:
+                if self.threshold_mode != "static":
+                    column = np.array([self.app_index.positions[name]])
+                    threshold = self.statistics.thresholds(column, self.threshold_mode, threshold)[0]
+                summary["threshold"] = float(threshold)
+                result[name] = summary
+        return result
+
+    def publish_snapshot(self, rankings=None, internal_metrics=None):
+        """Capture the current tick as an immutable snapshot and publish it.
+
+        Must be called from the thread that stores and processes metrics. The
+        snapshot is swapped in with a single assignment, so readers either get
+        the previous tick or this one, never a mix of both. rankings maps
+        (top_x, window) to top apps already computed for this tick;
+        internal_metrics is the rendered self-instrumentation to carry along.
+        """
+        now = time.time()
+        for window in self.exceedance_windows.values():
+            window.advance(now)  # Expire buckets before freezing the window counts
+        if len(self._app_names) != len(self.app_index):
+            self._app_names = tuple(self.app_index.names)
+        self._snapshot_sequence += 1
+        snapshot = MetricsSnapshot.capture(self._snapshot_sequence, self, self._app_names, rankings,
+                                          internal_metrics)
+        self.snapshot = snapshot
+        for listener in self.snapshot_listeners:
+            listener(snapshot)
+        return snapshot
+
+    @timed(TOP_APPS_SECONDS)
+    def get_top_exceedance_apps(self, top_x, window=None):
+        """Retrieve the top X apps with the most threshold exceedances.
+
+        window selects one of EXCEEDANCE_WINDOWS instead of the lifetime counts.
+        Once a snapshot has been published the answer comes from it, so request
+        threads never read the counters while the generator updates them.
+        """
+        snapshot = self.snapshot
+        if snapshot is not None:
+            return snapshot.get_top_exceedance_apps(top_x, window)
+        if window is None:
+            return self._exceedances.top(top_x)
+        return self.exceedance_windows[window].top(top_x, now=time.time())
+
+    def get_exceedance_errors(self, top_apps, window=None):
+        """Return the maximum overcount of each (app_name, count) pair, or None when the counts are exact."""
+        snapshot = self.snapshot
+        if snapshot is not None:
+            return snapshot.get_exceedance_errors(top_apps, window)
+        if self.top_x_mode == "exact":
+            return None
+        counter = self._exceedances if window is None else self.exceedance_windows[window]
+        return counter.summary().overcounts(self.app_index.names, top_apps)
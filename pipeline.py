@@ -0,0 +1,260 @@
+"""The tick pipeline: generation or ingestion, storage, threshold processing and background jobs.
+
+Importing this module creates nothing and touches no file. init() builds the
+shared state (file writer, metrics manager, ingestion, checkpoints, retention,
+scheduler) once; app.init() calls it before the web app serves, and
+`python -m metrics_app run` calls it without ever importing Flask. Modules
+that only some configurations use are imported by init() when they are needed.
+"""
+import os
+import time
+import atexit
+import logging
+from config import *
+from file_writer import get_default_writer
+from metrics_manager import MetricsManager
+from generation import MetricsGenerator
+from scheduler import Scheduler
+from log_pipeline import setup_logging
+from instrumentation import TICK_REGISTRY
+
+logger = logging.getLogger("app")  # The application's logger, shared with the web app; each module logs to a child
+exceedings_logger = logging.getLogger("app.exceedings")  # Top apps shown in the "console" display mode
+
+# Created by init_logging() and init()
+log_pipeline = None
+file_writer = None
+metrics_manager = None
+checkpointer = None
+compactor = None
+metrics_generator = None
+scraper = None  # Scraper fetching each tick from remote exporters, or
+push_queue = None  # queue of pushed batches, instead of generated metrics
+sharded_pipeline = None  # Shard processes generating and counting the apps in parallel, started by start_sharded_pipeline()
+scheduler = None  # Periodic jobs, each on fixed wall-clock boundaries of its own interval
+serving = True  # Whether request handlers read the published ticks; set by init()
+
+def init_logging():
+    """Route the application's log records through the LOG_* settings' queued handlers; return the log pipeline.
+
+    A listener thread formats and writes the records, so a slow disk never
+    stalls a tick or a request. Only the first call sets it up.
+    """
+    global log_pipeline
+    if log_pipeline is None:
+        log_pipeline = setup_logging(logger, LOG_LEVEL, LOG_TO_CONSOLE, LOG_TO_CONSOLE_ONLY_EXCEEDINGS, LOG_TO_FILE,
+                                     LOG_FILE_NAME, LOG_FORMAT)
+    return log_pipeline
+
+def init(serve=True):
+    """Create the pipeline's state; a no-op once it exists.
+
+    With serve=False nothing serves the published ticks, so the /metrics body
+    is not rendered each tick.
+    """
+    global file_writer, metrics_manager, checkpointer, compactor, metrics_generator, scraper, push_queue, scheduler
+    global serving
+    if metrics_manager is not None:
+        return
+    serving = serve
+
+    # Background writer shared by the metrics and exceedings logs, flushed on exit
+    file_writer = get_default_writer()
+    atexit.register(file_writer.close)
+
+    # Initialize MetricsManager (the metrics log is kept when it is needed to replay after a checkpoint)
+    metrics_manager = MetricsManager(writer=file_writer,
+                                     delete_previous=DELETE_PREVIOUS_METRICS_FILE and not CHECKPOINT_ENABLED)
+
+    # Warm-restore counters and recent history, then checkpoint periodically and on exit
+    if CHECKPOINT_ENABLED and SHARD_PROCESSES:
+        logger.warning("Checkpoints are not supported with SHARD_PROCESSES; they are disabled")
+    elif CHECKPOINT_ENABLED and metrics_manager.top_x_mode == "approximate":
+        logger.warning("Checkpoints are not supported with the approximate TOP_X_MODE; they are disabled")
+    elif CHECKPOINT_ENABLED:
+        from checkpoint import Checkpointer, restore_checkpoint
+        replayed = restore_checkpoint(metrics_manager, THRESHOLD)
+        if replayed is not None:
+            logger.info("Restored checkpoint %s and replayed %d logged ticks", CHECKPOINT_PATH, replayed)
+            metrics_manager.render_exposition()
+            metrics_manager.publish_snapshot()
+        checkpointer = Checkpointer(metrics_manager, interval=None)  # Saved when the checkpoint job asks
+        atexit.register(checkpointer.save)
+
+    # Compaction of raw metrics log chunks into coarser rollup files, run by a scheduled job
+    if RETENTION_ENABLED and metrics_manager.write_to_file:
+        from retention import Compactor
+        compactor = Compactor(metrics_manager)
+        metrics_manager.archive = compactor.archive  # Range queries older than memory read the rollup files
+
+    # Initialize the metrics generator (app names are built once here, not per tick)
+    metrics_generator = MetricsGenerator()
+
+    if INGESTION_MODE == "scrape":
+        from ingestion import AsyncScraper
+        scraper = AsyncScraper()
+        atexit.register(scraper.close)
+    elif INGESTION_MODE == "push":
+        from push import PushQueue
+        push_queue = PushQueue()
+    elif INGESTION_MODE != "generate":
+        raise ValueError(f"Unknown ingestion mode: {INGESTION_MODE}")
+
+    scheduler = Scheduler()
+    register_instrumentation()
+
+    # Delete the previous exceedings file if the option is enabled
+    if DELETE_PREVIOUS_EXCEEDINGS_FILE and os.path.exists(EXCEEDINGS_FILE_PATH):
+        file_writer.release(EXCEEDINGS_FILE_PATH)
+        os.remove(EXCEEDINGS_FILE_PATH)
+
+def register_instrumentation():
+    """Register the internal state read when /internal/metrics is rendered."""
+    TICK_REGISTRY.gauge("metrics_app_history_bytes", "Memory held by the in-memory metrics history.",
+                        func=lambda: metrics_manager.metrics_history.nbytes)
+    TICK_REGISTRY.gauge("metrics_app_history_ticks", "Ticks kept in the in-memory metrics history.",
+                        func=lambda: len(metrics_manager.metrics_history))
+    TICK_REGISTRY.gauge("metrics_app_ticks_behind", "Generation ticks behind schedule.", func=ticks_behind)
+    TICK_REGISTRY.counter("metrics_app_job_overruns_total", "Job runs that ended after the next run was due.", ["job"],
+                          func=lambda: {(name,): job.overruns for name, job in scheduler.jobs.items()})
+    TICK_REGISTRY.counter("metrics_app_job_skipped_ticks_total", "Due job ticks dropped after an overrun.", ["job"],
+                          func=lambda: {(name,): job.skipped for name, job in scheduler.jobs.items()})
+    TICK_REGISTRY.gauge("metrics_app_file_writer_queue_depth", "Records waiting for the background file writer.",
+                        func=lambda: file_writer.stats()["queue_depth"])
+    if compactor is not None:
+        TICK_REGISTRY.counter("metrics_app_compacted_chunks_total", "Raw metrics log chunks compacted into rollups.",
+                              func=lambda: compactor.chunks_compacted)
+    if scraper is not None:
+        TICK_REGISTRY.gauge("metrics_app_scrape_target_up", "Whether the target answered the last scrape.", ["target"],
+                            func=lambda: {(url,): int(stats["up"]) for url, stats in scraper.stats().items()})
+        TICK_REGISTRY.gauge("metrics_app_scrape_duration_seconds", "Duration of the target's last scrape.", ["target"],
+                            func=lambda: {(url,): stats["last_duration"] for url, stats in scraper.stats().items()})
+
+def ticks_behind():
+    """Number of generation ticks due while the current one is still running."""
+    job = scheduler.jobs.get("generation")
+    if job is None or job.next_due is None:
+        return 0
+    return max(int((time.monotonic() - job.next_due) // job.interval), 0)
+
+def generate_metrics():
+    """Generate random metrics for each app."""
+    return metrics_generator.generate_dict()
+
+def log_exceedings(top_apps):
+    """Log the top apps exceeding the threshold to the exceedings_log.txt file."""
+    if WRITE_EXCEEDINGS_TO_FILE and isinstance(top_apps, list):  # Ensure top_apps is a list
+        timestamp = int(time.time())
+        data = {
+            "timestamp": timestamp,
+            "top_apps": top_apps
+        }
+        # Queue the record; the writer batches it and flushes per FILE_WRITER_DURABILITY
+        file_writer.write_json(EXCEEDINGS_FILE_PATH, data)
+
+def display_top_apps(top_apps):
+    """Display the top apps based on the configured DISPLAY_MODE."""
+    if DISPLAY_MODE in ["console", "both"]:
+        # Queued like every other log record; formatted by the listener thread, not here
+        exceedings_logger.info("Top %d apps exceeding threshold: %s", TOP_X_APPS, top_apps)
+
+    # Log the top apps to the exceedings_log.txt file
+    log_exceedings(top_apps)
+
+def generate_tick():
+    """Generate, store and process one tick of metrics and publish it to request handlers."""
+    rankings = None
+    if sharded_pipeline is not None:
+        # Shards generate and count their apps in parallel; only their partial top-Ks are merged here
+        rankings = sharded_pipeline.tick(THRESHOLD)
+        metrics_manager.store_values(sharded_pipeline.app_names, sharded_pipeline.values)
+    elif scraper is not None:
+        metrics = scraper.scrape()  # Samples of every target that answered in time
+        metrics_manager.store_metrics(metrics)
+        metrics_manager.store_series(scraper.series)
+        metrics_manager.process_metrics(metrics, THRESHOLD)
+    else:
+        if push_queue is not None:
+            from push import merge_batches, merge_series
+            batches = push_queue.drain()
+            app_names, values = merge_batches(batches)  # Everything pushed since the last tick
+            metrics_manager.store_series(merge_series(batches))
+        else:
+            # Draw the whole tick into the generator's reusable buffer
+            app_names = metrics_generator.app_names
+            values = metrics_generator.generate()
+        metrics_manager.store_values(app_names, values)
+        metrics_manager.process_values(app_names, values, THRESHOLD)
+    metrics_manager.process_series(THRESHOLD)  # Other scraped or pushed metrics, at their own thresholds
+    if serving and not METRICS_STREAMING:
+        metrics_manager.render_exposition()  # Render the /metrics body once per tick
+    internal_metrics = None
+    if INSTRUMENTATION_ENABLED and metrics_manager.snapshot_listeners:
+        internal_metrics = TICK_REGISTRY.render()  # Other processes serve it, so it travels with the snapshot
+    metrics_manager.publish_snapshot(rankings, internal_metrics)  # Hand the finished tick to request handlers in one swap
+    if DISPLAY_INTERVAL is None:
+        display_current_top_apps()
+    if checkpointer is not None:
+        checkpointer.maybe_save(time.monotonic())  # Captured here, between ticks, when the checkpoint job asked
+
+def display_current_top_apps():
+    """Display the top apps of the last published tick."""
+    display_top_apps(metrics_manager.get_top_exceedance_apps(TOP_X_APPS))
+
+def periodic_metrics_generation(max_iterations=None):
+    """Generate, store, and process metrics on fixed METRICS_INTERVAL boundaries."""
+    def tick():
+        generate_tick()
+        # Log the iteration message to the file handler only
+        logger.info("Iteration %d: Metrics processed and logged.", job.runs)
+
+    job = scheduler.add_job("generation", METRICS_INTERVAL, tick)
+    job.run(max_runs=max_iterations)  # Runs in the calling thread; errors are logged and the job carries on
+
+def start_background_jobs():
+    """Start the jobs that run at their own cadence next to metrics generation."""
+    names = []
+    if DISPLAY_INTERVAL is not None:
+        names.append(scheduler.add_job("display", DISPLAY_INTERVAL, display_current_top_apps).name)
+    if checkpointer is not None:
+        names.append(scheduler.add_job("checkpoint", CHECKPOINT_INTERVAL, checkpointer.request).name)
+    if compactor is not None:
+        names.append(scheduler.add_job("compaction", COMPACTION_INTERVAL, compactor.run).name)
+    scheduler.start(names)  # Generation runs in its own thread through periodic_metrics_generation
+
+def start_sharded_pipeline():
+    """Start the shard processes if SHARD_PROCESSES is set; call before any other thread starts."""
+    global sharded_pipeline
+    if SHARD_PROCESSES and INGESTION_MODE != "generate":
+        logger.warning("SHARD_PROCESSES only applies to generated metrics; it is ignored")
+    elif SHARD_PROCESSES and sharded_pipeline is None:
+        if metrics_manager.top_x_mode == "approximate":
+            logger.warning("SHARD_PROCESSES keeps exact per-app counts; the approximate TOP_X_MODE is ignored")
+        if metrics_manager.threshold_mode != "static":
+            logger.warning("SHARD_PROCESSES compares every app with THRESHOLD; THRESHOLD_MODE is ignored")
+        from sharding import ShardedPipeline
+        sharded_pipeline = ShardedPipeline()
+        sharded_pipeline.attach(metrics_manager)
+        atexit.register(sharded_pipeline.close)
+        logger.info("Started %d shard processes for %d apps", SHARD_PROCESSES, NUM_APPS)
+
+def run_generation_process(ticks=None):
+    """Run the tick loop as the single generator, behind a production server or headless.
+
+    With ticks, process that many ticks back to back and return instead of
+    ticking on METRICS_INTERVAL boundaries, as a batch job would.
+    """
+    start_sharded_pipeline()
+    try:
+        if ticks is None:
+            start_background_jobs()
+            periodic_metrics_generation()
+        for iteration in range(ticks or 0):
+            generate_tick()
+            logger.info("Iteration %d: Metrics processed and logged.", iteration)
+    finally:
+        if checkpointer is not None:
+            checkpointer.save()
+        if sharded_pipeline is not None:
+            sharded_pipeline.close()
+        file_writer.close()
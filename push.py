@@ -0,0 +1,317 @@
+"""Push ingestion: decode batches of samples sent to /api/v1/write.
+
+Two body formats are accepted. JSON lines carry one {"app": ..., "value": ...}
+object per line. Prometheus remote-write sends a snappy-compressed protobuf
+WriteRequest; the samples of SCRAPE_METRIC_NAME are read and keyed by their
+SCRAPE_APP_LABEL label. Each request is decoded into one (app_names, values)
+batch and queued for the next tick, so request threads never touch the
+manager.
+"""
+import json
+import queue
+import struct
+import multiprocessing
+from operator import itemgetter
+import numpy as np
+from config import SCRAPE_METRIC_NAME, SCRAPE_APP_LABEL, PUSH_QUEUE_SIZE, PUSH_MAX_DECODED_BYTES, HISTORY_VALUE_DTYPE
+
+try:
+    import snappy  # python-snappy, used when installed
+except ImportError:
+    snappy = None
+
+_DOUBLE = struct.Struct("<d")
+
+class PushDecodeError(ValueError):
+    """A pushed body could not be decoded."""
+
+def _check_values(values, dtype=HISTORY_VALUE_DTYPE):
+    """Raise PushDecodeError unless every value is finite and fits the history's dtype."""
+    if not np.isfinite(values).all():
+        raise PushDecodeError("Values must be finite numbers")
+    dtype = np.dtype(dtype)
+    if dtype.kind in "iu" and values.size:
+        info = np.iinfo(dtype)
+        if values.min() < info.min or values.max() >= info.max + 1:  # info.max itself rounds up to a float
+            raise PushDecodeError(f"Values must be between {info.min} and {info.max}")
+    return values
+
+def _varint(data, pos):
+    """Return the varint at pos and the position after it."""
+    result = shift = 0
+    while True:
+        if pos >= len(data):
+            raise PushDecodeError("Truncated varint")
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+        if shift > 63:
+            raise PushDecodeError("Varint too long")
+
+def snappy_decompress(data, max_length=PUSH_MAX_DECODED_BYTES):
+    """Decompress a snappy block, refusing output larger than its declared length or max_length."""
+    length, pos = _varint(data, 0)
+    if length > max_length:
+        raise PushDecodeError(f"Decompressed body of {length} bytes exceeds {max_length}")
+    if snappy is not None:
+        try:
+            return snappy.uncompress(bytes(data))
+        except Exception as e:
+            raise PushDecodeError(f"Invalid snappy data: {e}") from e
+
+    out = bytearray()
+    end = len(data)
+    while pos < end:
+        tag = data[pos]
+        pos += 1
+        kind = tag & 3
+        if kind == 0:  # Literal, length in the tag or the following 1-4 bytes
+            size = tag >> 2
+            if size >= 60:
+                extra = size - 59
+                size = int.from_bytes(data[pos:pos + extra], "little")
+                pos += extra
+            size += 1
+            if len(out) + size > length:
+                raise PushDecodeError("Snappy data exceeds its declared length")
+            out += data[pos:pos + size]
+            pos += size
+            continue
+        if kind == 1:  # Copy with an 11-bit offset
+            if pos >= end:
+                raise PushDecodeError("Truncated snappy copy")
+            size = ((tag >> 2) & 7) + 4
+            offset = ((tag >> 5) << 8) | data[pos]
+            pos += 1
+        else:  # Copy with a 2- or 4-byte offset
+            size = (tag >> 2) + 1
+            width = 2 if kind == 2 else 4
+            offset = int.from_bytes(data[pos:pos + width], "little")
+            pos += width
+        if offset == 0 or offset > len(out):
+            raise PushDecodeError("Invalid snappy copy offset")
+        if len(out) + size > length:  # Checked per element, so a small declared length bounds the work too
+            raise PushDecodeError("Snappy data exceeds its declared length")
+        start = len(out) - offset
+        if size <= offset:
+            out += out[start:start + size]
+        else:  # Overlapping copy repeats the last offset bytes
+            pattern = out[start:]
+            out += (pattern * (size // offset + 1))[:size]
+    if len(out) != length:
+        raise PushDecodeError("Snappy length mismatch")
+    return bytes(out)
+
+def _fields(data, start, end):
+    """Yield (field number, wire type, value) of a protobuf message; values of length-delimited fields are (start, end)."""
+    pos = start
+    while pos < end:
+        key, pos = _varint(data, pos)
+        field, wire = key >> 3, key & 7
+        if wire == 2:
+            size, pos = _varint(data, pos)
+            if pos + size > end:
+                raise PushDecodeError("Truncated protobuf field")
+            yield field, wire, (pos, pos + size)
+            pos += size
+        elif wire == 0:
+            value, pos = _varint(data, pos)
+            yield field, wire, value
+        elif wire == 1:
+            yield field, wire, pos
+            pos += 8
+        elif wire == 5:
+            pos += 4
+        else:
+            raise PushDecodeError(f"Unsupported protobuf wire type {wire}")
+
+def _skip_field(data, pos):
+    """Return the position after the field starting at pos."""
+    key, pos = _varint(data, pos)
+    wire = key & 7
+    if wire == 2:
+        size, pos = _varint(data, pos)
+        return pos + size
+    if wire == 0:
+        return _varint(data, pos)[1]
+    if wire in (1, 5):
+        return pos + (8 if wire == 1 else 4)
+    raise PushDecodeError(f"Unsupported protobuf wire type {wire}")
+
+def _length(data, pos):
+    """Return a length prefix at pos and the position after it, with a fast path for one byte."""
+    size = data[pos]
+    if size < 0x80:
+        return size, pos + 1
+    return _varint(data, pos)
+
+def _label(data, start, end):
+    """Return (name, value) of a Label message."""
+    if data[start] == 0x0A:  # Fast path: name then value, as every encoder writes them
+        size, pos = _length(data, start + 1)
+        name = data[pos:pos + size]
+        pos += size
+        if pos < end and data[pos] == 0x12:
+            size, pos = _length(data, pos + 1)
+            if pos + size == end:
+                return name, data[pos:pos + size]
+    name = value = b""
+    for field, _, (value_start, value_end) in _fields(data, start, end):
+        if field == 1:
+            name = data[value_start:value_end]
+        elif field == 2:
+            value = data[value_start:value_end]
+    return name, value
+
+def _sample(data, start, end):
+    """Return (value, timestamp) of a Sample message."""
+    if data[start] == 0x09 and start + 9 < end and data[start + 9] == 0x10:  # Fast path: value then timestamp
+        timestamp, pos = _varint(data, start + 10)
+        if pos == end:
+            return _DOUBLE.unpack_from(data, start + 1)[0], timestamp
+    value, timestamp = None, 0
+    for field, wire, field_value in _fields(data, start, end):
+        if field == 1 and wire == 1:
+            value = _DOUBLE.unpack_from(data, field_value)[0]
+        elif field == 2 and wire == 0:
+            timestamp = field_value
+    return value, timestamp
+
+def decode_remote_write(data, metric_name=SCRAPE_METRIC_NAME, app_label=SCRAPE_APP_LABEL, series=None):
+    """Decode an uncompressed remote-write WriteRequest into (app_names, values).
+
+    Only series named metric_name with an app_label label are kept, each with
+    its most recent sample; their values must pass _check_values. Given a series
+    dict, every other series is also added to it as {metric: (label sets,
+    values)}. Malformed bodies raise PushDecodeError.
+    """
+    try:
+        names, values = _decode_remote_write(bytes(data), metric_name, app_label, series)
+    except (UnicodeDecodeError, struct.error, IndexError) as e:
+        raise PushDecodeError(f"Invalid remote-write body: {e}") from e
+    return names, _check_values(values)
+
+def _decode_remote_write(data, metric_name, app_label, series):
+    metric_name = metric_name.encode()
+    app_label = app_label.encode()
+    names = []
+    values = []
+    for field, wire, (series_start, series_end) in _fields(data, 0, len(data)):
+        if field != 1 or wire != 2:
+            continue  # Only timeseries; metadata is ignored
+        name = app = value = latest = None
+        labels = [] if series is not None else None
+        pos = series_start
+        while pos < series_end:
+            key = data[pos]
+            if key not in (0x0A, 0x12):  # Neither a label nor a sample
+                pos = _skip_field(data, pos)
+                continue
+            size, start = _length(data, pos + 1)
+            pos = start + size
+            if pos > series_end:
+                raise PushDecodeError("Truncated protobuf field")
+            if key == 0x0A:
+                label_name, label_value = _label(data, start, pos)
+                if label_name == b"__name__":
+                    name = label_value
+                    continue
+                if label_name == app_label:
+                    app = label_value
+                if labels is not None:
+                    labels.append((label_name.decode("utf-8"), label_value.decode("utf-8")))
+            else:
+                sample_value, timestamp = _sample(data, start, pos)
+                if sample_value is not None and (latest is None or timestamp >= latest):
+                    value, latest = sample_value, timestamp
+        if value is None or value != value:  # No sample, or NaN
+            continue
+        if name == metric_name:
+            if app is not None:
+                names.append(app.decode("utf-8"))
+                values.append(value)
+        elif labels is not None and name:
+            label_sets, series_values = series.setdefault(name.decode("utf-8"), ([], []))
+            label_sets.append(tuple(sorted(labels)))
+            series_values.append(value)
+    return names, np.array(values, dtype=np.float64)
+
+def decode_json_lines(data):
+    """Decode one {"app": name, "value": number} object per line into (app_names, values)."""
+    lines = [line for line in data.split(b"\n") if line.strip()]
+    try:
+        samples = json.loads(b"[" + b",".join(lines) + b"]")  # One parse for the whole batch
+        names = list(map(itemgetter("app"), samples))
+        values = np.fromiter(map(itemgetter("value"), samples), dtype=np.float64, count=len(samples))
+    except (ValueError, KeyError, TypeError) as e:
+        raise PushDecodeError(f"Invalid JSON lines: {e}") from e
+    if not all(isinstance(name, str) for name in names):
+        raise PushDecodeError("App names must be strings")
+    return names, _check_values(values)  # json.loads accepts NaN and Infinity
+
+def decode_push(body, content_type, content_encoding, series=None):
+    """Decode a pushed body according to its Content-Type and Content-Encoding headers.
+
+    Remote-write series of other metrics are added to series when it is given.
+    """
+    if content_encoding == "snappy" or content_type == "application/x-protobuf":
+        if content_encoding == "snappy":
+            body = snappy_decompress(body)
+        return decode_remote_write(body, series=series)
+    if content_encoding:
+        raise PushDecodeError(f"Unsupported Content-Encoding: {content_encoding}")
+    return decode_json_lines(body)
+
+def merge_batches(batches):
+    """Concatenate queued batches into one tick; an app pushed more than once keeps its last value."""
+    if not batches:
+        return (), np.zeros(0)
+    names = [name for batch in batches for name in batch[0]]
+    values = np.concatenate([batch[1] for batch in batches])
+    positions = dict(zip(names, range(len(names))))  # Last position of each app, built without Python bytecode per sample
+    if len(positions) == len(names):
+        return tuple(names), values
+    keep = np.fromiter(positions.values(), dtype=np.intp, count=len(positions))
+    return tuple(positions), values[keep]
+
+def merge_series(batches):
+    """Concatenate the other-metric series of queued batches, in push order."""
+    merged = {}
+    for batch in batches:
+        for metric, (label_sets, values) in batch[2].items():
+            merged_label_sets, merged_values = merged.setdefault(metric, ([], []))
+            merged_label_sets.extend(label_sets)
+            merged_values.extend(values)
+    return merged
+
+class PushQueue:
+    """Bounded queue of decoded batches between request handlers and the tick.
+
+    With processes=True the queue is shared with forked processes, so
+    production workers can hand batches to the generator process.
+    """
+
+    def __init__(self, maxsize=PUSH_QUEUE_SIZE, processes=False):
+        self.maxsize = maxsize
+        self.processes = processes
+        self._queue = multiprocessing.get_context("fork").Queue(maxsize) if processes else queue.Queue(maxsize)
+
+    def put(self, app_names, values, series=None):
+        """Queue a batch; return False without blocking when the queue is full."""
+        try:
+            self._queue.put_nowait((app_names, values, series or {}))
+        except queue.Full:
+            return False
+        return True
+
+    def drain(self):
+        """Return every batch queued so far."""
+        batches = []
+        while True:
+            try:
+                batches.append(self._queue.get_nowait())
+            except queue.Empty:
+                return batches
@@ -0,0 +1,249 @@
+"""Tiered retention of the metrics log files.
+
+Raw ticks stay on disk for RETENTION_RAW_SECONDS. The JSON log is rotated
+into chunk files every RETENTION_CHUNK_SECONDS (columnar segments already are
+chunks); once a chunk is older than the raw retention, a background job folds
+its ticks into every RETENTION_TIERS tier, one rollup file per tier holding
+the min, max, sum and count of each app per bucket, and deletes the chunk.
+Rollup files are deleted in turn once their tier's retention has passed.
+"""
+import os
+import re
+import json
+import time
+import logging
+import numpy as np
+from config import RETENTION_RAW_SECONDS, RETENTION_CHUNK_SECONDS, RETENTION_TIERS, RETENTION_DIR, COMPACTION_MAX_BYTES
+from columnar_log import Segment, segment_paths, missing_value
+from metrics_history import AppIndex
+from rollups import Rollup, empty_stats
+
+logger = logging.getLogger("app.retention")
+
+ROLLUP_PATTERN = re.compile(r"^rollup-(\d+)-(\d+)(?:-\d+)?\.npz$")
+
+def chunk_pattern(metrics_file):
+    """Pattern of the chunks rotated out of metrics_file, e.g. metrics_log.1700000000.txt."""
+    root, ext = os.path.splitext(os.path.basename(metrics_file))
+    return re.compile(rf"^{re.escape(root)}\.(\d+){re.escape(ext)}$")
+
+def json_chunk_paths(metrics_file):
+    """Return (rotation time, path) of the chunks rotated out of metrics_file, oldest first."""
+    directory = os.path.dirname(metrics_file) or "."
+    if not os.path.isdir(directory):
+        return []
+    pattern = chunk_pattern(metrics_file)
+    chunks = [(int(match.group(1)), os.path.join(directory, name))
+              for name, match in ((name, pattern.match(name)) for name in os.listdir(directory)) if match]
+    return sorted(chunks)
+
+def read_json_ticks(path):
+    """Yield (timestamp, {app: value}) from a JSON-lines log, skipping a partially written line."""
+    with open(path, "rb") as file:
+        for line in file:
+            try:
+                data = json.loads(line)
+            except ValueError:
+                continue
+            yield data["timestamp"], data["metrics"]
+
+def read_segment_ticks(segment):
+    """Yield (timestamp, app columns, values) of a columnar segment, without the missing-value sentinels."""
+    sentinel = missing_value(segment.dtype)
+    columns = np.arange(len(segment.app_names))
+    for timestamp, row in zip(segment.timestamps.tolist(), segment.values):
+        present = ~np.isnan(row) if segment.dtype.kind == "f" else row != sentinel
+        if present.all():
+            yield timestamp, columns, row
+        else:
+            yield timestamp, columns[present], row[present]
+
+def load_rollup(path):
+    """Return (app_names, bucket starts, (buckets, 4, apps) statistics) of a rollup file."""
+    with np.load(path) as data:
+        return data["app_names"].tolist(), data["starts"], data["stats"]
+
+def rollup_paths(directory, tier):
+    """Return (first bucket, last bucket, path) of a tier's rollup files, oldest first."""
+    tier_directory = os.path.join(directory, tier)
+    if not os.path.isdir(tier_directory):
+        return []
+    files = [(int(match.group(1)), int(match.group(2)), os.path.join(tier_directory, name))
+             for name, match in ((name, ROLLUP_PATTERN.match(name)) for name in os.listdir(tier_directory)) if match]
+    return sorted(files)
+
+class RollupArchive:
+    """Read access to the rollup files of every tier, for range queries older than the in-memory history."""
+
+    def __init__(self, directory=RETENTION_DIR, tiers=RETENTION_TIERS):
+        self.directory = directory
+        self.tiers = tiers  # Name -> (bucket seconds, seconds kept)
+
+    def stats(self, app_names, lo, hi, step):
+        """Return (tier, bucket starts, (buckets, 4, len(app_names)) statistics) of the buckets starting in [lo, hi).
+
+        The coarsest tier whose buckets fit in a step and whose files reach
+        back to lo is read; otherwise the tier reaching back furthest. Returns
+        None when no tier has a file in the range.
+        """
+        by_resolution = sorted(self.tiers.items(), key=lambda tier: -tier[1][0])
+        fitting = [name for name, (resolution, _) in by_resolution if resolution <= step and step % resolution == 0]
+        names = fitting + [name for name, _ in reversed(by_resolution) if name not in fitting]
+        chosen = None
+        for name in names:
+            files = [(first, path) for first, last, path in rollup_paths(self.directory, name)
+                     if last >= lo and first < hi]
+            if files and files[0][0] <= lo:
+                chosen = (name, files)
+                break
+            if files and (chosen is None or files[0][0] < chosen[1][0][0]):
+                chosen = (name, files)
+        if chosen is None:
+            return None
+        name, files = chosen
+
+        starts_parts, stats_parts = [], []
+        for _, path in files:
+            file_names, starts, stats = load_rollup(path)
+            rows = (starts >= lo) & (starts < hi)
+            positions = dict(zip(file_names, range(len(file_names))))
+            known = [(column, positions[app]) for column, app in enumerate(app_names) if app in positions]
+            selected = empty_stats(int(rows.sum()), len(app_names))
+            if known:
+                columns, file_columns = (list(part) for part in zip(*known))
+                selected[:, :, columns] = stats[rows][:, :, file_columns]
+            starts_parts.append(starts[rows])
+            stats_parts.append(selected)
+        starts = np.concatenate(starts_parts)
+        order = np.argsort(starts, kind="stable")  # Files of two chunks may share buckets; downsample merges them
+        return name, starts[order], np.concatenate(stats_parts)[order]
+
+class Compactor:
+    """Rotate, compact and expire the metrics log files of a MetricsManager.
+
+    run() is meant for a scheduler job on its own thread: it reads only
+    chunks the manager no longer appends to, at most max_bytes of them per
+    run (always at least one), and leaves the rest for the next run.
+    """
+
+    def __init__(self, manager, raw_seconds=RETENTION_RAW_SECONDS, chunk_seconds=RETENTION_CHUNK_SECONDS,
+                 tiers=RETENTION_TIERS, directory=RETENTION_DIR, max_bytes=COMPACTION_MAX_BYTES):
+        self.manager = manager
+        self.raw_seconds = raw_seconds
+        self.chunk_seconds = chunk_seconds
+        self.tiers = tiers  # Name -> (bucket seconds, seconds kept)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.chunks_compacted = 0
+        self.files_expired = 0
+        self.bytes_read = 0
+        self.archive = RollupArchive(directory, tiers)  # Serves range queries from the files written here
+
+    def run(self, now=None):
+        """Rotate the JSON log if due, compact expired raw chunks and expire old rollup files."""
+        now = time.time() if now is None else now
+        if self.manager.columnar_log is None:
+            self.rotate(now)
+        budget = self.max_bytes
+        for newest, path in self.expired_chunks(now):
+            if budget <= 0:
+                break  # Bounded I/O per run; the remaining chunks wait for the next one
+            size = os.path.getsize(path)
+            self.compact(path)
+            budget -= size
+            self.bytes_read += size
+        self.expire_rollups(now)
+
+    def rotate(self, now):
+        """Move the JSON log aside as a chunk once its first tick is chunk_seconds old."""
+        path = self.manager.metrics_file
+        first = self._first_timestamp(path)
+        if first is None or now - first < self.chunk_seconds:
+            return None
+        root, ext = os.path.splitext(path)
+        chunk = f"{root}.{int(now)}{ext}"
+        os.replace(path, chunk)
+        # The writer's open handle still points at the chunk: pending records land there, the next ones in a new log
+        self.manager.writer.release(path)
+        return chunk
+
+    def expired_chunks(self, now):
+        """Return (newest tick, path) of the raw chunks older than the raw retention, oldest first."""
+        cutoff = now - self.raw_seconds
+        log = self.manager.columnar_log
+        if log is None:
+            return [(rotated, path) for rotated, path in json_chunk_paths(self.manager.metrics_file) if rotated < cutoff]
+        chunks = []
+        for path in segment_paths(log.directory):
+            if path == log.path:
+                break  # Still being appended to, as is anything after it
+            try:
+                segment = Segment(path)
+            except (ValueError, OSError):
+                continue
+            newest = int(segment.timestamps[-1]) if len(segment) else 0
+            del segment  # Release the memory map
+            if newest < cutoff:
+                chunks.append((newest, path))
+        return chunks
+
+    def compact(self, path):
+        """Fold the ticks of one raw chunk into every tier, then delete the chunk."""
+        app_index = AppIndex()
+        rollups = {name: Rollup(resolution, 1 << 30, app_index) for name, (resolution, _) in self.tiers.items()}
+        if self.manager.columnar_log is None:
+            for timestamp, metrics in read_json_ticks(path):
+                columns = app_index.columns(metrics.keys())
+                values = np.fromiter(metrics.values(), dtype=np.float64, count=len(metrics))
+                for rollup in rollups.values():
+                    rollup.add(timestamp, columns, values)
+        else:
+            segment = Segment(path)
+            app_index.columns(segment.app_names)
+            for timestamp, columns, values in read_segment_ticks(segment):
+                for rollup in rollups.values():
+                    rollup.add(timestamp, columns, values)
+            del segment
+        for name, rollup in rollups.items():
+            if len(rollup):
+                self._write_rollup(name, app_index.names, rollup)
+        self.manager.writer.release(path)  # Close any handle the writer kept before removing the file
+        os.remove(path)
+        self.chunks_compacted += 1
+        logger.info("Compacted %s into %s rollups", path, ", ".join(rollups))
+
+    def expire_rollups(self, now):
+        """Delete rollup files whose last bucket ended before their tier's retention."""
+        for name, (resolution, keep) in self.tiers.items():
+            for first, last, path in rollup_paths(self.directory, name):
+                if last + resolution <= now - keep:
+                    os.remove(path)
+                    self.files_expired += 1
+
+    def stats(self):
+        return {"chunks_compacted": self.chunks_compacted, "files_expired": self.files_expired,
+                "bytes_read": self.bytes_read}
+
+    def _write_rollup(self, tier, app_names, rollup):
+        starts, stats = rollup.stats(-np.inf, np.inf, np.arange(len(app_names)))
+        tier_directory = os.path.join(self.directory, tier)
+        os.makedirs(tier_directory, exist_ok=True)
+        path = os.path.join(tier_directory, f"rollup-{starts[0]}-{starts[-1]}.npz")
+        if os.path.exists(path):
+            path = path[:-len(".npz")] + f"-{int(time.time() * 1000)}.npz"  # Two chunks sharing their buckets
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "wb") as file:
+            np.savez(file, app_names=np.array(app_names, dtype=str), starts=starts, stats=stats)
+        os.replace(temp_path, path)
+
+    @staticmethod
+    def _first_timestamp(path):
+        try:
+            with open(path, "rb") as file:
+                line = file.readline()
+        except OSError:
+            return None
+        try:
+            return json.loads(line)["timestamp"]
+        except (ValueError, KeyError, TypeError):
+            return None
@@ -0,0 +1,158 @@
+"""Downsampled rollups of the metrics history for long range queries.
+
+A rollup keeps the minimum, maximum, sum and count of every app's values per
+fixed time bucket, e.g. one minute or one hour. A range query with a coarse
+step then reads one row per bucket instead of every stored tick, and the rows
+it needs are found by binary search on their start times.
+"""
+from bisect import bisect_left
+import numpy as np
+
+MIN, MAX, SUM, COUNT = range(4)  # Rows of the statistics kept per bucket
+AGGREGATIONS = ("avg", "min", "max", "sum", "count")
+
+def empty_stats(*shape):
+    """Statistics of no values (min +inf, max -inf, sum and count 0) shaped (..., 4, apps)."""
+    stats = np.zeros(shape[:-1] + (4, shape[-1]))
+    stats[..., MIN, :] = np.inf
+    stats[..., MAX, :] = -np.inf
+    return stats
+
+def ring_rows(timestamps, start, size, lo, hi):
+    """Return the physical rows of a ring buffer whose timestamps lie in [lo, hi), oldest first.
+
+    The size entries from row start onwards (wrapping around) must be sorted
+    by timestamp; each contiguous part is searched in O(log n).
+    """
+    capacity = len(timestamps)
+    parts = []
+    for first, last in ((start, min(start + size, capacity)), (0, max(start + size - capacity, 0))):
+        if first < last:
+            segment = timestamps[first:last]
+            lo_row, hi_row = np.searchsorted(segment, (lo, hi))
+            parts.append(np.arange(first + lo_row, first + hi_row))
+    if not parts:
+        return np.zeros(0, dtype=np.intp)
+    return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+class Rollup:
+    """Min, max, sum and count per app over buckets of resolution seconds, keeping the newest max_buckets.
+
+    Buckets are allocated as ticks reach them, so a rollup costs memory only
+    for the time it has actually seen.
+    """
+
+    def __init__(self, resolution, max_buckets, app_index):
+        if resolution < 1 or max_buckets < 1:
+            raise ValueError("Rollups need a resolution and a bucket count of at least 1")
+        self.resolution = int(resolution)
+        self.max_buckets = max_buckets
+        self.app_index = app_index
+        self._starts = []  # Bucket start times, ascending
+        self._buckets = []  # (4, apps) statistics per bucket; only the newest grows with the app index
+        self._last_columns = None
+        self._last_target = None
+
+    def __len__(self):
+        return len(self._starts)
+
+    @property
+    def oldest(self):
+        """Start of the oldest kept bucket, or None when empty."""
+        return self._starts[0] if self._starts else None
+
+    @property
+    def nbytes(self):
+        return sum(bucket.nbytes for bucket in self._buckets)
+
+    def add(self, timestamp, columns, values):
+        """Fold one tick of values, already resolved to app columns, into its bucket."""
+        start = int(timestamp) - int(timestamp) % self.resolution
+        if not self._starts or start > self._starts[-1]:
+            if len(self._starts) == self.max_buckets:
+                del self._starts[0]
+                del self._buckets[0]
+            self._starts.append(start)
+            self._buckets.append(empty_stats(max(len(self.app_index), 1)))
+            index = len(self._starts) - 1
+        else:
+            index = bisect_left(self._starts, start)
+            if index == len(self._starts) or self._starts[index] != start:
+                return  # Older than every kept bucket
+        bucket = self._buckets[index]
+        width = len(self.app_index)
+        if bucket.shape[1] < width:
+            grown = empty_stats(max(width, bucket.shape[1] * 2))
+            grown[:, :bucket.shape[1]] = bucket
+            bucket = self._buckets[index] = grown
+        values = np.asarray(values, dtype=np.float64)
+        target = self._target(columns)
+        if isinstance(target, slice):  # Every app in column order: update the rows in place
+            np.minimum(bucket[MIN, target], values, out=bucket[MIN, target])
+            np.maximum(bucket[MAX, target], values, out=bucket[MAX, target])
+            bucket[SUM, target] += values
+            bucket[COUNT, target] += 1
+        else:
+            bucket[MIN, target] = np.minimum(bucket[MIN, target], values)
+            bucket[MAX, target] = np.maximum(bucket[MAX, target], values)
+            bucket[SUM, target] += values
+            bucket[COUNT, target] += 1
+
+    def _target(self, columns):
+        """Return a slice when columns are 0..n-1 in order, which is the common tick layout, else columns."""
+        if columns is not self._last_columns:
+            dense = len(columns) and columns[0] == 0 and columns[-1] == len(columns) - 1 and (
+                np.array_equal(columns, np.arange(len(columns))))
+            self._last_columns = columns
+            self._last_target = slice(0, len(columns)) if dense else columns
+        return self._last_target
+
+    def stats(self, lo, hi, columns):
+        """Return (bucket starts, (buckets, 4, len(columns)) statistics) of the buckets starting in [lo, hi)."""
+        first = bisect_left(self._starts, lo)
+        last = bisect_left(self._starts, hi)
+        stats = empty_stats(last - first, len(columns))
+        for row, bucket in enumerate(self._buckets[first:last]):
+            known = columns < bucket.shape[1]  # Apps registered after the bucket was filled have no values in it
+            stats[row][:, known] = bucket[:, columns[known]]
+        return np.array(self._starts[first:last], dtype=np.int64), stats
+
+    def clear(self):
+        self._starts = []
+        self._buckets = []
+
+def downsample(timestamps, stats, start, step):
+    """Merge ascending rows of statistics into consecutive buckets of step seconds from start.
+
+    Returns the start of every bucket holding at least one row and the merged
+    (buckets, 4, apps) statistics.
+    """
+    if not len(timestamps):
+        return np.zeros(0, dtype=np.int64), empty_stats(0, stats.shape[-1])
+    buckets = (timestamps - start) // step
+    firsts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])  # First row of each non-empty bucket
+    merged = np.empty((len(firsts),) + stats.shape[1:])
+    merged[:, MIN] = np.minimum.reduceat(stats[:, MIN], firsts, axis=0)
+    merged[:, MAX] = np.maximum.reduceat(stats[:, MAX], firsts, axis=0)
+    merged[:, SUM] = np.add.reduceat(stats[:, SUM], firsts, axis=0)
+    merged[:, COUNT] = np.add.reduceat(stats[:, COUNT], firsts, axis=0)
+    return start + buckets[firsts] * step, merged
+
+def aggregate(stats, aggregation):
+    """Return one value per bucket and app for aggregation, NaN where a bucket holds no value of the app."""
+    counts = stats[:, COUNT]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        if aggregation == "avg":
+            values = stats[:, SUM] / counts
+        elif aggregation == "min":
+            values = stats[:, MIN].copy()
+        elif aggregation == "max":
+            values = stats[:, MAX].copy()
+        elif aggregation == "sum":
+            values = stats[:, SUM].copy()
+        elif aggregation == "count":
+            values = counts.copy()
+        else:
+            raise ValueError(f"Unknown aggregation '{aggregation}'. Available: {', '.join(AGGREGATIONS)}")
+    values[counts == 0] = np.nan
+    return values
@@ -0,0 +1,127 @@
+import time
+import logging
+import threading
+from config import SCHEDULER_OVERRUN_POLICY, SCHEDULER_MAX_CATCH_UP
+
+logger = logging.getLogger("app.scheduler")
+
+OVERRUN_POLICIES = ("skip", "catch_up")
+
+class Job:
+    """A function run every interval seconds on fixed wall-clock boundaries.
+
+    Due times advance by exactly one interval on the monotonic clock, so they
+    never drift with run time or wall clock adjustments; the first boundary is
+    aligned to a multiple of interval in wall-clock time. A run that ends after
+    the next run was due counts as an overrun: with "skip" the missed ticks are
+    dropped and the job waits for the next boundary, with "catch_up" up to
+    max_catch_up of them run back to back.
+    """
+
+    def __init__(self, name, interval, func, overrun=SCHEDULER_OVERRUN_POLICY, max_catch_up=SCHEDULER_MAX_CATCH_UP):
+        if overrun not in OVERRUN_POLICIES:
+            raise ValueError(f"Unknown overrun policy: {overrun}")
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self.overrun = overrun
+        self.max_catch_up = max_catch_up
+        self.next_due = None  # Monotonic time of the next run
+        self.runs = 0
+        self.overruns = 0  # Runs that ended after the next run was due
+        self.skipped = 0  # Due ticks that were dropped instead of run
+        self.errors = 0
+        self.last_duration = 0.0
+        self.max_duration = 0.0
+
+    def run_once(self):
+        """Run the job now, schedule the next boundary and return the delay until it."""
+        start = time.monotonic()
+        try:
+            self.func()
+        except Exception as e:
+            self.errors += 1
+            logger.error("Error in %s job: %s", self.name, e, exc_info=True)
+        now = time.monotonic()
+        self.runs += 1
+        self.last_duration = now - start
+        self.max_duration = max(self.max_duration, self.last_duration)
+        self._schedule(now)
+        return max(self.next_due - time.monotonic(), 0)
+
+    def run(self, max_runs=None, stop=None):
+        """Run on every boundary until max_runs runs were made or stop is set.
+
+        Failed runs are logged and the job still waits only for its next boundary.
+        """
+        runs = 0
+        while max_runs is None or runs < max_runs:
+            if stop is not None and stop.is_set():
+                break
+            delay = self.run_once()
+            runs += 1
+            if stop is None:
+                time.sleep(delay)
+            else:
+                stop.wait(delay)
+
+    def stats(self):
+        """Return run, overrun and duration figures for monitoring."""
+        return {
+            "interval": self.interval,
+            "runs": self.runs,
+            "overruns": self.overruns,
+            "skipped": self.skipped,
+            "errors": self.errors,
+            "last_duration": self.last_duration,
+            "max_duration": self.max_duration,
+        }
+
+    def _schedule(self, now):
+        if self.next_due is None:
+            self.next_due = now + self.interval - time.time() % self.interval  # Next wall-clock boundary
+            return
+        self.next_due += self.interval
+        if now <= self.next_due:
+            return
+
+        self.overruns += 1
+        missed = int((now - self.next_due) // self.interval) + 1  # Due times that already passed
+        dropped = missed if self.overrun == "skip" else max(missed - self.max_catch_up, 0)
+        self.next_due += dropped * self.interval
+        self.skipped += dropped
+        logger.warning("%s job overran its %ss interval (%.3fs run, %d ticks skipped)",
+                       self.name, self.interval, self.last_duration, dropped)
+
+class Scheduler:
+    """Independent periodic jobs, each running on its own thread."""
+
+    def __init__(self):
+        self.jobs = {}  # Name -> Job
+        self._threads = {}  # Name -> thread of started jobs
+        self._stop = threading.Event()
+
+    def add_job(self, name, interval, func, overrun=SCHEDULER_OVERRUN_POLICY, max_catch_up=SCHEDULER_MAX_CATCH_UP):
+        """Register a job; it replaces any job registered under the same name."""
+        job = Job(name, interval, func, overrun, max_catch_up)
+        self.jobs[name] = job
+        return job
+
+    def start(self, names=None):
+        """Start the named jobs, or every registered job, on daemon threads unless already running."""
+        for name, job in self.jobs.items():
+            if name not in self._threads and (names is None or name in names):
+                thread = threading.Thread(target=job.run, kwargs={"stop": self._stop}, name=f"job-{name}", daemon=True)
+                thread.start()
+                self._threads[name] = thread
+
+    def stop(self, timeout=None):
+        """Stop the started jobs after their current run."""
+        self._stop.set()
+        for thread in self._threads.values():
+            thread.join(timeout)
+        self._threads = {}
+        self._stop = threading.Event()
+
+    def stats(self):
+        return {name: job.stats() for name, job in self.jobs.items()}
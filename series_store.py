@@ -0,0 +1,411 @@
+"""Multi-metric series model: interned label sets, per-metric columns and a label index.
+
+A series is a metric name plus a set of labels. Each distinct series gets an
+integer ID once; its metric keeps the latest value and the exceedance count
+of every series in one column per series. An inverted index maps each
+(label, value) pair to the ascending IDs of the series carrying it, so a
+selector such as bigquery_written_bytes{region="eu",app_name=~"etl-.*"} is
+answered from the postings of its labels instead of a scan of every series.
+METRIC_NAME is not stored here: its values and exceedance counts are already
+kept per app column, so a view reads them through LabelledSeries instead.
+"""
+import re
+from bisect import bisect_left
+import numpy as np
+from exceedance import top_k
+
+MATCH_OPERATORS = ("=", "!=", "=~", "!~")
+
+_SELECTOR = re.compile(r'\s*([a-zA-Z_:][a-zA-Z0-9_:]*)?\s*(?:\{(.*)\})?\s*$', re.S)
+_MATCHER = re.compile(r'\s*([a-zA-Z_][a-zA-Z0-9_]*)\s*(=~|!~|!=|=)\s*"((?:[^"\\]|\\.)*)"\s*(?:,|$)')
+_UNESCAPE = re.compile(r'\\(.)')
+
+def _unescape(value):
+    return _UNESCAPE.sub(lambda match: "\n" if match.group(1) == "n" else match.group(1), value)
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def parse_selector(text):
+    """Parse a selector like name{label="value",other=~"regex"} into (metric name or None, matchers).
+
+    Each matcher is a (label, operator, value) tuple; __name__ matchers select
+    metric names like any other label.
+    """
+    match = _SELECTOR.match(text)
+    if match is None or not (match.group(1) or match.group(2) is not None):
+        raise ValueError(f"Invalid selector: {text!r}")
+    metric, body = match.group(1), match.group(2) or ""
+    matchers = []
+    pos = 0
+    while pos < len(body) and body[pos:].strip():
+        matcher = _MATCHER.match(body, pos)
+        if matcher is None:
+            raise ValueError(f"Invalid label matcher in selector: {text!r}")
+        name, operator, value = matcher.groups()
+        value = _unescape(value)
+        if operator in ("=~", "!~"):
+            try:
+                re.compile(value)
+            except re.error as e:
+                raise ValueError(f"Invalid regular expression {value!r}: {e}") from None
+        matchers.append((name, operator, value))
+        pos = matcher.end()
+    return metric, matchers
+
+def _predicate(operator, value):
+    """Return a function telling whether a label value satisfies the matcher (operator, value)."""
+    if operator == "=":
+        return lambda actual: actual == value
+    if operator == "!=":
+        return lambda actual: actual != value
+    if operator in ("=~", "!~"):
+        regex = re.compile(value)
+        if operator == "=~":
+            return lambda actual: regex.fullmatch(actual) is not None
+        return lambda actual: regex.fullmatch(actual) is None
+    raise ValueError(f"Unknown matcher operator: {operator}")
+
+def series_name(metric, labels):
+    """Format a series as it appears in the exposition: metric{label="value",...}."""
+    if not labels:
+        return metric
+    return metric + "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+class _MetricColumns:
+    """Columns of one metric: the series ID, latest value and exceedance count of each of its series."""
+
+    def __init__(self, name, code):
+        self.name = name
+        self.code = code  # Position in SeriesStore.metric_names
+        self.series = []  # Series ID of each column, append-only
+        # Arrays are replaced rather than modified, so a published view keeps a consistent tick
+        self.values = np.zeros(0)  # Latest values, NaN where a series was not reported in the last tick
+        self.counts = np.zeros(0, dtype=np.int64)  # Threshold exceedances per column
+        self.pending = False  # Values were stored since the last process()
+        self._last_keys = None
+        self._last_columns = None
+
+class _GrowableArray:
+    """Append-only integer array; positions below any published length are never rewritten."""
+
+    def __init__(self, dtype):
+        self.array = np.zeros(1024, dtype=dtype)
+        self.size = 0
+
+    def append(self, value):
+        if self.size == len(self.array):
+            grown = np.zeros(len(self.array) * 2, dtype=self.array.dtype)
+            grown[:self.size] = self.array
+            self.array = grown  # Readers holding the old array still see every series they know of
+        self.array[self.size] = value
+        self.size += 1
+
+class LabelledSeries:
+    """Series of one metric that each carry a single label, read from per-column arrays kept elsewhere.
+
+    names holds the label value of each column and positions maps a value to
+    its column. latest_names and values are the last tick's samples, and
+    counts the exceedance count of each column, as an array or the
+    SketchSummary of an approximate counter.
+    """
+
+    def __init__(self, metric, label, names, latest_names, values, counts, positions=None):
+        self.metric = metric
+        self.label = label
+        self.names = names
+        self.latest_names = latest_names
+        self.latest_values = values
+        self.exceedances = counts
+        self._positions = positions  # Label value -> column; may list columns added after names was taken
+        self._values = None  # Latest value per column, built on first use
+
+    def __reduce__(self):
+        # The positions are rebuilt from names when needed, rather than pickled for every tick
+        return (type(self), (self.metric, self.label, self.names, self.latest_names, self.latest_values,
+                             self.exceedances))
+
+    def __len__(self):
+        return len(self.names)
+
+    @property
+    def positions(self):
+        if self._positions is None:
+            self._positions = {name: column for column, name in enumerate(self.names)}
+        return self._positions
+
+    def name(self, column):
+        return series_name(self.metric, ((self.label, self.names[column]),))
+
+    def select(self, matchers):
+        """Return the ascending columns whose series match every (label, operator, value) matcher."""
+        count = len(self.names)
+        columns = None  # Every column, until a matcher narrows them down
+        for label, operator, value in sorted(matchers, key=lambda matcher: matcher[1] != "="):  # Equality first
+            if label != self.label:
+                # The metric name, or a label these series do not carry and so read as ""
+                if not _predicate(operator, value)(self.metric if label == "__name__" else ""):
+                    return np.zeros(0, dtype=np.intp)
+            elif operator == "=" and columns is None:
+                column = self.positions.get(value)
+                columns = np.array([column] if column is not None and column < count else [], dtype=np.intp)
+            else:
+                if columns is None:
+                    columns = np.arange(count, dtype=np.intp)
+                matches, names = _predicate(operator, value), self.names
+                columns = columns[np.array([matches(names[c]) for c in columns.tolist()], dtype=bool)]
+        return np.arange(count, dtype=np.intp) if columns is None else columns
+
+    def values(self, columns):
+        """Latest value of each column, NaN when its app did not report in the last tick."""
+        if self._values is None:
+            values = np.full(len(self.names), np.nan)
+            reported = len(self.latest_names)
+            if self.latest_names == self.names[:reported]:  # Every app up to the newest, in column order
+                values[:reported] = self.latest_values
+            else:
+                positions = self.positions
+                values[[positions[name] for name in self.latest_names]] = self.latest_values
+            self._values = values
+        return self._values[columns]
+
+    def counts(self, columns):
+        counts = self.exceedances
+        out = np.zeros(len(columns), dtype=np.int64)
+        if isinstance(counts, np.ndarray):
+            known = columns < len(counts)
+            out[known] = counts[columns[known]]
+        elif len(counts.columns):  # Only the apps an approximate counter monitors have a count
+            index = np.minimum(np.searchsorted(counts.columns, columns), len(counts.columns) - 1)
+            monitored = counts.columns[index] == columns
+            out[monitored] = counts.counts[index[monitored]]
+        return out
+
+class SeriesView:
+    """Read-only view of a SeriesStore as of one publish, safe to query from request threads.
+
+    The store only ever appends to the lists and postings the view refers to,
+    so bounding every lookup by the series count at publish time gives a
+    consistent picture without copying the label index. The series of a
+    LabelledSeries, when given, take the first IDs and the stored series
+    follow them.
+    """
+
+    def __init__(self, size, names, metric_names, series_metric, series_column, postings, label_values, columns,
+                 labelled=None):
+        self.size = size
+        self.names = names  # Formatted name per stored series
+        self.metric_names = metric_names
+        self.series_metric = series_metric  # Metric code per stored series
+        self.series_column = series_column  # Column within its metric per stored series
+        self.postings = postings  # (label, value) -> ascending stored series
+        self.label_values = label_values  # Label -> {value: None}
+        self.columns = columns  # Metric name -> (values, counts) of the published tick
+        self.labelled = labelled
+        self.offset = len(labelled) if labelled is not None else 0  # ID of the first stored series
+
+    def name(self, series_id):
+        """Formatted name of a series, as in the exposition."""
+        if series_id < self.offset:
+            return self.labelled.name(series_id)
+        return self.names[series_id - self.offset]
+
+    def _posting(self, label, value):
+        ids = self.postings.get((label, value))
+        if not ids:
+            return np.zeros(0, dtype=np.intp)
+        return np.array(ids[:bisect_left(ids, self.size)], dtype=np.intp)
+
+    def _matching(self, label, pattern):
+        """IDs of series whose label value fully matches pattern, looked up per distinct value."""
+        regex = re.compile(pattern)
+        values = tuple(self.label_values.get(label, ()))  # Copied in C, so concurrent inserts are harmless
+        parts = [self._posting(label, value) for value in values if regex.fullmatch(value)]
+        return np.unique(np.concatenate(parts)) if parts else np.zeros(0, dtype=np.intp)
+
+    def _with_label(self, label):
+        return self._matching(label, ".+")
+
+    def select(self, metric=None, matchers=()):
+        """Return the ascending IDs of series matching the metric name and every matcher."""
+        matchers = list(matchers)
+        if metric is not None:
+            matchers.insert(0, ("__name__", "=", metric))
+        selected = self._select_stored(matchers) + self.offset
+        if self.labelled is not None:
+            selected = np.concatenate([self.labelled.select(matchers), selected])
+        return selected
+
+    def _select_stored(self, matchers):
+        include = []
+        exclude = []
+        for label, operator, value in matchers:
+            if operator == "=":
+                include.append(self._posting(label, value) if value else None)
+                if not value:
+                    exclude.append(self._with_label(label))  # label="" selects series without the label
+            elif operator == "=~":
+                if re.fullmatch(value, ""):
+                    exclude.append(self._matching(label, f"(?!(?:{value})\\Z).*"))  # Values not matching
+                else:
+                    include.append(self._matching(label, value))
+            elif operator == "!=":
+                exclude.append(self._posting(label, value) if value else None)
+                if not value:
+                    include.append(self._with_label(label))
+            elif operator == "!~":
+                exclude.append(self._matching(label, value))
+            else:
+                raise ValueError(f"Unknown matcher operator: {operator}")
+        include = sorted((ids for ids in include if ids is not None), key=len)  # Smallest postings first
+        if include:
+            selected = include[0]
+            for ids in include[1:]:
+                if not len(selected):
+                    break
+                selected = np.intersect1d(selected, ids, assume_unique=True)
+        else:
+            selected = np.arange(self.size, dtype=np.intp)
+        for ids in exclude:
+            if ids is not None and len(selected):
+                selected = np.setdiff1d(selected, ids, assume_unique=True)
+        return selected
+
+    def _gather(self, ids, field):
+        """Return the values (field 0) or counts (field 1) of the series ids."""
+        out = np.zeros(len(ids), dtype=np.float64 if field == 0 else np.int64)
+        if field == 0:
+            out[:] = np.nan
+        labelled = ids < self.offset
+        if labelled.any():
+            out[labelled] = (self.labelled.values if field == 0 else self.labelled.counts)(ids[labelled])
+            stored = ~labelled
+            out[stored] = self._gather(ids[stored], field)
+            return out
+        ids = ids - self.offset
+        codes = self.series_metric[ids]
+        columns = self.series_column[ids]
+        for code in np.unique(codes):
+            mask = codes == code
+            data = self.columns[self.metric_names[code]][field]
+            cols = columns[mask]
+            known = cols < len(data)  # Series added after the metric's last tick have no data yet
+            part = out[mask]
+            part[known] = data[cols[known]]
+            out[mask] = part
+        return out
+
+    def values(self, ids):
+        """Latest value of each series, NaN when it was not reported in the last tick."""
+        return self._gather(ids, 0)
+
+    def counts(self, ids):
+        return self._gather(ids, 1)
+
+    def render(self, ids):
+        """Render the series reported in the last tick in the Prometheus text format."""
+        values = self.values(ids)
+        present = ~np.isnan(values)
+        name = self.name
+        return "".join([f"{name(i)} {_format(value)}\n"
+                        for i, value in zip(ids[present].tolist(), values[present].tolist())])
+
+    def top_exceedances(self, top_x, ids):
+        """Return the top X (series name, exceedance count) pairs among ids."""
+        counts = self.counts(ids)
+        order = top_k(counts, top_x)
+        return [(self.name(i), count) for i, count in zip(ids[order].tolist(), counts[order].tolist())]
+
+def _format(value):
+    return str(int(value)) if value.is_integer() else repr(value)
+
+class SeriesStore:
+    """Interned series of many metrics with per-metric column storage and an inverted label index.
+
+    Written by the thread that stores ticks; request threads query the views
+    returned by view().
+    """
+
+    def __init__(self):
+        self._ids = {}  # (metric, sorted label pairs) -> series ID
+        self.names = []  # Formatted series name per ID
+        self.metric_names = []  # Metric name per metric code
+        self.metrics = {}  # Metric name -> _MetricColumns
+        self._series_metric = _GrowableArray(np.int32)
+        self._series_column = _GrowableArray(np.intp)
+        self.postings = {}  # (label, value) -> ascending list of series IDs, including ("__name__", metric)
+        self.label_values = {}  # Label -> {value: None}, in first-seen order
+
+    def __len__(self):
+        return len(self.names)
+
+    def intern(self, metric, labels):
+        """Return the series ID of metric with labels, a tuple of (name, value) pairs sorted by name."""
+        key = (metric, labels)
+        series_id = self._ids.get(key)
+        if series_id is not None:
+            return series_id
+        columns = self._metric(metric)
+        series_id = len(self.names)
+        self._series_metric.append(columns.code)
+        self._series_column.append(len(columns.series))
+        columns.series.append(series_id)
+        for pair in (("__name__", metric),) + labels:
+            self.postings.setdefault(pair, []).append(series_id)
+            self.label_values.setdefault(pair[0], {})[pair[1]] = None
+        self._ids[key] = series_id
+        self.names.append(series_name(metric, labels))  # Appended last: it publishes the ID to views
+        return series_id
+
+    def store(self, metric, label_sets, values):
+        """Set metric's values for this tick; label_sets holds the sorted label pairs of each value.
+
+        Passing the same label_sets tuple every tick reuses the resolved
+        columns without looking up any series.
+        """
+        keys = label_sets if isinstance(label_sets, tuple) else tuple(label_sets)
+        columns = self._metric(metric)
+        if keys is columns._last_keys or keys == columns._last_keys:
+            positions = columns._last_columns
+        else:
+            ids = np.fromiter((self.intern(metric, labels) for labels in keys), dtype=np.intp, count=len(keys))
+            positions = self._series_column.array[ids]
+            columns._last_keys, columns._last_columns = keys, positions
+        row = np.full(len(columns.series), np.nan)
+        row[positions] = values
+        columns.values = row
+        columns.pending = True
+
+    def _metric(self, metric):
+        columns = self.metrics.get(metric)
+        if columns is None:
+            columns = self.metrics[metric] = _MetricColumns(metric, len(self.metric_names))
+            self.metric_names.append(metric)
+        return columns
+
+    def pending(self):
+        """Names of the metrics stored since they were last processed."""
+        return [name for name, columns in self.metrics.items() if columns.pending]
+
+    def process(self, metric, threshold):
+        """Count the series of metric whose last stored value exceeds threshold."""
+        columns = self.metrics.get(metric)
+        if columns is None or not columns.pending:
+            return
+        counts = columns.counts
+        if len(counts) < len(columns.values):
+            counts = np.concatenate([counts, np.zeros(len(columns.values) - len(counts), dtype=np.int64)])
+        with np.errstate(invalid="ignore"):
+            columns.counts = counts + (columns.values > threshold)  # NaN (not reported) never exceeds
+        columns.pending = False
+
+    def view(self, labelled=None):
+        """Return a read-only view of the store as it is now, listing the series of labelled first."""
+        columns = {}
+        for name, metric in self.metrics.items():
+            metric.values.flags.writeable = False
+            metric.counts.flags.writeable = False
+            columns[name] = (metric.values, metric.counts)
+        size = len(self.names)
+        return SeriesView(size, self.names, self.metric_names, self._series_metric.array[:size],
+                          self._series_column.array[:size], self.postings, self.label_values, columns, labelled)
@@ -0,0 +1,233 @@
+"""Production serving mode: gunicorn workers sharing one generator process.
+
+The tick loop runs in a single child process that publishes every tick's
+MetricsSnapshot, pickled, into shared memory. Each gunicorn worker maps the
+same memory and unpickles a snapshot once per tick, so every worker serves
+identical metrics and no worker runs a generator of its own.
+"""
+import os
+import sys
+import signal
+import struct
+import pickle
+import logging
+import threading
+from multiprocessing import shared_memory
+from config import (
+    FLASK_HOST, FLASK_PORT, SERVER_WORKERS, SERVER_THREADS, SERVER_KEEPALIVE, SHARED_SNAPSHOT_BYTES,
+    EXCEEDANCE_WINDOWS,
+)
+from log_pipeline import stop_pipelines
+
+logger = logging.getLogger("app.serving")
+
+HEADER = struct.Struct("<QQQQQ")  # Sequence, active slot, payload length, data segment generation, slot size
+SEQUENCE = struct.Struct("<Q")
+
+class SharedSnapshotBuffer:
+    """Double-buffered snapshot slots in shared memory with a seqlock header.
+
+    A single writer pickles each snapshot into the slot readers are not using
+    and then points the header at it; the sequence number is odd while a
+    publish is in progress. A reader copies the active slot and keeps the copy
+    unless a second publish started meanwhile, the only way that slot can be
+    overwritten. Payloads that outgrow the slots move to a new, larger data
+    segment whose generation is recorded in the header.
+    """
+
+    def __init__(self, name=None, create=False, slot_size=SHARED_SNAPSHOT_BYTES):
+        if create:
+            self._control = shared_memory.SharedMemory(name=name, create=True, size=HEADER.size)
+            HEADER.pack_into(self._control.buf, 0, 0, 0, 0, 0, 0)
+        else:
+            self._control = shared_memory.SharedMemory(name=name)
+        self.name = self._control.name
+        self.slot_size = slot_size  # Initial slot size for the writer
+        self._data = None  # Data segment currently mapped by this process
+        self._generation = 0
+        self._owned = []  # Data segments created by this process as the writer
+        self._cached = (None, None)  # (sequence, snapshot) last unpickled by this reader, swapped as a pair
+        self._lock = threading.Lock()  # Lets one request thread per worker unpickle a new tick
+
+    def publish(self, snapshot):
+        """Make snapshot the one every reader sees next. Only one process may publish."""
+        payload = pickle.dumps(snapshot, protocol=pickle.HIGHEST_PROTOCOL)
+        buf = self._control.buf
+        sequence, slot, _, generation, slot_size = HEADER.unpack_from(buf)
+        retired = None
+        if self._data is None or self._generation != generation or len(payload) > slot_size:
+            retired = self._owned[-1] if self._owned else None
+            generation += 1
+            slot_size = max(self.slot_size, slot_size, len(payload) * 2)
+            self._map(generation, create=True, size=2 * slot_size)
+            self._owned.append(self._data)
+            slot = 0
+        else:
+            slot = 1 - slot  # The slot readers are not using
+
+        SEQUENCE.pack_into(buf, 0, sequence + 1)  # Odd: publish in progress
+        offset = slot * slot_size
+        self._data.buf[offset:offset + len(payload)] = payload
+        HEADER.pack_into(buf, 0, sequence + 1, slot, len(payload), generation, slot_size)
+        SEQUENCE.pack_into(buf, 0, sequence + 2)
+
+        if retired is not None:
+            # Readers that already mapped the old segment keep their mapping
+            self._owned.remove(retired)
+            retired.close()
+            retired.unlink()
+
+    def read(self):
+        """Return the latest published snapshot, or None, unpickling it only when it changed."""
+        sequence, snapshot = self._cached
+        if self._read_header()[0] == sequence:
+            return snapshot
+        with self._lock:
+            while True:
+                sequence, slot, length, generation, slot_size = self._read_header()
+                if sequence == self._cached[0]:
+                    return self._cached[1]  # Another request thread already loaded it
+                if generation == 0:
+                    return None
+                try:
+                    data = self._map(generation)
+                except FileNotFoundError:
+                    continue  # The writer moved to a larger segment meanwhile
+                offset = slot * slot_size
+                payload = bytes(data.buf[offset:offset + length])
+                if SEQUENCE.unpack_from(self._control.buf)[0] - sequence <= 2:
+                    break
+            snapshot = pickle.loads(payload)
+            self._cached = (sequence, snapshot)
+            return snapshot
+
+    def close(self):
+        """Unmap the buffer and remove the data segments this process created."""
+        for segment in self._owned:
+            if segment is not self._data:
+                segment.close()
+            segment.unlink()
+        self._owned = []
+        if self._data is not None:
+            self._data.close()
+            self._data = None
+        self._control.close()
+
+    def unlink(self):
+        """Remove the control segment; called once by the process that created it."""
+        self._control.unlink()
+
+    def _read_header(self):
+        buf = self._control.buf
+        while True:
+            (before,) = SEQUENCE.unpack_from(buf)
+            header = HEADER.unpack_from(buf)
+            (after,) = SEQUENCE.unpack_from(buf)
+            if before == after == header[0] and not before & 1:
+                return header
+
+    def _map(self, generation, create=False, size=0):
+        if self._data is not None and self._generation == generation and not create:
+            return self._data
+        segment = shared_memory.SharedMemory(name=f"{self.name}-{generation}", create=create, size=size)
+        if self._data is not None and self._data not in self._owned:
+            self._data.close()
+        self._data = segment
+        self._generation = generation
+        return segment
+
+class SharedSnapshotView:
+    """Stands in for MetricsManager inside serving workers, backed by a SharedSnapshotBuffer."""
+
+    metrics_history = ()  # History stays in the generator process
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+
+    @property
+    def snapshot(self):
+        return self.buffer.read()
+
+    def get_top_exceedance_apps(self, top_x, window=None):
+        """Retrieve the top X apps from the latest published snapshot."""
+        snapshot = self.snapshot
+        if snapshot is None:
+            if window is not None and window not in EXCEEDANCE_WINDOWS:
+                raise KeyError(window)
+            return []  # Nothing generated yet
+        return snapshot.get_top_exceedance_apps(top_x, window)
+
+    def get_exceedance_errors(self, top_apps, window=None):
+        """Return the overcounts of top apps from the latest snapshot, or None when the counts are exact."""
+        snapshot = self.snapshot
+        return snapshot.get_exceedance_errors(top_apps, window) if snapshot is not None else None
+
+def gunicorn_application(wsgi_app, options):
+    """Return a gunicorn application serving wsgi_app with the given settings."""
+    from gunicorn.app.base import BaseApplication
+
+    class MetricsApplication(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return wsgi_app
+
+    return MetricsApplication()
+
+def serve(wsgi_app, manager, run_generation, attach_worker, host=FLASK_HOST, port=FLASK_PORT,
+          workers=SERVER_WORKERS, threads=SERVER_THREADS, keepalive=SERVER_KEEPALIVE):
+    """Run one generator process and serve wsgi_app from gunicorn gthread workers.
+
+    run_generation() runs the tick loop in the forked generator process, where
+    every snapshot manager publishes is copied to shared memory.
+    attach_worker(buffer) is called in each worker after it is forked so its
+    handlers read from the shared buffer instead of the idle local manager.
+    """
+    buffer = SharedSnapshotBuffer(create=True)
+    generator_pid = os.fork()
+    if generator_pid == 0:
+        code = _run_generator(buffer, manager, run_generation)
+        stop_pipelines()  # os._exit skips atexit, where the log records still queued would be written
+        os._exit(code)
+
+    options = {
+        "bind": f"{host}:{port}",
+        "workers": workers,
+        "threads": threads,
+        "worker_class": "gthread",
+        "keepalive": keepalive,
+        "accesslog": None,
+        "post_fork": lambda server, worker: attach_worker(buffer),
+    }
+    master_pid = os.getpid()
+    try:
+        gunicorn_application(wsgi_app, options).run()
+    finally:
+        if os.getpid() == master_pid:  # Workers exit through here too, with SystemExit
+            _stop_generator(generator_pid)
+            buffer.close()
+            buffer.unlink()
+
+def _run_generator(buffer, manager, run_generation):
+    """Body of the generator process; returns its exit code."""
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))  # Let run_generation clean up on stop
+    manager.snapshot_listeners.append(buffer.publish)
+    try:
+        run_generation()
+        return 0
+    except (SystemExit, KeyboardInterrupt):
+        return 0
+    except Exception:
+        logger.exception("Metrics generator process failed")
+        return 1
+    finally:
+        buffer.close()
+
+def _stop_generator(pid):
+    try:
+        os.kill(pid, signal.SIGTERM)
+        os.waitpid(pid, 0)
+    except (ProcessLookupError, ChildProcessError):
+        pass  # Already exited, or reaped by the gunicorn arbiter
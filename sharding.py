@@ -0,0 +1,179 @@
+"""Sharded tick pipeline for very large NUM_APPS.
+
+The app space is split into contiguous column ranges, one per worker process.
+On every tick each shard draws its apps' values into a shared memory matrix,
+counts exceedances into its slice of the shared lifetime and sliding-window
+counters, and sends back only its partial top-K rankings. The coordinator
+merges those rankings, while the full values and counts stay readable in its
+own process without being copied between processes. Storing the values,
+rendering the exposition and publishing the snapshot still run serially in
+the coordinator over every app, which bounds the speedup of a whole tick.
+"""
+import sys
+import time
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+from config import (
+    NUM_APPS, SHARD_PROCESSES, TOP_X_APPS, RANDOM_METRIC_MIN, RANDOM_METRIC_MAX, METRIC_DISTRIBUTION,
+    RANDOM_SEED, EXCEEDANCE_WINDOWS, EXCEEDANCE_WINDOW_BUCKETS,
+)
+from generation import MetricsGenerator
+from exceedance import ExceedanceCounter, ExceedanceWindow, top_k, merge_top_k
+from instrumentation import timed, SHARD_TICK_SECONDS
+
+class ShardedWindowCounts:
+    """Coordinator-side, read-only view of a sliding window counted by the shards."""
+
+    def __init__(self, span, app_index, counts):
+        self.span = span
+        self.app_index = app_index
+        self.counts = counts
+
+    def __getitem__(self, app_name):
+        position = self.app_index.positions.get(app_name)
+        return 0 if position is None else int(self.counts[position])
+
+    def advance(self, timestamp):
+        pass  # The shards expire buckets on every tick
+
+    def top(self, top_x, now=None):
+        names = self.app_index.names
+        columns = top_k(self.counts, top_x)
+        return list(zip([names[c] for c in columns], self.counts[columns].tolist()))
+
+class ShardedPipeline:
+    """Generate and count every tick across a pool of shard processes.
+
+    Shard processes are forked, so the pipeline must be started before the
+    process runs any other thread.
+    """
+
+    def __init__(self, num_apps=NUM_APPS, shards=SHARD_PROCESSES, top_x=TOP_X_APPS, low=RANDOM_METRIC_MIN,
+                 high=RANDOM_METRIC_MAX, distribution=METRIC_DISTRIBUTION, seed=RANDOM_SEED,
+                 windows=EXCEEDANCE_WINDOWS, buckets=EXCEEDANCE_WINDOW_BUCKETS):
+        shards = max(1, min(shards, num_apps))
+        self.top_x = top_x
+        self.windows = dict(windows)  # Window name -> span in seconds
+        self.window_names = list(windows)
+        self.app_names = tuple(sys.intern(f"app{i+1}") for i in range(num_apps))
+        shape = (2 + len(windows), num_apps)  # Values, lifetime counts, then one row per window
+        self._memory = shared_memory.SharedMemory(create=True, size=max(shape[0] * shape[1] * 8, 1))
+        self._matrix = np.ndarray(shape, dtype=np.int64, buffer=self._memory.buf)
+        self._matrix.fill(0)
+        self.values = self._matrix[0]  # Latest tick, valid until the next call to tick()
+        self.counts = self._matrix[1]
+        self.window_counts = {name: self._matrix[2 + i] for i, name in enumerate(self.window_names)}
+        self._views = []  # Counters handed to a manager, detached from shared memory on close
+
+        bounds = np.linspace(0, num_apps, shards + 1).astype(int)
+        seeds = np.random.SeedSequence(seed).spawn(shards)  # Independent streams per shard
+        spans = [windows[name] for name in self.window_names]
+        context = multiprocessing.get_context("fork")
+        self._connections = []
+        self._processes = []
+        for shard in range(shards):
+            connection, shard_connection = context.Pipe()
+            process = context.Process(
+                target=_run_shard, name=f"metrics-shard-{shard}", daemon=True,
+                args=(shard_connection, self._memory.name, shape, bounds[shard], bounds[shard + 1],
+                      low, high, distribution, seeds[shard], spans, buckets),
+            )
+            process.start()
+            shard_connection.close()
+            self._connections.append(connection)
+            self._processes.append(process)
+
+    @timed(SHARD_TICK_SECONDS)
+    def tick(self, threshold, timestamp=None):
+        """Run one tick on every shard in parallel and return the merged rankings.
+
+        The values are left in self.values. Returns {(top_x, window): top apps}
+        for the lifetime counts (window None) and every sliding window.
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        for connection in self._connections:
+            connection.send((timestamp, threshold, self.top_x))
+        partials = [connection.recv() for connection in self._connections]
+
+        rankings = {}
+        for i, window in enumerate([None] + self.window_names):
+            columns = np.concatenate([shard[i][0] for shard in partials])
+            counts = np.concatenate([shard[i][1] for shard in partials])
+            columns, counts = merge_top_k(columns, counts, self.top_x)
+            rankings[(self.top_x, window)] = list(zip([self.app_names[c] for c in columns], counts.tolist()))
+        return rankings
+
+    def attach(self, manager):
+        """Make manager rank apps from the counts the shards maintain.
+
+        The manager's app index must be empty or list the apps in shard order.
+        """
+        app_index = manager.app_index
+        if app_index.names[:len(self.app_names)] != list(self.app_names[:len(app_index)]):
+            raise ValueError("The manager already knows apps in a different order than the shards")
+        app_index.columns(self.app_names)
+        counter = ExceedanceCounter(app_index, counts=self.counts)
+        windows = {
+            name: ShardedWindowCounts(self.windows[name], app_index, self.window_counts[name])
+            for name in self.window_names
+        }
+        self._views = [counter, *windows.values()]
+        manager.attach_counts(counter, windows)
+
+    def close(self, timeout=5):
+        """Stop the shard processes and release the shared memory."""
+        if self._memory is None:
+            return
+        for connection in self._connections:
+            try:
+                connection.send(None)
+            except OSError:
+                pass  # Shard already gone
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        for view in self._views:
+            view.counts = view.counts.copy()  # Keep an attached manager readable
+        self.values = self.counts = self.window_counts = self._matrix = None
+        try:
+            self._memory.close()
+        except BufferError:
+            pass  # A caller still holds a view; the mapping goes away with the process
+        self._memory.unlink()
+        self._memory = None
+
+def _partial_top(counts, top_x, start):
+    """Return this shard's top columns, as global columns, and their counts."""
+    columns = top_k(counts, top_x)
+    return columns + start, counts[columns]
+
+def _run_shard(connection, memory_name, shape, start, end, low, high, distribution, seed, spans, buckets):
+    """Body of one shard process: run ticks for columns [start, end) until told to stop."""
+    memory = shared_memory.SharedMemory(name=memory_name)
+    matrix = np.ndarray(shape, dtype=np.int64, buffer=memory.buf)
+    values = matrix[0, start:end]
+    generator = MetricsGenerator(end - start, low, high, distribution, seed)
+    counter = ExceedanceCounter(counts=matrix[1, start:end])
+    windows = [ExceedanceWindow(span, buckets, counts=matrix[2 + i, start:end]) for i, span in enumerate(spans)]
+    columns = slice(None)  # Every app of the shard reports on every tick
+    try:
+        while True:
+            request = connection.recv()
+            if request is None:
+                break
+            timestamp, threshold, top_x = request
+            generator.generate(out=values)
+            exceeded = values > threshold
+            counter.add(columns, exceeded)
+            partials = [_partial_top(counter.counts, top_x, start)]
+            for window in windows:
+                window.add(timestamp, columns, exceeded)
+                partials.append(_partial_top(window.counts, top_x, start))
+            connection.send(partials)
+    except (EOFError, KeyboardInterrupt):
+        pass  # The coordinator went away
+    finally:
+        del values, matrix, counter, windows  # Release the buffer before unmapping it
+        memory.close()
@@ -0,0 +1,270 @@
+"""Fixed-memory approximate exceedance counting for very many apps.
+
+With TOP_X_MODE = "approximate" the per-app count arrays are replaced by a
+Space-Saving summary of SKETCH_CAPACITY monitored apps, backed by a Count-Min
+sketch. The counters' memory no longer grows with the number of apps, though
+the app index and the history still do, and the top X is picked from the
+monitored apps only. Every reported count is an upper bound
+on the true count, and count - error is a lower bound; an app whose true
+count exceeds total / SKETCH_CAPACITY is always monitored. Every summary also
+keeps the highest count it ever evicted, which bounds the count of any app it
+does not monitor.
+"""
+import numpy as np
+from config import SKETCH_CAPACITY, SKETCH_WIDTH, SKETCH_DEPTH
+
+_EMPTY = np.zeros(0, dtype=np.int64)
+
+class CountMinSketch:
+    """Count-Min sketch over integer keys: estimates never undercount, and overcount by at most
+    e / width of the total with probability 1 - exp(-depth)."""
+
+    def __init__(self, width=SKETCH_WIDTH, depth=SKETCH_DEPTH, seed=0):
+        if width < 2 or width & (width - 1):
+            raise ValueError("Count-Min width must be a power of two")
+        self.width = width
+        self.table = np.zeros((depth, width), dtype=np.int64)
+        rng = np.random.default_rng(seed)
+        # Multiply-shift hashing: one odd multiplier and one offset per row, arithmetic modulo 2**64
+        self._multipliers = rng.integers(1, 2 ** 63, size=(depth, 1), dtype=np.uint64) | np.uint64(1)
+        self._offsets = rng.integers(0, 2 ** 63, size=(depth, 1), dtype=np.uint64)
+        self._shift = np.uint64(64 - (width.bit_length() - 1))
+        self.total = 0
+
+    @property
+    def nbytes(self):
+        return self.table.nbytes
+
+    def _buckets(self, keys):
+        with np.errstate(over="ignore"):
+            return ((keys.astype(np.uint64) * self._multipliers + self._offsets) >> self._shift).astype(np.intp)
+
+    def add(self, keys, counts=None):
+        """Count each key once, or counts times when given."""
+        for row, buckets in zip(self.table, self._buckets(keys)):
+            row += np.bincount(buckets, counts, minlength=self.width).astype(np.int64)
+        self.total += len(keys) if counts is None else int(counts.sum())
+
+    def query(self, keys):
+        """Return the estimated count of each key."""
+        buckets = self._buckets(keys)
+        return np.min(self.table[np.arange(len(self.table))[:, None], buckets], axis=0)
+
+    def clear(self):
+        self.table[:] = 0
+        self.total = 0
+
+class SketchSummary:
+    """Frozen monitored apps of a sketch: app columns with their count and error bound, ascending by column."""
+
+    __slots__ = ("columns", "counts", "errors")
+
+    def __init__(self, columns, counts, errors):
+        for array in (columns, counts, errors):
+            array.flags.writeable = False
+        self.columns = columns
+        self.counts = counts
+        self.errors = errors
+
+    def __reduce__(self):
+        return (type(self), (self.columns, self.counts, self.errors))  # Frozen again on load
+
+    def overcounts(self, app_names, top_apps):
+        """Return the error of each (app_name, count) pair; app_names maps columns to names."""
+        errors = dict(zip([app_names[c] for c in self.columns.tolist()], self.errors.tolist()))
+        return [errors.get(app_name, 0) for app_name, _ in top_apps]
+
+    def top(self, top_x):
+        """Return (columns, counts, errors) of the top X, highest count first and ties by column."""
+        order = np.lexsort((self.columns, -self.counts))[:max(top_x, 0)]
+        order = order[self.counts[order] > 0]
+        return self.columns[order], self.counts[order], self.errors[order]
+
+def _merge(parts, capacity):
+    """Merge (columns, counts, errors, dropped) summaries into one of at most capacity entries.
+
+    An app missing from a part may still have been counted up to the highest
+    count that part evicted, so that is added to both its count and its error.
+    """
+    parts = [part for part in parts if len(part[0]) or part[3]]
+    if not parts:
+        return _EMPTY, _EMPTY, _EMPTY, 0
+    columns, inverse = np.unique(np.concatenate([part[0] for part in parts]), return_inverse=True)
+    floors = sum(part[3] for part in parts)
+    counts = np.full(len(columns), floors, dtype=np.int64)
+    errors = np.full(len(columns), floors, dtype=np.int64)
+    start = 0
+    for part_columns, part_counts, part_errors, floor in parts:
+        positions = inverse[start:start + len(part_columns)]
+        counts[positions] += part_counts - floor
+        errors[positions] += part_errors - floor
+        start += len(part_columns)
+    return _keep_top(columns, counts, errors, capacity)
+
+def _keep_top(columns, counts, errors, capacity, new=None):
+    """Keep the capacity highest counts; ties keep monitored apps (new False) first, then lower columns.
+
+    Returns (columns, counts, errors, highest evicted count).
+    """
+    if len(columns) <= capacity:
+        return columns, counts, errors, 0
+    order = np.lexsort((columns, new if new is not None else np.zeros(len(columns), dtype=bool), -counts))
+    keep = np.sort(order[:capacity])  # Positions ascending, so columns stay sorted
+    return columns[keep], counts[keep], errors[keep], int(counts[order[capacity:]].max())
+
+class SpaceSavingCounter:
+    """Approximate lifetime exceedance counts of at most capacity apps, in fixed memory.
+
+    Reads like ExceedanceCounter: unmonitored apps read as 0 and top() returns
+    (app_name, count) pairs. width=None leaves out the Count-Min sketch, which
+    only tightens the estimate of newly monitored apps.
+    """
+
+    def __init__(self, app_index, capacity=SKETCH_CAPACITY, width=SKETCH_WIDTH, depth=SKETCH_DEPTH):
+        self.app_index = app_index
+        self.capacity = capacity
+        self.sketch = CountMinSketch(width, depth) if width is not None else None
+        self.columns = _EMPTY  # Monitored app columns, ascending
+        self.counts = _EMPTY  # Upper bound on each monitored app's count
+        self.errors = _EMPTY  # Maximum overcount of each monitored app
+        self.dropped = 0  # Highest count evicted, an upper bound on the count of any app not monitored
+
+    @property
+    def nbytes(self):
+        sketch = self.sketch.nbytes if self.sketch is not None else 0
+        return sketch + self.columns.nbytes + self.counts.nbytes + self.errors.nbytes
+
+    def __getitem__(self, app_name):
+        position = self.app_index.positions.get(app_name)
+        index = np.searchsorted(self.columns, position) if position is not None else len(self.columns)
+        if index < len(self.columns) and self.columns[index] == position:
+            return int(self.counts[index])
+        return 0
+
+    def __len__(self):
+        return len(self.columns)
+
+    def items(self):
+        names = self.app_index.names
+        return list(zip([names[c] for c in self.columns.tolist()], self.counts.tolist()))
+
+    def add(self, columns, exceeded):
+        """Count the apps of a snapshot whose exceeded mask is set; columns are unique within a snapshot."""
+        self.columns, self.counts, self.errors, self.dropped = self._add(columns[exceeded])
+
+    def _add(self, items):
+        if not len(items):
+            return self.columns, self.counts, self.errors, self.dropped
+        if self.sketch is not None:
+            self.sketch.add(items)
+        positions = np.searchsorted(self.columns, items)
+        clipped = np.minimum(positions, max(len(self.columns) - 1, 0))
+        hit = (positions < len(self.columns)) & (self.columns[clipped] == items) if len(self.columns) else (
+            np.zeros(len(items), dtype=bool))
+        counts = self.counts.copy()
+        counts[positions[hit]] += 1
+        fresh = np.sort(items[~hit])
+        if not len(fresh):
+            return self.columns, counts, self.errors, self.dropped
+        # A new app was counted at most dropped times before and once now; the Count-Min estimate may be tighter
+        fresh_counts = np.full(len(fresh), self.dropped + 1, dtype=np.int64)
+        if self.sketch is not None:
+            fresh_counts = np.minimum(self.sketch.query(fresh), fresh_counts)
+        columns = np.concatenate([self.columns, fresh])
+        order = np.argsort(columns, kind="stable")
+        new = np.concatenate([np.zeros(len(self.columns), dtype=bool), np.ones(len(fresh), dtype=bool)])[order]
+        columns, counts, errors, dropped = _keep_top(
+            columns[order], np.concatenate([counts, fresh_counts])[order],
+            np.concatenate([self.errors, fresh_counts - 1])[order], self.capacity, new)
+        return columns, counts, errors, max(dropped, self.dropped)
+
+    def update(self, counts):
+        """Set counts from a mapping of app name to count, as exact counts; only the top capacity are kept."""
+        items = np.array([self.app_index.intern(app_name) for app_name in counts], dtype=np.int64)
+        values = np.fromiter(counts.values(), dtype=np.int64, count=len(items))
+        if not len(items):
+            return
+        if self.sketch is not None:
+            self.sketch.add(items, values)
+        kept = ~np.isin(self.columns, items)  # Apps already monitored take their new count
+        columns = np.concatenate([self.columns[kept], items])
+        order = np.argsort(columns, kind="stable")
+        self.columns, self.counts, self.errors, dropped = _keep_top(
+            columns[order], np.concatenate([self.counts[kept], values])[order],
+            np.concatenate([self.errors[kept], np.zeros(len(items), dtype=np.int64)])[order], self.capacity)
+        self.dropped = max(dropped, self.dropped)
+
+    def summary(self):
+        """Return a frozen SketchSummary of the monitored apps."""
+        return SketchSummary(self.columns.copy(), self.counts.copy(), self.errors.copy())
+
+    def top(self, top_x):
+        """Return the top X (app_name, count) pairs, highest count first."""
+        return _named(self.app_index, self.summary().top(top_x))
+
+    def clear(self):
+        if self.sketch is not None:
+            self.sketch.clear()
+        self.columns = self.counts = self.errors = _EMPTY
+        self.dropped = 0
+
+class SpaceSavingWindow:
+    """Approximate exceedance counts over a sliding time window, as a ring of per-bucket summaries.
+
+    Each bucket monitors at most capacity apps; the window's counts are the
+    merge of its live buckets, so memory is buckets * capacity whatever the
+    number of apps.
+    """
+
+    def __init__(self, span, buckets, app_index, capacity=SKETCH_CAPACITY):
+        self.span = span
+        self.buckets = buckets
+        self.bucket_width = span / buckets
+        self.app_index = app_index
+        self.capacity = capacity
+        self.ring = [(_EMPTY, _EMPTY, _EMPTY, 0)] * buckets  # Bucket slot -> (columns, counts, errors, dropped)
+        self.current = None  # Absolute number of the newest bucket
+        self._counter = SpaceSavingCounter(app_index, capacity, width=None)  # Reused for bucket updates
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for bucket in self.ring for array in bucket[:3])
+
+    def add(self, timestamp, columns, exceeded):
+        """Count a snapshot's exceedances in the bucket covering timestamp."""
+        self.advance(timestamp)
+        slot = self.current % self.buckets
+        counter = self._counter
+        counter.columns, counter.counts, counter.errors, counter.dropped = self.ring[slot]
+        self.ring[slot] = counter._add(columns[exceeded])
+
+    def advance(self, timestamp):
+        """Expire every bucket that fell out of the window by timestamp."""
+        bucket = int(timestamp // self.bucket_width)
+        if self.current is None:
+            self.current = bucket
+            return
+        if bucket <= self.current:
+            return
+        for expired in range(self.current + 1, self.current + 1 + min(bucket - self.current, self.buckets)):
+            self.ring[expired % self.buckets] = (_EMPTY, _EMPTY, _EMPTY, 0)
+        self.current = bucket
+
+    def summary(self):
+        """Merge the live buckets into a frozen SketchSummary."""
+        return SketchSummary(*(array.copy() for array in _merge(self.ring, self.capacity)[:3]))
+
+    def top(self, top_x, now=None):
+        """Return the top X (app_name, count) pairs inside the window ending at now."""
+        if now is not None:
+            self.advance(now)
+        return _named(self.app_index, self.summary().top(top_x))
+
+    def clear(self):
+        self.ring = [(_EMPTY, _EMPTY, _EMPTY, 0)] * self.buckets
+        self.current = None
+
+def _named(app_index, top):
+    columns, counts, _ = top
+    names = app_index.names
+    return list(zip([names[c] for c in columns.tolist()], counts.tolist()))
@@ -0,0 +1,101 @@
+import numpy as np
+from config import METRIC_NAME
+from exceedance import top_k
+from series_store import LabelledSeries
+
+def _freeze(array):
+    """Mark array read-only in place and return it; a SketchSummary is already frozen."""
+    if isinstance(array, np.ndarray):
+        array.flags.writeable = False
+    return array
+
+def _capture_counts(counter, width):
+    """Copy exact counts up to width, or the summary of an approximate counter."""
+    summary = getattr(counter, "summary", None)
+    return summary() if summary is not None else counter.counts[:width].copy()
+
+class MetricsSnapshot:
+    """Immutable state of one tick, shared with request handlers without locks.
+
+    The generation thread builds a new snapshot after every tick and publishes
+    it by replacing a single attribute, so a reader that takes one reference
+    sees the latest values, the counters and the rendered exposition of the
+    same tick, and is never affected by the next one.
+    """
+
+    __slots__ = ("sequence", "timestamp", "app_names", "latest_names", "values", "counts", "window_counts",
+                 "exposition", "internal_metrics", "series", "_top_cache")
+
+    def __init__(self, sequence, timestamp, app_names, latest_names, values, counts, window_counts, exposition,
+                 rankings=None, internal_metrics=None, series=None):
+        set_field = object.__setattr__
+        set_field(self, "sequence", sequence)
+        set_field(self, "timestamp", timestamp)
+        set_field(self, "app_names", app_names)  # Tuple of every known app, matching the counts columns
+        set_field(self, "latest_names", latest_names)  # Apps of the latest tick, parallel to values
+        set_field(self, "values", _freeze(values))
+        set_field(self, "counts", _freeze(counts))
+        set_field(self, "window_counts", {name: _freeze(counts) for name, counts in window_counts.items()})
+        set_field(self, "exposition", exposition)
+        set_field(self, "internal_metrics", internal_metrics)  # Generator's /internal/metrics text, for other processes
+        set_field(self, "series", series)  # SeriesView of every metric, for label matcher queries
+        # Memoized rankings by (top_x, window), optionally seeded; two readers computing one is harmless
+        set_field(self, "_top_cache", dict(rankings) if rankings else {})
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __reduce__(self):
+        # Pickled for other processes without the memoized rankings; arrays are frozen again on load
+        return (type(self), (self.sequence, self.timestamp, self.app_names, self.latest_names, self.values,
+                             self.counts, self.window_counts, self.exposition, None, self.internal_metrics,
+                             self.series))
+
+    @classmethod
+    def capture(cls, sequence, manager, app_names, rankings=None, internal_metrics=None):
+        """Copy the manager's current state into a new snapshot.
+
+        app_names must be a tuple of the manager's app index names; rankings
+        optionally maps (top_x, window) to rankings already computed this tick.
+        """
+        latest = manager.metrics_history.latest()
+        if latest is None:
+            timestamp, latest_names = None, ()
+            values = np.zeros(0, dtype=manager.metrics_history.dtype)
+        else:
+            timestamp, latest_names, values = latest
+            values = values.copy()  # The ring buffer row is reused by later ticks
+            if latest_names is manager.app_index.names:
+                latest_names = app_names[:len(values)]  # Every known app reported; reuse the tuple
+            else:
+                latest_names = tuple(latest_names)
+        width = len(app_names)
+        counts = _capture_counts(manager.exceedance_count, width)
+        window_counts = {name: _capture_counts(window, width) for name, window in manager.exceedance_windows.items()}
+        # METRIC_NAME's series are read from this snapshot's own arrays, counted at the manager's thresholds
+        apps = LabelledSeries(METRIC_NAME, "app_name", app_names, latest_names, values, counts,
+                              manager.app_index.positions)
+        return cls(sequence, timestamp, app_names, latest_names, values, counts, window_counts,
+                   manager.exposition.current, rankings, internal_metrics, manager.series.view(apps))
+
+    def get_top_exceedance_apps(self, top_x, window=None):
+        """Return the top X (app_name, count) pairs as of this tick."""
+        key = (top_x, window)
+        top_apps = self._top_cache.get(key)
+        if top_apps is None:
+            counts = self.counts if window is None else self.window_counts[window]
+            if isinstance(counts, np.ndarray):
+                columns = top_k(counts, top_x)
+                top_counts = counts[columns]
+            else:  # SketchSummary of an approximate counter
+                columns, top_counts, _ = counts.top(top_x)
+            top_apps = list(zip([self.app_names[c] for c in columns], top_counts.tolist()))
+            self._top_cache[key] = top_apps
+        return list(top_apps)
+
+    def get_exceedance_errors(self, top_apps, window=None):
+        """Return the maximum overcount of each (app_name, count) pair, or None when the counts are exact."""
+        counts = self.counts if window is None else self.window_counts[window]
+        if isinstance(counts, np.ndarray):
+            return None
+        return counts.overcounts(self.app_names, top_apps)
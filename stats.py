@@ -0,0 +1,213 @@
+"""Streaming per-app statistics and the adaptive thresholds built on them.
+
+Every tick updates a fixed set of arrays with one vectorized pass over the
+apps that reported: an EWMA baseline, an exponentially weighted variance and
+a histogram over STATS_HISTOGRAM_BINS logarithmic bins. Nothing depends on the
+history length. The bins are shared by every app, so histograms of several
+apps (or several processes) merge by adding them.
+"""
+import threading
+import numpy as np
+from config import (
+    STATS_EWMA_ALPHA, STATS_HISTOGRAM_BINS, STATS_HISTOGRAM_RANGE, STATS_SIGMAS, STATS_QUANTILE, STATS_WARMUP_TICKS,
+)
+
+THRESHOLD_MODES = ("static", "sigma", "quantile")
+
+class AppStatistics:
+    """Constant-memory summaries of each app's values, indexed by app column.
+
+    A histogram row is halved whenever one of its bins would overflow, so old
+    values fade out of the quantiles much like they do from the EWMA. The bin
+    holding the tracked quantile is kept up to date as values arrive, so it
+    never needs a pass over the whole histogram.
+    """
+
+    def __init__(self, app_index, alpha=STATS_EWMA_ALPHA, bins=STATS_HISTOGRAM_BINS, value_range=STATS_HISTOGRAM_RANGE,
+                 quantile=STATS_QUANTILE):
+        self.app_index = app_index
+        self.alpha = alpha
+        low, high = value_range
+        self._log_low = np.log(low)
+        self._log_gamma = (np.log(high) - self._log_low) / max(bins, 1)  # Bin i covers [low * gamma**i, low * gamma**(i + 1))
+        self.bins = bins
+        self.tracked_quantile = quantile
+        self.count = np.zeros(0, dtype=np.int64)  # Values seen per app
+        self.mean = np.zeros(0)  # EWMA baseline per app
+        self.variance = np.zeros(0)  # Exponentially weighted variance around the baseline
+        self.histograms = np.zeros((0, bins), dtype=np.uint16)
+        self._total = np.zeros(0, dtype=np.int64)  # Values in each histogram row, after halvings
+        self._quantile_bin = np.zeros(0, dtype=np.intp)  # Bin holding the tracked quantile of each row
+        self._below = np.zeros(0, dtype=np.int64)  # Values in the bins under it
+        self._last_columns = None
+        self._last_rows = None
+        self.lock = threading.Lock()  # Held by updates and by readers on request threads
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in (self.count, self.mean, self.variance, self.histograms, self._total,
+                                               self._quantile_bin, self._below))
+
+    def update(self, columns, values):
+        """Fold one tick of values, resolved to app columns, into the summaries."""
+        with self.lock:
+            self._ensure_capacity(len(self.app_index))
+            rows = self._rows(columns)
+            values = np.asarray(values, dtype=np.float64)
+            first = self.count[rows] == 0
+            mean = np.where(first, values, self.mean[rows])
+            diff = values - mean
+            increment = self.alpha * diff
+            self.mean[rows] = mean + increment
+            self.variance[rows] = np.where(first, 0.0, (1 - self.alpha) * (self.variance[rows] + diff * increment))
+            self.count[rows] += 1
+            if not self.bins:
+                return
+
+            columns = np.asarray(columns)
+            bins = self._bins(values)
+            cells = columns * self.bins + bins  # Flat positions in the histograms, gathered once
+            flat = self.histograms.reshape(-1)
+            counts = flat.take(cells)
+            full = counts == np.iinfo(np.uint16).max
+            if full.any():
+                self._halve(columns[full])
+                counts = flat.take(cells)
+            flat[cells] = counts + 1  # Columns are unique within a tick
+            self._total[rows] += 1
+            self._settle(columns, rows, bins)
+
+    def std(self, columns):
+        return np.sqrt(self.variance[columns])
+
+    def quantile(self, q, columns):
+        """Estimate the q quantile of each app column, NaN for apps with no values.
+
+        Answers are the geometric middle of the bin holding the quantile, within
+        half a bin's relative width of the true value inside STATS_HISTOGRAM_RANGE.
+        """
+        if q == self.tracked_quantile:
+            bins = self._quantile_bin[columns]
+            total = self._total[columns]
+        else:
+            cumulative = np.cumsum(self.histograms[columns].astype(np.int64), axis=1)
+            total = cumulative[:, -1] if self.bins else np.zeros(len(cumulative), dtype=np.int64)
+            bins = np.argmax(cumulative >= self._rank(q, total)[:, None], axis=1)
+        return np.where(total > 0, self._bin_value(bins), np.nan)
+
+    def thresholds(self, columns, mode, default, sigmas=STATS_SIGMAS, warmup=STATS_WARMUP_TICKS):
+        """Return each app column's threshold under mode, or default while it has fewer than warmup values.
+
+        "sigma" is sigmas standard deviations above the EWMA baseline and
+        "quantile" is the app's own tracked quantile; "static" is default for all.
+        """
+        if mode == "static":
+            return default
+        with self.lock:
+            self._ensure_capacity(len(self.app_index))
+            rows = self._rows(columns)
+            if mode == "sigma":
+                adaptive = self.mean[rows] + sigmas * np.sqrt(self.variance[rows])
+            elif mode == "quantile":
+                adaptive = self._bin_value(self._quantile_bin[rows])
+            else:
+                raise ValueError(f"Unknown threshold mode: {mode}")
+            return np.where(self.count[rows] >= warmup, adaptive, default)
+
+    def summary(self, app_name, quantiles=(0.5, 0.95, 0.99)):
+        """Return a dict of an app's count, mean, stddev and quantiles, or None for an unknown app."""
+        position = self.app_index.positions.get(app_name)
+        with self.lock:
+            if position is None or position >= len(self.count) or not self.count[position]:
+                return None
+            columns = np.array([position])
+            result = {"count": int(self.count[position]), "mean": float(self.mean[position]),
+                      "stddev": float(self.std(columns)[0])}
+            for q in quantiles:
+                result[f"p{q * 100:g}"] = float(self.quantile(q, columns)[0])
+        return result
+
+    def clear(self):
+        with self.lock:
+            self.count[:] = 0
+            self.histograms[:] = 0
+            self._total[:] = 0
+            self._quantile_bin[:] = 0
+            self._below[:] = 0
+
+    def _rank(self, q, total):
+        """1-based rank of the q quantile among total values."""
+        return np.maximum(np.ceil(q * total), 1).astype(np.int64)
+
+    def _bin_value(self, bins):
+        return np.exp(self._log_low + (bins + 0.5) * self._log_gamma)
+
+    def _settle(self, columns, rows, bins):
+        """Move each row's tracked quantile bin after one value per row landed in bins.
+
+        Before the tick each row's bin held the quantile. A value below the bin
+        can only move it down and a value above it only up, by at most one rank,
+        so rows step over a few (mostly empty) bins at most and only the rows
+        still moving are visited.
+        """
+        histograms, quantile_bins, below = self.histograms, self._quantile_bin, self._below
+        rank = self._rank(self.tracked_quantile, self._total[rows])
+        current = quantile_bins[rows]
+        lower = bins < current
+        below[rows] += lower
+        down = lower & (below[rows] >= rank)
+        moving, target = columns[down], rank[down]
+        while len(moving):
+            quantile_bins[moving] -= 1
+            below[moving] -= histograms[moving, quantile_bins[moving]]
+            still = below[moving] >= target
+            moving, target = moving[still], target[still]
+        higher = bins > current
+        moving, target = columns[higher], rank[higher]
+        while len(moving):
+            still = below[moving] + histograms[moving, quantile_bins[moving]] < target
+            moving, target = moving[still], target[still]
+            below[moving] += histograms[moving, quantile_bins[moving]]
+            quantile_bins[moving] += 1
+
+    def _halve(self, columns):
+        """Halve histogram rows about to overflow, then recount their tracked quantile."""
+        self.histograms[columns] >>= 1
+        cumulative = np.cumsum(self.histograms[columns].astype(np.int64), axis=1)
+        self._total[columns] = cumulative[:, -1]
+        bins = np.argmax(cumulative >= self._rank(self.tracked_quantile, cumulative[:, -1])[:, None], axis=1)
+        self._quantile_bin[columns] = bins
+        self._below[columns] = cumulative[np.arange(len(columns)), bins] - self.histograms[columns, bins]
+
+    def _rows(self, columns):
+        """Return a slice when columns are 0..n-1 in order, which is the common tick layout, else columns."""
+        if columns is not self._last_columns:
+            dense = len(columns) and columns[0] == 0 and columns[-1] == len(columns) - 1 and (
+                np.array_equal(columns, np.arange(len(columns))))
+            self._last_columns = columns
+            self._last_rows = slice(0, len(columns)) if dense else columns
+        return self._last_rows
+
+    def _bins(self, values):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            bins = (np.log(values) - self._log_low) / self._log_gamma
+        return np.clip(np.nan_to_num(bins, nan=0, neginf=0), 0, self.bins - 1).astype(np.intp)
+
+    def _ensure_capacity(self, width):
+        if width <= len(self.count):
+            return
+        capacity = max(width, len(self.count) * 2, 16)
+        count = np.zeros(capacity, dtype=np.int64)
+        mean = np.zeros(capacity)
+        variance = np.zeros(capacity)
+        histograms = np.zeros((capacity, self.bins), dtype=np.uint16)
+        count[:len(self.count)] = self.count
+        mean[:len(self.mean)] = self.mean
+        variance[:len(self.variance)] = self.variance
+        histograms[:len(self.histograms)] = self.histograms
+        self.count, self.mean, self.variance, self.histograms = count, mean, variance, histograms
+        for name in ("_total", "_quantile_bin", "_below"):
+            array = getattr(self, name)
+            grown = np.zeros(capacity, dtype=array.dtype)
+            grown[:len(array)] = array
+            setattr(self, name, grown)
@@ -4,14 +4,18 @@ import os  # Add this import
 import logging  # Add this import
 from collections import defaultdict
 import app as app_module  # Import the app module
+import pipeline
 from app import app, generate_metrics, periodic_metrics_generation, display_top_apps
 from metrics_manager import MetricsManager
 from config import *  # Import all configurations
+import tempfile
 import threading
-import importlib
+import numpy as np
 
 class TestApp(unittest.TestCase):
     def setUp(self):
+        app_module.init()  # Create the tick pipeline the app serves
+
         # Create a test client for the Flask app
         self.client = app.test_client()
         app.config['TESTING'] = True
@@ -64,11 +68,11 @@ class TestApp(unittest.TestCase):
         self.assertIn(f'{METRIC_NAME}{{app_name="app1"}} 1000'.encode(), response.data)  # Use METRIC_NAME
         self.assertIn(f'{METRIC_NAME}{{app_name="app2"}} 2000'.encode(), response.data)  # Use METRIC_NAME
 
-    @patch('app.random.randint')  # Mock random.randint to return fixed values
-    def test_generate_metrics(self, mock_randint):
+    @patch('pipeline.metrics_generator.generate')  # Mock the vectorized draw to return fixed values
+    def test_generate_metrics(self, mock_generate):
         """Test the generate_metrics function."""
-        # Mock random.randint to return fixed values
-        mock_randint.return_value = RANDOM_METRIC_MIN  # All metrics will be RANDOM_METRIC_MIN (1)
+        # Mock the draw to return fixed values
+        mock_generate.return_value = np.full(NUM_APPS, RANDOM_METRIC_MIN)  # All metrics will be RANDOM_METRIC_MIN (1)
 
         # Generate metrics
         metrics = generate_metrics()
@@ -81,19 +85,20 @@ class TestApp(unittest.TestCase):
             self.assertEqual(value, RANDOM_METRIC_MIN)  # All values should be RANDOM_METRIC_MIN (1)
 
     @patch('app.time.sleep')  # Mock time.sleep to avoid waiting
-    @patch('app.generate_metrics')  # Mock generate_metrics to control output
-    @patch('app.metrics_manager')  # Mock the metrics_manager used in app
-    def test_periodic_metrics_generation(self, mock_metrics_manager, mock_generate_metrics, mock_sleep):
+    @patch('pipeline.metrics_generator')  # Mock the metrics generator to control output
+    @patch('pipeline.metrics_manager')  # Mock the metrics_manager used by the tick pipeline
+    def test_periodic_metrics_generation(self, mock_metrics_manager, mock_metrics_generator, mock_sleep):
         """Test the periodic_metrics_generation function."""
-        # Mock generate_metrics to return a fixed set of metrics
-        mock_generate_metrics.return_value = {"app1": THRESHOLD + 1, "app2": THRESHOLD - 1}
+        # Mock the generator to return a fixed set of metrics
+        mock_metrics_generator.app_names = ("app1", "app2")
+        mock_metrics_generator.generate.return_value = np.array([THRESHOLD + 1, THRESHOLD - 1])
 
         # Mock the metrics_manager instance and its methods
         mock_metrics_manager.exceedance_count = defaultdict(int)
-        mock_metrics_manager.process_metrics = lambda metrics, threshold: (
+        mock_metrics_manager.process_values = lambda app_names, values, threshold: (
             mock_metrics_manager.exceedance_count.update(
                 {app_name: mock_metrics_manager.exceedance_count[app_name] + 1 
-                 for app_name, value in metrics.items() if value > threshold}
+                 for app_name, value in zip(app_names, values) if value > threshold}
             )
         )
 
@@ -114,8 +119,8 @@ class TestApp(unittest.TestCase):
         # Ensure time.sleep was called
         mock_sleep.assert_called()
 
-        # Ensure generate_metrics was called
-        mock_generate_metrics.assert_called()
+        # Ensure the generator was called
+        mock_metrics_generator.generate.assert_called()
 
         # Verify the exceedance_count is updated
         self.assertEqual(mock_metrics_manager.exceedance_count["app1"], 1)
@@ -167,28 +172,28 @@ class TestApp(unittest.TestCase):
         self.assertEqual(response.status_code, 404)
         self.assertIn(b'Display mode is not set to \'page\' or \'both\'.', response.data)
 
-    @patch('app.DISPLAY_MODE', 'console')  # Mock DISPLAY_MODE to 'console'
-    @patch('builtins.print')  # Mock print to test console output
-    def test_display_top_apps_console(self, mock_print):
+    @patch('pipeline.DISPLAY_MODE', 'console')  # Mock DISPLAY_MODE to 'console'
+    def test_display_top_apps_console(self):
         """Test the display_top_apps function in console mode."""
         top_apps = [("app1", 5), ("app2", 3)]
-        display_top_apps(top_apps)
-        mock_print.assert_called_with(f"Top {TOP_X_APPS} apps exceeding threshold: {top_apps}")
+        with self.assertLogs(logger='app.exceedings', level='INFO') as log:
+            display_top_apps(top_apps)
+        self.assertEqual(log.records[-1].getMessage(), f"Top {TOP_X_APPS} apps exceeding threshold: {top_apps}")
 
-    @patch('app.DISPLAY_MODE', 'page')  # Mock DISPLAY_MODE to 'page'
+    @patch('pipeline.DISPLAY_MODE', 'page')  # Mock DISPLAY_MODE to 'page'
     def test_display_top_apps_page_mode(self):
         """Test the display_top_apps function in page mode."""
         top_apps = [("app1", 5), ("app2", 3)]
         display_top_apps(top_apps)
         # No assertion needed since the function only contains a pass statement
 
-    @patch('app.DISPLAY_MODE', 'both')  # Mock DISPLAY_MODE to 'both'
-    @patch('builtins.print')  # Mock print to test console output
-    def test_display_top_apps_both_mode(self, mock_print):
+    @patch('pipeline.DISPLAY_MODE', 'both')  # Mock DISPLAY_MODE to 'both'
+    def test_display_top_apps_both_mode(self):
         """Test the display_top_apps function in both mode."""
         top_apps = [("app1", 5), ("app2", 3)]
-        display_top_apps(top_apps)
-        mock_print.assert_called_with(f"Top {TOP_X_APPS} apps exceeding threshold: {top_apps}")
+        with self.assertLogs(logger='app.exceedings', level='INFO') as log:
+            display_top_apps(top_apps)
+        self.assertEqual(log.records[-1].getMessage(), f"Top {TOP_X_APPS} apps exceeding threshold: {top_apps}")
 
     @patch('os.makedirs')  # Mock os.makedirs to avoid creating directories
     @patch('builtins.open', new_callable=unittest.mock.mock_open)  # Mock open to avoid file operations
@@ -199,9 +204,9 @@ class TestApp(unittest.TestCase):
         # Mock LOG_TO_FILE to False to prevent the logger from creating directories
         with patch('config.LOG_TO_FILE', False):
             # Test WRITE_EXCEEDINGS_TO_FILE = True
-            with patch('config.WRITE_EXCEEDINGS_TO_FILE', True):
-                importlib.reload(app_module)  # Reload the app module to apply the new configuration
+            with patch('pipeline.WRITE_EXCEEDINGS_TO_FILE', True):  # Read by the tick pipeline on each call
                 app_module.log_exceedings(top_apps)
+                app_module.file_writer.flush()  # Wait for the background writer to write the record
                 mock_makedirs.assert_called_once_with(os.path.dirname(app_module.EXCEEDINGS_FILE_PATH), exist_ok=True)
                 mock_open.assert_called_once_with(app_module.EXCEEDINGS_FILE_PATH, "a")
                 mock_open().write.assert_called()  # Ensure the file is written to
@@ -211,55 +216,52 @@ class TestApp(unittest.TestCase):
             mock_open.reset_mock()
 
             # Test WRITE_EXCEEDINGS_TO_FILE = False
-            with patch('config.WRITE_EXCEEDINGS_TO_FILE', False):
-                importlib.reload(app_module)  # Reload the app module to apply the new configuration
+            with patch('pipeline.WRITE_EXCEEDINGS_TO_FILE', False):  # Read by the tick pipeline on each call
                 app_module.log_exceedings(top_apps)
+                app_module.file_writer.flush()
                 mock_makedirs.assert_not_called()  # Ensure no directories are created
                 mock_open.assert_not_called()  # Ensure no file operations are performed
 
+    def init_logging(self, **settings):
+        """Return the log pipeline set up by init_logging with the LOG_* settings patched, logging to a temporary file."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings.setdefault("LOG_FILE_NAME", os.path.join(directory.name, "app.log"))
+        self.addCleanup(setattr, pipeline.logger, "handlers", pipeline.logger.handlers[:])
+        with patch.multiple(pipeline, log_pipeline=None, **settings):
+            log_pipeline = pipeline.init_logging()
+        self.addCleanup(log_pipeline.stop)
+        return log_pipeline
+
     def test_log_to_console_configuration(self):
         """Test the LOG_TO_CONSOLE configuration."""
-        # Reset the logger's handlers and close any open file handlers
-        for handler in app_module.logger.handlers[:]:
-            if isinstance(handler, logging.FileHandler):
-                handler.close()  # Close the file handler to avoid ResourceWarning
-            app_module.logger.removeHandler(handler)
-
         # Test LOG_TO_CONSOLE = True
-        with patch('config.LOG_TO_CONSOLE', True):
-            importlib.reload(app_module)  # Reload the app module to apply the new configuration
-            self.assertTrue(app_module.LOG_TO_CONSOLE)
-            self.assertTrue(any(isinstance(handler, logging.StreamHandler) for handler in app_module.logger.handlers))
-
-        # Reset the logger's handlers and close any open file handlers
-        for handler in app_module.logger.handlers[:]:
-            if isinstance(handler, logging.FileHandler):
-                handler.close()  # Close the file handler to avoid ResourceWarning
-            app_module.logger.removeHandler(handler)
-        
+        log_pipeline = self.init_logging(LOG_TO_CONSOLE=True, LOG_TO_CONSOLE_ONLY_EXCEEDINGS=False)
+        console = [handler for handler in log_pipeline.handlers if type(handler) is logging.StreamHandler]
+        self.assertEqual(len(console), 1)
+        self.assertEqual(console[0].filters, [])  # Every record reaches the console
+
+        # Test LOG_TO_CONSOLE_ONLY_EXCEEDINGS = True
+        log_pipeline = self.init_logging(LOG_TO_CONSOLE_ONLY_EXCEEDINGS=True)
+        [console] = [handler for handler in log_pipeline.handlers if type(handler) is logging.StreamHandler]
+        self.assertEqual([f.name for f in console.filters], ["app.exceedings"])
+
     def test_log_to_file_configuration(self):
         """Test the LOG_TO_FILE configuration."""
-        # Reset the logger's handlers
-        app_module.logger.handlers.clear()
-
         # Test LOG_TO_FILE = True
-        with patch('config.LOG_TO_FILE', True):
-            importlib.reload(app_module)  # Reload the app module to apply the new configuration
-            self.assertTrue(app_module.LOG_TO_FILE)
-            self.assertTrue(any(isinstance(handler, logging.FileHandler) for handler in app_module.logger.handlers))
-
-        # Reset the logger's handlers
-        app_module.logger.handlers.clear()
+        log_pipeline = self.init_logging(LOG_TO_FILE=True)
+        self.assertTrue(any(isinstance(handler, logging.FileHandler) for handler in log_pipeline.handlers))
+        # The logger itself only enqueues records
+        self.assertEqual([type(handler) for handler in pipeline.logger.handlers], [log_pipeline.handler().__class__])
 
         # Test LOG_TO_FILE = False
-        with patch('config.LOG_TO_FILE', False):
-            importlib.reload(app_module)  # Reload the app module to apply the new configuration
-            self.assertFalse(app_module.LOG_TO_FILE)
-            self.assertFalse(any(isinstance(handler, logging.FileHandler) for handler in app_module.logger.handlers))
+        log_pipeline = self.init_logging(LOG_TO_FILE=False)
+        self.assertFalse(any(isinstance(handler, logging.FileHandler) for handler in log_pipeline.handlers))
 
+    @patch('pipeline.init_logging')  # Leave the log file alone
     @patch('app.threading.Thread')  # Mock threading.Thread to avoid starting a new thread
     @patch('app.app.run')  # Mock app.run to avoid running the Flask app
-    def test_main(self, mock_app_run, mock_thread):
+    def test_main(self, mock_app_run, mock_thread, mock_init_logging):
         """Test the main block when the script is run as the main program."""
         # Import the app module
         import app
@@ -273,8 +275,9 @@ class TestApp(unittest.TestCase):
         mock_thread.assert_called_with(target=app.periodic_metrics_generation, daemon=True)
         mock_thread.return_value.start.assert_called()
 
-        # Verify that app.run was called
+        # Verify that app.run was called, after logging was set up
         mock_app_run.assert_called_with(host="0.0.0.0", port=5000)
+        mock_init_logging.assert_called_once_with()
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
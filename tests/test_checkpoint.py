@@ -0,0 +1,101 @@
+import os
+import json
+import tempfile
+import unittest
+from unittest.mock import patch
+from checkpoint import Checkpointer, save_checkpoint, restore_checkpoint
+from file_writer import BackgroundWriter
+from metrics_manager import MetricsManager
+
+THRESHOLD = 10
+
+class TestCheckpoint(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.checkpoint_path = os.path.join(self.temp_dir.name, "checkpoint.npz")
+        self.log_path = os.path.join(self.temp_dir.name, "metrics_log.txt")
+        self.writer = BackgroundWriter(background=False)
+        self.addCleanup(self.writer.close)
+
+    def new_manager(self):
+        manager = MetricsManager(metrics_file=self.log_path, writer=self.writer, delete_previous=False)
+        manager.write_to_file = True
+        return manager
+
+    def run_ticks(self, manager, ticks):
+        for timestamp, metrics in ticks:
+            with patch('metrics_manager.time.time', return_value=timestamp):
+                manager.store_metrics(metrics)
+            manager.process_metrics(metrics, THRESHOLD)
+
+    def test_restore_counters_and_history(self):
+        """Test that a fresh manager gets the checkpointed counters and recent history back."""
+        manager = self.new_manager()
+        self.run_ticks(manager, [(100 + i, {"app1": 20, "app2": i * 5}) for i in range(5)])
+        save_checkpoint(manager, self.checkpoint_path, history_ticks=3)
+
+        restored = self.new_manager()
+        self.assertEqual(restore_checkpoint(restored, THRESHOLD, self.checkpoint_path), 0)
+        self.assertEqual(restored.get_top_exceedance_apps(5), manager.get_top_exceedance_apps(5))
+        self.assertEqual(list(restored.metrics_history), list(manager.metrics_history)[-3:])
+
+    def test_restore_windows(self):
+        """Test that sliding-window buckets survive a restart."""
+        manager = self.new_manager()
+        with patch('time.time', return_value=1000):
+            self.run_ticks(manager, [(1000, {"app1": 20})])
+            save_checkpoint(manager, self.checkpoint_path)
+            restored = self.new_manager()
+            restore_checkpoint(restored, THRESHOLD, self.checkpoint_path)
+            self.assertEqual(restored.get_top_exceedance_apps(5, window="5m"), [("app1", 1)])
+
+    def test_replays_only_log_tail(self):
+        """Test that ticks logged after the checkpoint are replayed from the saved offset."""
+        manager = self.new_manager()
+        self.run_ticks(manager, [(100 + i, {"app1": 20}) for i in range(3)])
+        save_checkpoint(manager, self.checkpoint_path)
+        self.run_ticks(manager, [(200, {"app1": 20, "app2": 30}), (201, {"app1": 1, "app2": 30})])
+
+        restored = self.new_manager()
+        with patch('checkpoint.json.loads', wraps=json.loads) as mock_loads:
+            replayed = restore_checkpoint(restored, THRESHOLD, self.checkpoint_path)
+        self.assertEqual(replayed, 2)
+        self.assertEqual(mock_loads.call_count, 3)  # Checkpoint metadata plus the two tail lines only
+        self.assertEqual(restored.get_top_exceedance_apps(5), [("app1", 4), ("app2", 2)])
+        self.assertEqual(restored.metrics_history[-1], (201, {"app1": 1, "app2": 30}))
+
+    def test_replay_from_columnar_log(self):
+        """Test that the tail is read from columnar segments by timestamp."""
+        directory = os.path.join(self.temp_dir.name, "columnar")
+        with patch('metrics_manager.METRICS_FILE_FORMAT', 'columnar'), \
+                patch('metrics_manager.METRICS_COLUMNAR_DIR', directory):
+            manager = self.new_manager()
+            self.run_ticks(manager, [(100, {"app1": 20})])
+            save_checkpoint(manager, self.checkpoint_path)
+            self.run_ticks(manager, [(101, {"app1": 30}), (102, {"app1": 1})])
+            restored = self.new_manager()
+        self.assertEqual(restore_checkpoint(restored, THRESHOLD, self.checkpoint_path), 2)
+        self.assertEqual(restored.exceedance_count["app1"], 2)
+
+    def test_missing_checkpoint(self):
+        """Test that startup without a checkpoint leaves the manager empty."""
+        manager = self.new_manager()
+        self.assertIsNone(restore_checkpoint(manager, THRESHOLD, self.checkpoint_path))
+        self.assertEqual(len(manager.metrics_history), 0)
+
+    def test_checkpointer_interval(self):
+        """Test that checkpoints are written at most once per interval."""
+        manager = self.new_manager()
+        self.run_ticks(manager, [(100, {"app1": 20})])
+        checkpointer = Checkpointer(manager, self.checkpoint_path, interval=60)
+        self.assertTrue(checkpointer.maybe_save(1000))
+        checkpointer._thread.join()
+        self.assertFalse(checkpointer.maybe_save(1030))
+        self.assertTrue(checkpointer.maybe_save(1061))
+        checkpointer.save()
+        self.assertTrue(os.path.exists(self.checkpoint_path))
+        self.assertFalse(os.path.exists(self.checkpoint_path + ".tmp"))
+
+if __name__ == "__main__":
+    unittest.main()
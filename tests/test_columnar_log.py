@@ -0,0 +1,110 @@
+import os
+import json
+import tempfile
+import unittest
+import numpy as np
+from unittest.mock import patch
+from columnar_log import ColumnarLogWriter, ColumnarLogReader, convert_json_log, segment_paths, main
+from file_writer import BackgroundWriter
+from metrics_history import AppIndex
+from metrics_manager import MetricsManager
+
+class TestColumnarLog(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.directory = os.path.join(self.temp_dir.name, "columnar")
+        self.app_index = AppIndex()
+
+    def append(self, log_writer, timestamp, metrics):
+        columns = self.app_index.columns(metrics.keys())
+        values = np.fromiter(metrics.values(), dtype=np.int64, count=len(metrics))
+        log_writer.append(timestamp, self.app_index.names, columns, values)
+
+    def test_round_trip(self):
+        """Test that written ticks read back unchanged, including missing apps."""
+        log_writer = ColumnarLogWriter(self.directory)
+        ticks = [
+            (100, {"app1": 1, "app2": 2}),
+            (130, {"app2": 5}),
+            (160, {"app1": 3, "app2": 4, "app3": 9}),  # A new app starts a new segment
+        ]
+        for timestamp, metrics in ticks:
+            self.append(log_writer, timestamp, metrics)
+
+        self.assertEqual(len(segment_paths(self.directory)), 2)
+        self.assertEqual(list(ColumnarLogReader(self.directory).iter_ticks()), ticks)
+
+    def test_fixed_width_records(self):
+        """Test that each tick costs one timestamp plus one value per app."""
+        log_writer = ColumnarLogWriter(self.directory)
+        self.append(log_writer, 100, {f"app{i}": i for i in range(50)})
+        size_one = os.path.getsize(log_writer.path)
+        self.append(log_writer, 130, {f"app{i}": i for i in range(50)})
+        self.assertEqual(os.path.getsize(log_writer.path) - size_one, 8 + 50 * 8)
+
+    def test_range_queries(self):
+        """Test time range selection across segments with memory-mapped views."""
+        log_writer = ColumnarLogWriter(self.directory, max_ticks=3)
+        for i in range(10):
+            self.append(log_writer, 100 + i * 10, {"app1": i, "app2": i * 2})
+        reader = ColumnarLogReader(self.directory)
+        self.assertEqual(len(reader.segments), 4)
+        self.assertIsInstance(reader.segments[0].records, np.memmap)
+
+        timestamps, values = reader.app_series("app2", start=125, end=165)
+        self.assertEqual(timestamps.tolist(), [130, 140, 150, 160])
+        self.assertEqual(values.tolist(), [6, 8, 10, 12])
+
+    def test_partial_record_ignored(self):
+        """Test that a half-written trailing record is not read."""
+        log_writer = ColumnarLogWriter(self.directory)
+        self.append(log_writer, 100, {"app1": 1})
+        with open(log_writer.path, "ab") as file:
+            file.write(b"\x01\x02\x03")
+        self.assertEqual(list(ColumnarLogReader(self.directory).iter_ticks()), [(100, {"app1": 1})])
+
+    def test_convert_json_log(self):
+        """Test converting an existing JSON-lines metrics log."""
+        json_path = os.path.join(self.temp_dir.name, "metrics_log.txt")
+        ticks = [(100 + i, {"app1": i, "app2": 10 + i}) for i in range(5)]
+        with open(json_path, "w") as file:
+            for timestamp, metrics in ticks:
+                file.write(json.dumps({"timestamp": timestamp, "metrics": metrics}) + "\n")
+
+        with patch("builtins.print"):
+            main(["convert", json_path, self.directory])
+        self.assertEqual(list(ColumnarLogReader(self.directory).iter_ticks()), ticks)
+        self.assertEqual(convert_json_log(json_path, os.path.join(self.temp_dir.name, "other")), 5)
+
+    def test_convert_rounds_like_the_history(self):
+        """Test that converted fractional samples are rounded as the live history stores them, not truncated."""
+        json_path = os.path.join(self.temp_dir.name, "metrics_log.txt")
+        metrics = {"app1": 2.6, "app2": 2.4, "app3": -1.7}
+        with open(json_path, "w") as file:
+            file.write(json.dumps({"timestamp": 100, "metrics": metrics}) + "\n")
+        convert_json_log(json_path, self.directory, dtype=np.int64)
+
+        manager = MetricsManager(delete_previous=False)
+        manager.write_to_file = False
+        manager.store_metrics(metrics)
+        self.assertEqual(list(ColumnarLogReader(self.directory).iter_ticks()),
+                         [(100, {"app1": 3, "app2": 2, "app3": -2})])
+        self.assertEqual(manager.metrics_history[-1][1], {"app1": 3, "app2": 2, "app3": -2})
+
+    @patch('metrics_manager.METRICS_FILE_FORMAT', 'columnar')
+    def test_manager_writes_columnar(self):
+        """Test that MetricsManager writes segments when the columnar format is selected."""
+        writer = BackgroundWriter(background=True)
+        self.addCleanup(writer.close)
+        with patch('metrics_manager.METRICS_COLUMNAR_DIR', self.directory):
+            manager = MetricsManager(writer=writer)
+        manager.write_to_file = True
+        manager.store_metrics({"app1": 1, "app2": 2})
+        manager.store_values(("app1", "app2"), np.array([3, 4]))
+        writer.flush()
+        ticks = list(ColumnarLogReader(self.directory).iter_ticks())
+        self.assertEqual([metrics for _, metrics in ticks], [{"app1": 1, "app2": 2}, {"app1": 3, "app2": 4}])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+import unittest
+import numpy as np
+from unittest.mock import patch
+from exceedance import ExceedanceCounter, ExceedanceWindow, top_k
+from metrics_manager import MetricsManager
+from app import app
+
+class TestTopK(unittest.TestCase):
+    def test_matches_full_sort(self):
+        """Test that the partial selection agrees with a stable full sort."""
+        rng = np.random.default_rng(0)
+        counts = rng.integers(0, 20, size=1000)
+        expected = sorted(np.flatnonzero(counts), key=lambda c: -counts[c])[:25]
+        self.assertEqual(top_k(counts, 25).tolist(), expected)
+
+    def test_fewer_candidates_than_k(self):
+        """Test that only apps with a non-zero count are returned."""
+        counts = np.array([0, 3, 0, 1])
+        self.assertEqual(top_k(counts, 10).tolist(), [1, 3])
+        self.assertEqual(top_k(counts, 0).tolist(), [])
+
+class TestExceedanceCounter(unittest.TestCase):
+    def setUp(self):
+        self.counter = ExceedanceCounter()
+
+    def test_record_snapshot(self):
+        """Test that one vectorized pass counts every value above the threshold."""
+        columns = self.counter.app_index.columns(["app1", "app2", "app3"])
+        self.counter.record(columns, np.array([5, 20, 30]), 10)
+        self.counter.record(columns, np.array([15, 5, 30]), 10)
+        self.assertEqual(self.counter["app1"], 1)
+        self.assertEqual(self.counter["app2"], 1)
+        self.assertEqual(self.counter["app3"], 2)
+        self.assertEqual(self.counter["unknown"], 0)
+        self.assertEqual(self.counter.top(2), [("app3", 2), ("app1", 1)])
+
+    def test_dict_like_access(self):
+        """Test the mapping helpers kept from the old defaultdict."""
+        self.counter.update({"app1": 4, "app2": 0})
+        self.assertEqual(len(self.counter), 1)
+        self.assertEqual(self.counter.items(), [("app1", 4)])
+        self.assertIn("app1", self.counter)
+        self.assertNotIn("app2", self.counter)
+        self.counter.clear()
+        self.assertEqual(len(self.counter), 0)
+
+    def test_manager_uses_shared_index(self):
+        """Test that processing a dict snapshot updates the manager counters."""
+        manager = MetricsManager()
+        manager.process_metrics({"app1": 1, "app2": 100}, 10)
+        manager.process_metrics({"app2": 100, "app1": 100}, 10)
+        self.assertEqual(manager.get_top_exceedance_apps(5), [("app2", 2), ("app1", 1)])
+
+class TestExceedanceWindow(unittest.TestCase):
+    def setUp(self):
+        self.window = ExceedanceWindow(span=60, buckets=6)  # 10 second buckets
+        self.columns = self.window.app_index.columns(["app1", "app2"])
+
+    def test_old_buckets_expire(self):
+        """Test that exceedances drop out once their bucket leaves the window."""
+        self.window.add(0, self.columns, np.array([True, False]))
+        self.window.add(30, self.columns, np.array([True, True]))
+        self.assertEqual(self.window.top(5, now=30), [("app1", 2), ("app2", 1)])
+        self.assertEqual(self.window.top(5, now=65), [("app1", 1), ("app2", 1)])
+        self.assertEqual(self.window.top(5, now=95), [])
+
+    def test_long_gap_clears_everything(self):
+        """Test that a gap longer than the window expires every bucket at once."""
+        self.window.add(0, self.columns, np.array([True, True]))
+        self.window.add(10000, self.columns, np.array([False, True]))
+        self.assertEqual(self.window.top(5), [("app2", 1)])
+        self.assertEqual(self.window.ring.sum(), 1)
+
+    def test_late_tick_counts_in_newest_bucket(self):
+        """Test that an out-of-order tick does not move the window backwards."""
+        self.window.add(50, self.columns, np.array([True, False]))
+        self.window.add(20, self.columns, np.array([True, False]))
+        self.assertEqual(self.window["app1"], 2)
+
+    def test_bucket_counts_do_not_wrap(self):
+        """Test that more than 65535 exceedances in one bucket, as with pushes at a short interval, are all counted."""
+        exceeded = np.array([True, False])
+        for i in range(70000):
+            self.window.add(i / 10000, self.columns, exceeded)
+        self.assertEqual(self.window["app1"], 70000)
+        self.assertEqual(self.window.top(5, now=65), [])  # Expiry subtracts the full bucket
+
+class TestWindowedTopApps(unittest.TestCase):
+    def setUp(self):
+        self.manager = MetricsManager()
+
+    @patch('metrics_manager.time.time', return_value=100000)
+    def test_several_windows_at_once(self, mock_time):
+        """Test that lifetime and windowed rankings are maintained together."""
+        self.manager.process_metrics({"app1": 20, "app2": 1}, 10, timestamp=100000 - 7200)
+        self.manager.process_metrics({"app1": 1, "app2": 20}, 10, timestamp=100000 - 60)
+        self.assertEqual(self.manager.get_top_exceedance_apps(5), [("app1", 1), ("app2", 1)])
+        self.assertEqual(self.manager.get_top_exceedance_apps(5, window="5m"), [("app2", 1)])
+        self.assertEqual(self.manager.get_top_exceedance_apps(5, window="24h"), [("app1", 1), ("app2", 1)])
+
+    def test_unknown_window(self):
+        """Test that an unknown window name is rejected."""
+        with self.assertRaises(KeyError):
+            self.manager.get_top_exceedance_apps(5, window="1y")
+
+    @patch('app.DISPLAY_MODE', 'page')
+    def test_exceeding_endpoint_window(self):
+        """Test the window parameter of the /exceeding page."""
+        self.manager.process_metrics({"app1": 20}, 10)
+        client = app.test_client()
+        with patch('app.metrics_manager', self.manager):
+            response = client.get('/exceeding?window=5m')
+            self.assertEqual(response.status_code, 200)
+            self.assertIn(b'in the Last 5m', response.data)
+            self.assertIn(b'app1', response.data)
+            self.assertEqual(client.get('/exceeding?window=1y').status_code, 400)
+
+if __name__ == "__main__":
+    unittest.main()
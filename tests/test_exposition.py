@@ -0,0 +1,123 @@
+import gzip
+import unittest
+from unittest.mock import patch
+from app import app
+from metrics_manager import MetricsManager
+from exposition import ExpositionCache, render_prometheus, iter_exposition, negotiate_format
+from config import METRIC_NAME
+
+class TestExpositionCache(unittest.TestCase):
+    def test_render_prometheus(self):
+        """Test the text rendering of names and values."""
+        text = render_prometheus(["app1", "app2"], [1, 2], "m")
+        self.assertEqual(text, 'm{app_name="app1"} 1\nm{app_name="app2"} 2')
+
+    def test_escapes_label_values(self):
+        """Test that quotes, backslashes and newlines in scraped app names cannot break the exposition."""
+        names = ['a"b', "c\\d", "e\nf"]
+        expected = 'm{app_name="a\\"b"} 1\nm{app_name="c\\\\d"} 2\nm{app_name="e\\nf"} 3'
+        self.assertEqual(render_prometheus(names, [1, 2, 3], "m"), expected)
+        self.assertEqual("".join(iter_exposition(names, [1, 2, 3], "m", chunk_lines=2)), expected + "\n")
+
+    def test_update_swaps_immutable_body(self):
+        """Test that each update publishes a new immutable exposition."""
+        cache = ExpositionCache()
+        first = cache.update(100, ["app1"], [1])
+        second = cache.update(100, ["app1"], [2])
+        self.assertIsNot(first, second)
+        self.assertNotEqual(first.etag, second.etag)
+        self.assertEqual(gzip.decompress(second.gzip_body), second.body)
+        with self.assertRaises(AttributeError):
+            second.body = b""
+
+    def test_iter_exposition_chunks(self):
+        """Test that streaming yields bounded chunks equal to the full rendering."""
+        names = [f"app{i}" for i in range(10)]
+        chunks = list(iter_exposition(names, list(range(10)), "m", chunk_lines=3))
+        self.assertEqual(len(chunks), 4)
+        self.assertEqual("".join(chunks), render_prometheus(names, range(10), "m") + "\n")
+
+    def test_iter_exposition_openmetrics(self):
+        """Test the OpenMetrics metadata, timestamps and EOF marker."""
+        text = "".join(iter_exposition(["app1"], [5], "m", timestamp=123, openmetrics=True))
+        lines = text.splitlines()
+        self.assertTrue(lines[0].startswith("# HELP m "))
+        self.assertEqual(lines[1], "# TYPE m gauge")
+        self.assertEqual(lines[2], 'm{app_name="app1"} 5 123')
+        self.assertEqual(lines[3], "# EOF")
+
+    def test_negotiate_format(self):
+        """Test content negotiation with the Accept header Prometheus sends."""
+        prometheus_accept = [
+            ("application/openmetrics-text; version=1.0.0", 0.5),
+            ("text/plain; version=0.0.4", 0.3),
+            ("*/*", 0.2),
+        ]
+        self.assertEqual(negotiate_format(prometheus_accept), "openmetrics")
+        self.assertEqual(negotiate_format([("*/*", 1)]), "prometheus")
+        self.assertEqual(negotiate_format([]), "prometheus")
+
+class TestCachedMetricsEndpoint(unittest.TestCase):
+    def setUp(self):
+        self.client = app.test_client()
+        self.manager = MetricsManager()
+        self.manager.write_to_file = False
+        self.manager.store_metrics({"app1": 1000, "app2": 2000})
+        self.manager.render_exposition()
+        self.manager.publish_snapshot()
+        patcher = patch('app.metrics_manager', self.manager)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_serves_cached_body(self):
+        """Test that /metrics returns the body rendered at the last tick."""
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, self.manager.exposition.current.body)
+        self.assertIn(f'{METRIC_NAME}{{app_name="app2"}} 2000'.encode(), response.data)
+        self.assertEqual(response.headers["ETag"], f'"{self.manager.exposition.current.etag}"')
+        self.assertIn("Last-Modified", response.headers)
+
+    def test_not_modified(self):
+        """Test that a matching If-None-Match gets a 304 without a body."""
+        etag = self.client.get('/metrics').headers["ETag"]
+        response = self.client.get('/metrics', headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b"")
+
+        # A new tick changes the ETag
+        self.manager.store_metrics({"app1": 1, "app2": 2})
+        self.manager.render_exposition()
+        self.manager.publish_snapshot()
+        response = self.client.get('/metrics', headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+
+    def test_gzip_variant(self):
+        """Test that the pre-gzipped body is chosen by Accept-Encoding."""
+        response = self.client.get('/metrics', headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(response.data), self.manager.exposition.current.body)
+
+        response = self.client.get('/metrics', headers={"Accept-Encoding": "gzip;q=0"})
+        self.assertNotIn("Content-Encoding", response.headers)
+
+    def test_openmetrics_variant(self):
+        """Test that OpenMetrics clients get the pre-rendered OpenMetrics body."""
+        response = self.client.get('/metrics', headers={"Accept": "application/openmetrics-text; version=1.0.0"})
+        self.assertTrue(response.content_type.startswith("application/openmetrics-text"))
+        self.assertTrue(response.data.endswith(b"# EOF\n"))
+        self.assertNotEqual(response.headers["ETag"], self.client.get('/metrics').headers["ETag"])
+
+    @patch('app.METRICS_STREAMING', True)
+    def test_streaming_mode(self):
+        """Test that streaming mode serves the latest snapshot in chunks."""
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_streamed)
+        self.assertIn(f'{METRIC_NAME}{{app_name="app1"}} 1000\n'.encode(), response.data)
+
+        response = self.client.get('/metrics', headers={"Accept": "application/openmetrics-text"})
+        self.assertTrue(response.data.endswith(b"# EOF\n"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import os
+import json
+import tempfile
+import unittest
+from unittest.mock import patch
+from file_writer import BackgroundWriter
+
+class TestBackgroundWriter(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.path = os.path.join(self.temp_dir.name, "nested", "log.txt")
+
+    def read_lines(self):
+        with open(self.path, "r") as file:
+            return [json.loads(line) for line in file]
+
+    def test_background_batches_and_flush(self):
+        """Test that queued JSON records are written once flushed."""
+        writer = BackgroundWriter(background=True, batch_size=10, flush_interval=60)
+        self.addCleanup(writer.close)
+        for i in range(25):
+            writer.write_json(self.path, {"tick": i})
+        self.assertTrue(writer.flush(timeout=5))
+        self.assertEqual([record["tick"] for record in self.read_lines()], list(range(25)))
+        self.assertEqual(writer.stats()["records_written"], 25)
+        self.assertGreaterEqual(writer.stats()["batches_written"], 3)
+
+    def test_handle_stays_open(self):
+        """Test that the file is opened once for many records."""
+        writer = BackgroundWriter(background=False)
+        self.addCleanup(writer.close)
+        with patch("builtins.open", wraps=open) as mock_open:
+            for i in range(5):
+                writer.write_json(self.path, {"tick": i})
+        self.assertEqual(mock_open.call_count, 1)
+        self.assertEqual(len(self.read_lines()), 5)
+
+    def test_reopens_removed_file(self):
+        """Test that a removed file is recreated instead of writing to a stale handle."""
+        writer = BackgroundWriter(background=False)
+        self.addCleanup(writer.close)
+        writer.write_json(self.path, {"tick": 1})
+        os.remove(self.path)
+        writer.write_json(self.path, {"tick": 2})
+        self.assertEqual(self.read_lines(), [{"tick": 2}])
+
+    def test_fsync_durability(self):
+        """Test that the fsync level forces every batch to disk."""
+        writer = BackgroundWriter(background=False, durability="fsync")
+        self.addCleanup(writer.close)
+        with patch("file_writer.os.fsync") as mock_fsync:
+            writer.write(self.path, "line\n")
+        mock_fsync.assert_called_once()
+
+    def test_close_writes_pending_records(self):
+        """Test that close flushes everything still queued, as the atexit hook relies on."""
+        writer = BackgroundWriter(background=True, batch_size=1000, flush_interval=60, durability="none")
+        writer.write(self.path, b"a\n")
+        writer.write(self.path, b"b\n")
+        writer.close(timeout=5)
+        with open(self.path, "rb") as file:
+            self.assertEqual(file.read(), b"a\nb\n")
+        self.assertEqual(writer.stats()["queue_depth"], 0)
+
+    def test_failed_write_keeps_thread_running(self):
+        """Test that a batch that cannot be written is dropped and logged, and flush and close still return."""
+        writer = BackgroundWriter(background=True, batch_size=1, flush_interval=60)
+        self.addCleanup(writer.close)
+        with self.assertLogs("app.file_writer", level="ERROR"):
+            writer.write(self.temp_dir.name, "into a directory\n")  # Opening a directory for append fails
+            self.assertTrue(writer.flush(timeout=5))
+        writer.write_json(self.path, {"tick": 1})
+        self.assertTrue(writer.flush(timeout=5))
+        self.assertEqual(self.read_lines(), [{"tick": 1}])
+        self.assertEqual(writer.stats()["write_errors"], 1)
+
+    def test_invalid_durability(self):
+        """Test that an unknown durability level is rejected."""
+        with self.assertRaises(ValueError):
+            BackgroundWriter(durability="sometimes")
+
+if __name__ == "__main__":
+    unittest.main()
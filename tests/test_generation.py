@@ -0,0 +1,73 @@
+import unittest
+import numpy as np
+from generation import MetricsGenerator, DISTRIBUTIONS, register_distribution
+from metrics_manager import MetricsManager
+
+class TestMetricsGenerator(unittest.TestCase):
+    def test_app_names_built_once(self):
+        """Test that the app name table is reused across ticks."""
+        generator = MetricsGenerator(num_apps=5, seed=1)
+        names = generator.app_names
+        generator.generate()
+        self.assertIs(generator.app_names, names)
+        self.assertEqual(names, ("app1", "app2", "app3", "app4", "app5"))
+
+    def test_reusable_buffer(self):
+        """Test that every tick is drawn into the same output buffer."""
+        generator = MetricsGenerator(num_apps=100, seed=1)
+        first = generator.generate()
+        second = generator.generate()
+        self.assertIs(first, second)
+        self.assertEqual(second.dtype, np.int64)
+
+    def test_distributions_stay_in_range(self):
+        """Test that every built-in distribution respects the configured range."""
+        for name in DISTRIBUTIONS:
+            with self.subTest(distribution=name):
+                generator = MetricsGenerator(num_apps=1000, low=10, high=20, distribution=name, seed=3)
+                for _ in range(5):
+                    values = generator.generate()
+                    self.assertGreaterEqual(values.min(), 10)
+                    self.assertLessEqual(values.max(), 20)
+
+    def test_uniform_covers_both_bounds(self):
+        """Test that the uniform draw includes both ends like random.randint."""
+        values = MetricsGenerator(num_apps=10000, low=1, high=3, seed=7).generate()
+        self.assertEqual(sorted(set(values.tolist())), [1, 2, 3])
+
+    def test_seed_is_reproducible(self):
+        """Test that the same seed produces the same ticks."""
+        first = MetricsGenerator(num_apps=50, seed=42).generate_dict()
+        second = MetricsGenerator(num_apps=50, seed=42).generate_dict()
+        self.assertEqual(first, second)
+
+    def test_unknown_distribution(self):
+        """Test that an unknown distribution name is rejected."""
+        with self.assertRaises(ValueError):
+            MetricsGenerator(num_apps=1, distribution="missing")
+
+    def test_register_distribution(self):
+        """Test plugging in a custom distribution."""
+        class Constant:
+            def __init__(self, num_apps, low, high):
+                self.value = high
+
+            def sample(self, rng, out, tick):
+                out.fill(self.value)
+
+        register_distribution("constant", Constant)
+        self.addCleanup(DISTRIBUTIONS.pop, "constant")
+        values = MetricsGenerator(num_apps=3, low=1, high=9, distribution="constant").generate()
+        self.assertEqual(values.tolist(), [9, 9, 9])
+
+    def test_store_values(self):
+        """Test that array snapshots are stored like dict snapshots."""
+        generator = MetricsGenerator(num_apps=3, seed=5)
+        manager = MetricsManager()
+        manager.write_to_file = False
+        values = generator.generate()
+        manager.store_values(generator.app_names, values)
+        self.assertEqual(manager.metrics_history[-1][1], dict(zip(generator.app_names, values.tolist())))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+import gzip
+import time
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+from ingestion import AsyncScraper, parse_exposition
+from metrics_manager import MetricsManager
+
+METRIC = "bigquery_written_bytes"
+
+def exposition(first, count, value=20000):
+    lines = [f"# HELP {METRIC} Bytes written.", f"# TYPE {METRIC} gauge"]
+    lines += [f'{METRIC}{{app_name="app{i}",region="eu"}} {value + i}' for i in range(first, first + count)]
+    return "\n".join(lines) + "\n"
+
+class ExporterHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, like real exporters
+
+    def do_GET(self):
+        server = self.server
+        if server.delay:
+            time.sleep(server.delay)
+        body = server.body.encode()
+        gzipped = server.gzip and "gzip" in self.headers.get("Accept-Encoding", "")
+        if gzipped:
+            body = gzip.compress(body)
+            if server.gzip == "truncated":
+                body = body[:len(body) // 2]
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        if gzipped:
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+class TestParseExposition(unittest.TestCase):
+    def test_parse(self):
+        """Test that only samples of the metric with an app label are read, summed per app."""
+        text = (
+            "# HELP bigquery_written_bytes Bytes.\n"
+            'bigquery_written_bytes{app_name="app1"} 10\n'
+            'bigquery_written_bytes{region="eu",app_name="app1"} 5 1700000000000\n'
+            'bigquery_written_bytes{note="a}b,c",app_name="app\\"2\\""} 2.5e3\n'
+            'bigquery_written_bytes{app_name="app3"} NaN\n'
+            'bigquery_written_bytes{region="us"} 7\n'
+            'bigquery_written_bytes_total{app_name="app4"} 1\n'
+            'other_metric{app_name="app5"} 1\n'
+        )
+        self.assertEqual(parse_exposition(text, METRIC, "app_name"), {"app1": 15, 'app"2"': 2500})
+
+class TestAsyncScraper(unittest.TestCase):
+    def start_exporter(self, body, delay=0, use_gzip=False):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), ExporterHandler)
+        server.daemon_threads = True
+        server.body, server.delay, server.gzip, server.connections = body, delay, use_gzip, 0
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server, f"http://127.0.0.1:{server.server_address[1]}/metrics"
+
+    def test_scrapes_thousands_of_series(self):
+        """Test that all targets are merged and their connections are reused between ticks."""
+        servers, urls = zip(*(self.start_exporter(exposition(i * 2000, 2000), use_gzip=i == 0) for i in range(3)))
+        scraper = AsyncScraper(urls, timeout=5, metric_name=METRIC, app_label="app_name")
+        self.addCleanup(scraper.close)
+
+        for _ in range(3):
+            metrics = scraper.scrape()
+        self.assertEqual(len(metrics), 6000)
+        self.assertEqual(metrics["app4500"], 20000 + 4500)
+        self.assertEqual([server.connections for server in servers], [1, 1, 1])
+        self.assertTrue(all(stats["up"] and stats["series"] == 2000 for stats in scraper.stats().values()))
+
+    def test_slow_target_times_out(self):
+        """Test that a target slower than the timeout is marked down without holding back the others."""
+        _, fast = self.start_exporter(exposition(0, 10))
+        _, slow = self.start_exporter(exposition(10, 10), delay=1)
+        scraper = AsyncScraper([fast, slow], timeout=0.2, metric_name=METRIC, app_label="app_name")
+        self.addCleanup(scraper.close)
+
+        with self.assertLogs("app.ingestion", level="WARNING"):
+            metrics = scraper.scrape()
+        self.assertEqual(sorted(metrics), sorted(f"app{i}" for i in range(10)))
+        self.assertFalse(scraper.stats()[slow]["up"])
+        self.assertEqual(scraper.stats()[slow]["errors"], 1)
+
+    def test_corrupt_gzip_marks_target_down(self):
+        """Test that a target sending a truncated gzip body is marked down without failing the tick."""
+        _, good = self.start_exporter(exposition(0, 10))
+        _, corrupt = self.start_exporter(exposition(10, 10), use_gzip="truncated")
+        scraper = AsyncScraper([good, corrupt], timeout=5, metric_name=METRIC, app_label="app_name")
+        self.addCleanup(scraper.close)
+
+        with self.assertLogs("app.ingestion", level="WARNING"):
+            metrics = scraper.scrape()
+        self.assertEqual(sorted(metrics), sorted(f"app{i}" for i in range(10)))
+        self.assertFalse(scraper.stats()[corrupt]["up"])
+        self.assertIn("Invalid gzip body", scraper.stats()[corrupt]["last_error"])
+
+    def test_feeds_the_pipeline(self):
+        """Test that a scraping tick stores and counts the scraped samples."""
+        import pipeline
+
+        _, url = self.start_exporter(exposition(0, 100, value=9950))
+        scraper = AsyncScraper([url], metric_name=METRIC, app_label="app_name")
+        self.addCleanup(scraper.close)
+        manager = MetricsManager()
+        manager.write_to_file = False
+        with patch('pipeline.scraper', scraper), patch('pipeline.metrics_manager', manager), \
+                patch('pipeline.THRESHOLD', 10000), patch('pipeline.DISPLAY_INTERVAL', 0):
+            pipeline.generate_tick()
+        self.assertEqual(len(manager.metrics_history[-1][1]), 100)
+        self.assertEqual(manager.exceedance_count["app51"], 1)  # 9950 + 51 is over the threshold
+        self.assertEqual(manager.exceedance_count["app50"], 0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+from unittest.mock import patch
+from instrumentation import Histogram, Registry, timed
+from metrics_manager import MetricsManager
+from serving import SharedSnapshotBuffer, SharedSnapshotView
+
+class TestInstrumentation(unittest.TestCase):
+    def test_histogram_render(self):
+        """Test that observations land in cumulative buckets of the Prometheus text format."""
+        registry = Registry()
+        histogram = registry.histogram("test_seconds", "Test timings.", buckets=(0.1, 1))
+        for value in (0.05, 0.1, 0.5, 3):
+            histogram.observe(value)
+        lines = registry.render().splitlines()
+        self.assertEqual(lines[:2], ["# HELP test_seconds Test timings.", "# TYPE test_seconds histogram"])
+        self.assertEqual(lines[2:5], ['test_seconds_bucket{le="0.1"} 2', 'test_seconds_bucket{le="1"} 3',
+                                      'test_seconds_bucket{le="+Inf"} 4'])
+        self.assertEqual(lines[5:], ["test_seconds_sum 3.65", "test_seconds_count 4"])
+
+    def test_labelled_counter_and_callback_gauge(self):
+        registry = Registry()
+        counter = registry.counter("test_total", "Test count.", ["endpoint"])
+        counter.inc("metrics")
+        counter.inc("metrics", amount=2)
+        registry.gauge("test_bytes", "Test size.", func=lambda: 42)
+        rendered = registry.render()
+        self.assertIn('test_total{endpoint="metrics"} 3\n', rendered)
+        self.assertIn("test_bytes 42\n", rendered)
+
+    def test_timed(self):
+        """Test that timed records each call, and leaves the function untouched when disabled."""
+        histogram = Histogram("test_seconds", "Test timings.")
+
+        def work(x):
+            return x * 2
+
+        self.assertEqual(timed(histogram)(work)(2), 4)
+        self.assertEqual(histogram.counts[-1] + sum(histogram.counts[:-1]), 1)
+        with patch('instrumentation.INSTRUMENTATION_ENABLED', False):
+            self.assertIs(timed(histogram)(work), work)
+
+class TestInternalMetricsEndpoint(unittest.TestCase):
+    def setUp(self):
+        import app as app_module
+        app_module.init()
+        self.app_module = app_module
+        self.client = app_module.app.test_client()
+
+    def test_internal_metrics(self):
+        """Test that /internal/metrics reports hot-path timings, state and scrape counts."""
+        self.app_module.generate_tick()
+        self.client.get('/metrics')
+        body = self.client.get('/internal/metrics').data.decode()
+        for name in ("metrics_app_generate_seconds_count", "metrics_app_store_seconds_count",
+                     "metrics_app_process_seconds_count", "metrics_app_top_apps_seconds_count",
+                     "metrics_app_render_seconds_count", "metrics_app_metrics_request_seconds_count",
+                     "metrics_app_history_bytes", "metrics_app_ticks_behind"):
+            self.assertIn(f"\n{name} ", body)
+        self.assertIn('metrics_app_scrapes_total{endpoint="metrics"}', body)
+
+    @patch('app.INSTRUMENTATION_ENABLED', False)
+    def test_disabled(self):
+        self.assertEqual(self.client.get('/internal/metrics').status_code, 404)
+
+    def test_production_worker_serves_generator_figures(self):
+        """Test that a worker serves the tick figures published with the generator's snapshot."""
+        buffer = SharedSnapshotBuffer(create=True)
+        self.addCleanup(buffer.unlink)
+        self.addCleanup(buffer.close)
+        manager = MetricsManager()
+        manager.write_to_file = False
+        manager.store_metrics({"app1": 1})
+        buffer.publish(manager.publish_snapshot(internal_metrics="generator_figure 7\n"))
+
+        with patch('app.metrics_manager', SharedSnapshotView(buffer)):
+            body = self.client.get('/internal/metrics').data.decode()
+        self.assertTrue(body.startswith("generator_figure 7\n"))
+        self.assertIn("metrics_app_scrapes_total", body)
+        self.assertNotIn("metrics_app_generate_seconds", body)
+
+if __name__ == "__main__":
+    unittest.main()
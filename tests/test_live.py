@@ -0,0 +1,120 @@
+import json
+import threading
+import unittest
+from unittest.mock import patch
+from live import KEEPALIVE_EVENT, TopAppsBroadcaster
+from metrics_manager import MetricsManager
+
+def parse_event(payload):
+    """Return (event, data) of one encoded SSE event."""
+    fields = dict(line.split(": ", 1) for line in payload.decode().strip().split("\n"))
+    return fields["event"], json.loads(fields["data"])
+
+class TestTopAppsBroadcaster(unittest.TestCase):
+    def setUp(self):
+        self.manager = MetricsManager()
+        self.manager.write_to_file = False
+        self.broadcaster = TopAppsBroadcaster(top_x=3, queue_size=4)
+        self.manager.snapshot_listeners.append(self.broadcaster.publish)
+
+    def tick(self, metrics):
+        self.manager.process_metrics(metrics, 10)
+        return self.manager.publish_snapshot()
+
+    def test_primes_then_sends_changed_rows(self):
+        """Test that a subscriber gets the full ranking first, then only rows that changed."""
+        self.tick({"app1": 20, "app2": 20, "app3": 5})
+        subscription = self.broadcaster.subscribe()
+        event, data = parse_event(subscription.queue.get_nowait())
+        self.assertEqual(event, "update")
+        self.assertEqual(data["rows"], [{"rank": 1, "app_name": "app1", "count": 1},
+                                        {"rank": 2, "app_name": "app2", "count": 1}])
+
+        self.tick({"app1": 5, "app2": 20, "app3": 20})
+        _, data = parse_event(subscription.queue.get_nowait())
+        self.assertEqual((data["size"], data["window"]), (3, None))
+        self.assertEqual(data["rows"], [{"rank": 1, "app_name": "app2", "count": 2},
+                                        {"rank": 2, "app_name": "app1", "count": 1},
+                                        {"rank": 3, "app_name": "app3", "count": 1}])
+        self.tick({"app1": 5, "app2": 5, "app3": 5})  # Nothing changes, nothing is sent
+        self.assertTrue(subscription.queue.empty())
+
+    def test_fan_out_shares_one_payload(self):
+        """Test that every subscriber of a window receives the same encoded event."""
+        subscriptions = [self.broadcaster.subscribe("5m") for _ in range(1000)]
+        self.assertEqual(len(self.broadcaster), 1000)
+        self.tick({"app1": 20})
+        payloads = {id(subscription.queue.get_nowait()) for subscription in subscriptions}
+        self.assertEqual(len(payloads), 1)
+
+    def test_slow_subscriber_is_dropped(self):
+        """Test that a subscriber whose queue fills up ends its stream and unsubscribes."""
+        subscription = self.broadcaster.subscribe()
+        for _ in range(6):
+            self.tick({"app1": 20})
+        self.assertTrue(subscription.overflowed)
+        events = list(self.broadcaster.stream(subscription, keepalive=0.01))
+        self.assertEqual(events, [])
+        self.assertEqual(len(self.broadcaster), 0)
+
+    def test_stream_sends_keepalives(self):
+        subscription = self.broadcaster.subscribe()
+        stream = self.broadcaster.stream(subscription, keepalive=0.01)
+        self.assertEqual(next(stream), KEEPALIVE_EVENT)
+        stream.close()  # Like a client that disconnected
+        self.assertEqual(len(self.broadcaster), 0)
+
+    def test_follow_publishes_new_snapshots(self):
+        """Test that a worker following shared snapshots publishes each new one once."""
+        snapshot = self.tick({"app1": 20})
+        broadcaster = TopAppsBroadcaster(top_x=3)
+        follower_subscription = broadcaster.subscribe()
+        stop = threading.Event()
+        thread = threading.Thread(target=broadcaster.follow, args=(lambda: snapshot, 0.001, stop))
+        thread.start()
+        _, data = parse_event(follower_subscription.queue.get(timeout=5))
+        stop.set()
+        thread.join()
+        self.assertEqual(data["sequence"], snapshot.sequence)
+        self.assertTrue(follower_subscription.queue.empty())
+
+class TestExceedingRoutes(unittest.TestCase):
+    def setUp(self):
+        import app as app_module
+        self.app_module = app_module
+        self.client = app_module.app.test_client()
+        self.manager = MetricsManager()
+        self.manager.write_to_file = False
+        self.manager.process_metrics({"app1": 20, "app2": 5}, 10)
+        self.manager.publish_snapshot()
+        self.broadcaster = TopAppsBroadcaster()
+        self.broadcaster.publish(self.manager.snapshot)
+        for target, value in (('app.metrics_manager', self.manager), ('app.DISPLAY_MODE', 'page'),
+                              ('app.live_updates', self.broadcaster)):
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_json(self):
+        response = self.client.get('/api/v1/exceeding?window=1h')
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()["data"]
+        self.assertEqual((data["window"], data["sequence"]), ("1h", 1))
+        self.assertEqual(data["rows"], [{"rank": 1, "app_name": "app1", "count": 1}])
+        self.assertEqual(self.client.get('/api/v1/exceeding?window=1y').status_code, 400)
+
+    def test_stream(self):
+        response = self.client.get('/api/v1/exceeding/stream', buffered=False)
+        self.assertEqual(response.mimetype, "text/event-stream")
+        event, data = parse_event(next(response.response))
+        self.assertEqual((event, data["rows"][0]["app_name"]), ("update", "app1"))
+        response.close()
+        self.assertEqual(len(self.broadcaster), 0)
+
+    def test_page_subscribes(self):
+        response = self.client.get('/exceeding?window=5m')
+        self.assertIn(b'new EventSource', response.data)
+        self.assertIn(b'/api/v1/exceeding/stream', response.data)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,177 @@
+import json
+import logging
+import logging.handlers
+import os
+import tempfile
+import threading
+import unittest
+from log_pipeline import (
+    DroppingQueueHandler, JsonFormatter, LogPipeline, RateLimitFilter, file_handler, make_formatter, setup_logging,
+    stop_pipelines,
+)
+from instrumentation import LOG_RECORDS_DROPPED_TOTAL
+
+class ListHandler(logging.Handler):
+    """Keeps the formatted messages, optionally blocking until released."""
+
+    def __init__(self, gate=None):
+        super().__init__()
+        self.gate = gate
+        self.messages = []
+        self.threads = set()
+
+    def emit(self, record):
+        if self.gate is not None:
+            self.gate.wait()
+        self.threads.add(threading.current_thread())
+        self.messages.append(self.format(record))
+
+def make_record(msg, *args, level=logging.INFO, created=None):
+    record = logging.LogRecord("test", level, __file__, 1, msg, args, None)
+    if created is not None:
+        record.created = created
+    return record
+
+class TestRateLimitFilter(unittest.TestCase):
+    def test_limits_each_message_type(self):
+        """Test that each template gets its own budget per interval and the next one reports the suppressed count."""
+        limiter = RateLimitFilter(limit=2, interval=1)
+        passed = [limiter.filter(make_record("Serving %s", i, created=100)) for i in range(5)]
+        self.assertEqual(passed, [True, True, False, False, False])
+        self.assertTrue(limiter.filter(make_record("Other message", created=100)))
+        self.assertTrue(limiter.filter(make_record("Failed %s", 1, level=logging.WARNING, created=100)))
+
+        record = make_record("Serving %s", 5, created=101)
+        self.assertTrue(limiter.filter(record))
+        self.assertEqual(record.suppressed, 3)
+        self.assertEqual(record.getMessage(), "Serving 5")  # Other handlers see the record unchanged
+        self.assertEqual(make_formatter("text", "%(message)s").format(record),
+                         "Serving 5 (3 similar messages suppressed)")
+        self.assertEqual(json.loads(JsonFormatter().format(record))["suppressed"], 3)
+
+    def test_any_message_object(self):
+        """Test that unhashable messages are limited by their text, and levels get separate budgets."""
+        limiter = RateLimitFilter(limit=1, interval=1)
+        self.assertTrue(limiter.filter(make_record({"tick": 1}, created=100)))
+        self.assertFalse(limiter.filter(make_record({"tick": 1}, created=100)))
+        self.assertTrue(limiter.filter(make_record({"tick": 1}, level=logging.DEBUG, created=100)))
+
+class TestLogPipeline(unittest.TestCase):
+    def setUp(self):
+        # Not registered with the logging manager, so a test runner does not attach its capture handlers
+        self.logger = logging.Logger("test_log_pipeline")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.addCleanup(self.logger.handlers.clear)
+
+    def test_formats_on_listener_thread(self):
+        """Test that the caller only enqueues the record and the listener formats and writes it."""
+        handler = ListHandler()
+        pipeline = LogPipeline([handler], rate_limit=0)
+        pipeline.attach(self.logger)
+        pipeline.attach(self.logger)  # Replaces the earlier queue handler instead of adding a second one
+        queue_handlers = [h for h in self.logger.handlers if isinstance(h, DroppingQueueHandler)]
+        self.assertEqual(len(queue_handlers), 1)
+
+        formatted = []
+        class Lazy:
+            def __str__(self):
+                formatted.append(threading.current_thread())
+                return "value"
+        self.logger.info("Got %s", Lazy())
+        pipeline.stop()
+        self.assertEqual(handler.messages, ["Got value"])
+        self.assertNotIn(threading.current_thread(), formatted + list(handler.threads))
+
+    def test_drops_when_full(self):
+        """Test that logging never blocks on a stalled handler; records beyond the queue are dropped and counted."""
+        release = threading.Event()
+        handler = ListHandler(release)
+        pipeline = LogPipeline([handler], queue_size=3, rate_limit=0)
+        pipeline.attach(self.logger)
+        before = LOG_RECORDS_DROPPED_TOTAL.values.get(("queue_full",), 0)
+        for i in range(10):
+            self.logger.info("Record %d", i)
+        release.set()
+        pipeline.stop()
+        written = len(handler.messages)
+        self.assertLessEqual(written, 4)  # The queue, plus the record the listener holds
+        self.assertEqual(LOG_RECORDS_DROPPED_TOTAL.values[("queue_full",)] - before, 10 - written)
+
+    def test_json_output_and_rotation(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "logs", "app.log")
+            handler = file_handler(path, rotation="size", max_bytes=200, backup_count=2)
+            self.assertIsInstance(handler, logging.handlers.RotatingFileHandler)
+            handler.setFormatter(JsonFormatter())
+            pipeline = LogPipeline([handler], rate_limit=0)
+            pipeline.attach(self.logger)
+            for i in range(10):
+                self.logger.info("Iteration %d: Metrics processed and logged.", i)
+            pipeline.stop()
+            with open(path) as f:
+                records = [json.loads(line) for line in f]
+            self.assertEqual(records[-1]["message"], "Iteration 9: Metrics processed and logged.")
+            self.assertEqual((records[-1]["level"], records[-1]["logger"]), ("INFO", "test_log_pipeline"))
+            self.assertEqual(sorted(os.listdir(os.path.dirname(path))), ["app.log", "app.log.1", "app.log.2"])
+
+            timed = file_handler(path, rotation="time", when="midnight")
+            self.assertIsInstance(timed, logging.handlers.TimedRotatingFileHandler)
+            timed.close()
+        with self.assertRaises(ValueError):
+            file_handler(path, rotation="weekly")
+
+    @unittest.skipUnless(hasattr(os, "fork"), "needs os.fork")
+    def test_forked_child_writes_its_records(self):
+        """Test that a forked child, which does not inherit the listener thread, still writes its records."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "app.log")
+            handler = file_handler(path, rotation=None)
+            handler.setFormatter(make_formatter("text"))
+            pipeline = LogPipeline([handler], rate_limit=0)
+            pipeline.attach(self.logger)
+            self.logger.info("Logged before the fork")
+            pid = os.fork()
+            if pid == 0:
+                try:
+                    self.logger.info("Info from the child")
+                    self.logger.error("Error from the child")
+                    stop_pipelines()  # As a child exiting with os._exit must
+                finally:
+                    os._exit(0)
+            os.waitpid(pid, 0)
+            self.logger.info("Logged after the fork")
+            pipeline.stop()
+            with open(path) as f:
+                messages = [line.split(" - ", 2)[2].rstrip("\n") for line in f]
+        self.assertEqual(sorted(messages), ["Error from the child", "Info from the child", "Logged after the fork",
+                                            "Logged before the fork"])
+
+    def test_queue_handler_keeps_record(self):
+        handler = DroppingQueueHandler(None)
+        record = make_record("Serving %s", "text")
+        self.assertIs(handler.prepare(record), record)
+        self.assertEqual(record.args, ("text",))
+
+class TestAppLog(unittest.TestCase):
+    def test_module_records_reach_the_app_log(self):
+        """Test that the records of every module's logger are written by the app logger's pipeline."""
+        import file_writer, ingestion, live, retention, scheduler, serving
+        modules = (file_writer, ingestion, live, retention, scheduler, serving)
+        app_logger = logging.getLogger("app")
+        self.addCleanup(setattr, app_logger, "handlers", app_logger.handlers[:])
+        self.addCleanup(app_logger.setLevel, app_logger.level)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "app.log")
+            pipeline = setup_logging(app_logger, "INFO", to_console=False, console_only_exceedings=False, to_file=True,
+                                     file_name=path, log_format="text")
+            for module in modules:
+                module.logger.info("Logged by %s", module.__name__)
+            pipeline.stop()
+            with open(path) as f:
+                text = f.read()
+        for module in modules:
+            self.assertIn(f"INFO - Logged by {module.__name__}", text)
+
+if __name__ == "__main__":
+    unittest.main()
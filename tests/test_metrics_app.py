@@ -0,0 +1,87 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+import metrics_app
+from columnar_log import convert_json_log
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def run_python(code, directory):
+    """Run code in a fresh interpreter started in directory; return its stdout."""
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    return subprocess.run([sys.executable, "-c", code], cwd=directory, env=env, capture_output=True, text=True,
+                          check=True, timeout=60).stdout
+
+class TestHeadless(unittest.TestCase):
+    def test_import_has_no_side_effects(self):
+        """Test that importing the pipeline and the CLI creates no state, no files and loads no web framework."""
+        with tempfile.TemporaryDirectory() as directory:
+            output = run_python("import sys, pipeline, metrics_app; "
+                                "print(pipeline.metrics_manager is None, 'flask' in sys.modules)", directory)
+            self.assertEqual(output.split(), ["True", "False"])
+            self.assertEqual(os.listdir(directory), [])
+
+    def test_app_import_has_no_side_effects(self):
+        """Test that importing the web app creates no pipeline state and no files until app.init()."""
+        with tempfile.TemporaryDirectory() as directory:
+            output = run_python("import app, pipeline, logging; "
+                                "print(app.metrics_manager is None, pipeline.log_pipeline is None, "
+                                "logging.getLogger('app').handlers)", directory)
+            self.assertEqual(output.split(), ["True", "True", "[]"])
+            self.assertEqual(os.listdir(directory), [])
+
+    def test_default_manager_loads_no_optional_modes(self):
+        """Test that a default manager loads neither the sketches nor the columnar log."""
+        with tempfile.TemporaryDirectory() as directory:
+            output = run_python("import sys, metrics_manager; metrics_manager.MetricsManager(delete_previous=False); "
+                                "print('sketches' in sys.modules, 'columnar_log' in sys.modules)", directory)
+            self.assertEqual(output.split(), ["False", "False"])
+
+    def test_run_ticks(self):
+        """Test that run --ticks processes the ticks back to back and exits without loading Flask."""
+        with tempfile.TemporaryDirectory() as directory:
+            output = run_python("import sys, metrics_app; code = metrics_app.main(['run', '--ticks', '2']); "
+                                "print(code, 'flask' in sys.modules)", directory)
+            self.assertEqual(output.split()[-2:], ["0", "False"])
+            with open(os.path.join(directory, "log", "app.log")) as file:
+                self.assertIn("Iteration 1: Metrics processed and logged.", file.read())
+
+class TestCommands(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.json_path = os.path.join(self.directory, "metrics_log.txt")
+        with open(self.json_path, "w") as file:
+            for timestamp in range(100, 110):
+                metrics = {"app1": 20, "app2": 5 if timestamp % 2 else 20}
+                if timestamp >= 105:
+                    metrics["app3"] = 30  # Appears later, as in a growing deployment
+                file.write(json.dumps({"timestamp": timestamp, "metrics": metrics}) + "\n")
+
+    def test_analyze_json_and_columnar(self):
+        """Test that both log formats give the same exceedance counts."""
+        ticks, first, last, counter = metrics_app.analyze_log(10, metrics_file=self.json_path, file_format="json")
+        self.assertEqual((ticks, first, last), (10, 100, 109))
+        self.assertEqual(sorted(counter.items()), [("app1", 10), ("app2", 5), ("app3", 5)])
+
+        columnar_dir = os.path.join(self.directory, "columnar")
+        convert_json_log(self.json_path, columnar_dir, max_ticks=4)
+        result = metrics_app.analyze_log(10, file_format="columnar", columnar_dir=columnar_dir)
+        self.assertEqual(result[:3], (10, 100, 109))
+        self.assertEqual(sorted(result[3].items()), [("app1", 10), ("app2", 5), ("app3", 5)])
+
+    def test_serve_passes_arguments_to_app(self):
+        import app as app_module
+        with patch.object(app_module, 'main') as main:
+            self.assertEqual(metrics_app.main(['serve', '--server', 'production', '--port', '5001']), 0)
+        main.assert_called_once_with(['--server', 'production', '--port', '5001'])
+        with self.assertRaises(SystemExit):
+            metrics_app.parse_arguments(['run', '--port', '5001'])
+
+if __name__ == "__main__":
+    unittest.main()
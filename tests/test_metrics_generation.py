@@ -1,7 +1,11 @@
 import unittest
+import app
 from app import generate_metrics
 from config import NUM_APPS, RANDOM_METRIC_MIN, RANDOM_METRIC_MAX, THRESHOLD, METRIC_NAME
 
+def setUpModule():
+    app.init()  # Create the tick pipeline generate_metrics draws from
+
 class TestMetricsGeneration(unittest.TestCase):
     def test_number_of_apps(self):
         metrics = generate_metrics()
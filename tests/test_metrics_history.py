@@ -0,0 +1,76 @@
+import unittest
+from metrics_history import AppIndex, MetricsHistory
+from metrics_manager import MetricsManager
+
+class TestMetricsHistory(unittest.TestCase):
+    def setUp(self):
+        self.history = MetricsHistory(max_ticks=3)
+
+    def test_latest_snapshot(self):
+        """Test that the newest tick is returned as a (timestamp, dict) entry."""
+        self.history.append(100, {"app1": 1, "app2": 2})
+        self.history.append(101, {"app1": 3, "app2": 4})
+        self.assertEqual(self.history[-1], (101, {"app1": 3, "app2": 4}))
+        self.assertEqual(self.history[0], (100, {"app1": 1, "app2": 2}))
+
+    def test_retention_by_count(self):
+        """Test that the oldest ticks are dropped once max_ticks is reached."""
+        for i in range(5):
+            self.history.append(100 + i, {"app1": i})
+        self.assertEqual(len(self.history), 3)
+        self.assertEqual([timestamp for timestamp, _ in self.history], [102, 103, 104])
+        self.assertEqual(list(self.history.timestamps()), [102, 103, 104])
+
+    def test_retention_by_age(self):
+        """Test that ticks older than max_age are evicted on append."""
+        history = MetricsHistory(max_ticks=10, max_age=5)
+        history.append(100, {"app1": 1})
+        history.append(103, {"app1": 2})
+        history.append(107, {"app1": 3})
+        self.assertEqual([timestamp for timestamp, _ in history], [103, 107])
+
+    def test_missing_and_new_apps(self):
+        """Test that ticks keep their own app set when apps appear or disappear."""
+        self.history.append(100, {"app1": 1})
+        self.history.append(101, {"app2": 2, "app3": 3})
+        self.assertEqual(self.history[0][1], {"app1": 1})
+        self.assertEqual(self.history[1][1], {"app2": 2, "app3": 3})
+        timestamp, names, values = self.history.latest()
+        self.assertEqual((timestamp, list(names), values.tolist()), (101, ["app2", "app3"], [2, 3]))
+
+    def test_column_growth_keeps_old_ticks(self):
+        """Test that growing the app dimension preserves stored values."""
+        self.history.append(100, {"app1": 7})
+        self.history.append(101, {f"app{i}": i for i in range(40)})
+        self.assertGreaterEqual(self.history.capacity, 40)
+        self.assertEqual(self.history[0][1], {"app1": 7})
+        self.assertEqual(self.history[1][1]["app39"], 39)
+
+    def test_clear(self):
+        """Test that clear empties the history."""
+        self.history.append(100, {"app1": 1})
+        self.history.clear()
+        self.assertEqual(len(self.history), 0)
+        self.assertIsNone(self.history.latest())
+        with self.assertRaises(IndexError):
+            self.history[-1]
+
+    def test_app_names_interned_once(self):
+        """Test that the manager shares one app index between ticks."""
+        manager = MetricsManager(history_max_ticks=2)
+        manager.write_to_file = False
+        manager.store_metrics({"app1": 1, "app2": 2})
+        manager.store_metrics({"app1": 3, "app2": 4})
+        self.assertIs(manager.metrics_history.app_index, manager.app_index)
+        self.assertEqual(manager.app_index.names, ["app1", "app2"])
+
+class TestAppIndex(unittest.TestCase):
+    def test_columns_are_stable(self):
+        """Test that the same names always resolve to the same columns."""
+        index = AppIndex()
+        self.assertEqual(index.columns(["a", "b"]).tolist(), [0, 1])
+        self.assertEqual(index.columns(["b", "c", "a"]).tolist(), [1, 2, 0])
+        self.assertEqual(len(index), 3)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -24,6 +24,7 @@ class TestMetricsManagerFileWriting(unittest.TestCase):
 
         metrics = {"app1": 1000, "app2": 2000}
         self.metrics_manager._write_json(123456789, metrics)
+        self.metrics_manager.writer.flush()  # Wait for the background writer
 
         # Verify the file was created and contains the correct data
         self.assertTrue(os.path.exists(self.temp_file_path))
@@ -50,6 +51,7 @@ class TestMetricsManagerFileWriting(unittest.TestCase):
 
         metrics = {"app1": 1000, "app2": 2000}
         self.metrics_manager.store_metrics(metrics)
+        self.metrics_manager.writer.flush()  # Wait for the background writer
 
         # Verify the file was created and contains the correct data
         self.assertTrue(os.path.exists(self.temp_file_path))
@@ -88,5 +90,16 @@ class TestMetricsManagerFileWriting(unittest.TestCase):
         # Verify the file was deleted
         self.assertFalse(os.path.exists(self.temp_file_path))
 
+class TestFractionalValues(unittest.TestCase):
+    def test_threshold_applies_before_rounding(self):
+        """Test that fractional values are compared as received and rounded, not truncated, when stored."""
+        manager = MetricsManager()
+        manager.write_to_file = False
+        manager.store_metrics({"app1": 10000.9, "app2": 10000.4})
+        manager.process_metrics({"app1": 10000.9, "app2": 10000.4}, 10000)
+        self.assertEqual(manager.exceedance_count["app1"], 1)
+        self.assertEqual(manager.exceedance_count["app2"], 1)
+        self.assertEqual(manager.metrics_history[0][1], {"app1": 10001, "app2": 10000})
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
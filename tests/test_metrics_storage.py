@@ -1,8 +1,12 @@
 import unittest
 from metrics_manager import MetricsManager
+import app
 from app import generate_metrics
 from config import WRITE_METRICS_TO_FILE, RANDOM_METRIC_MIN, RANDOM_METRIC_MAX
 
+def setUpModule():
+    app.init()  # Create the tick pipeline generate_metrics draws from
+
 class TestMetricsStorage(unittest.TestCase):
     def setUp(self):
         self.metrics_manager = MetricsManager()
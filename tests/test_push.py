@@ -0,0 +1,148 @@
+import json
+import time
+import struct
+import unittest
+from unittest.mock import patch
+import numpy as np
+from metrics_manager import MetricsManager
+from push import PushQueue, PushDecodeError, decode_json_lines, decode_remote_write, merge_batches, snappy_decompress
+
+METRIC = "bigquery_written_bytes"
+
+def varint(value):
+    out = bytearray()
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+def field(number, payload):
+    return varint(number << 3 | 2) + varint(len(payload)) + payload
+
+def write_request(series):
+    """Encode [(labels dict, [(value, timestamp)])] as a remote-write WriteRequest."""
+    body = b""
+    for labels, samples in series:
+        payload = b"".join(field(1, field(1, k.encode()) + field(2, v.encode())) for k, v in labels.items())
+        for value, timestamp in samples:
+            payload += field(2, b"\x09" + struct.pack("<d", value) + b"\x10" + varint(timestamp))
+        body += field(1, payload)
+    return body
+
+def snappy_literals(data):
+    """Snappy-compress data as literal runs only, as a minimal encoder would."""
+    out = bytearray(varint(len(data)))
+    for start in range(0, len(data), 65536):
+        chunk = data[start:start + 65536]
+        out += bytes([61 << 2]) + (len(chunk) - 1).to_bytes(2, "little") + chunk
+    return bytes(out)
+
+class TestDecoding(unittest.TestCase):
+    def test_snappy_copies(self):
+        """Test literal and overlapping copy elements."""
+        self.assertEqual(snappy_decompress(b"\x0c\x08abc\x15\x03"), b"abcabcabcabc")
+
+    def test_snappy_stops_at_declared_length(self):
+        """Test that copies beyond the declared length fail before the output grows past it."""
+        body = b"\x0a\x00a" + b"\xfe\x01\x00" * 100000  # Declares 10 bytes, copies 64 bytes at a time
+        with self.assertRaisesRegex(PushDecodeError, "exceeds its declared length"):
+            snappy_decompress(body)
+        with self.assertRaises(PushDecodeError):
+            snappy_decompress(b"\x0a\x00a\x01")  # Copy tag without its offset byte
+
+    def test_remote_write(self):
+        """Test that only series of the metric with an app label are kept, at their latest sample."""
+        body = write_request([
+            ({"__name__": METRIC, "app_name": "app1"}, [(5.0, 1000), (7.0, 2000)]),
+            ({"__name__": METRIC, "region": "eu"}, [(1.0, 1000)]),
+            ({"__name__": "other", "app_name": "app2"}, [(1.0, 1000)]),
+            ({"__name__": METRIC, "app_name": "app3"}, [(float("nan"), 1000)]),
+        ])
+        names, values = decode_remote_write(body, METRIC, "app_name")
+        self.assertEqual((names, values.tolist()), (["app1"], [7.0]))
+
+    def test_malformed_remote_write(self):
+        """Test that bad UTF-8, truncated samples and empty labels are decode errors, not crashes."""
+        bodies = [
+            write_request([({"__name__": METRIC}, [(1.0, 1000)])]).replace(METRIC.encode(), b"\xff" * len(METRIC)),
+            field(1, field(2, b"\x09\x00\x00\x00\x00")),
+            field(1, field(1, b"")),
+        ]
+        for body in bodies:
+            with self.assertRaises(PushDecodeError):
+                decode_remote_write(body, METRIC, "app_name", series={})
+
+    def test_values_must_fit_history(self):
+        """Test that NaN, infinities and values beyond int64 are refused rather than stored as its minimum."""
+        names, values = decode_json_lines(b'{"app": "app1", "value": 10000.9}\n{"app": "app2", "value": -5}\n')
+        self.assertEqual(values.tolist(), [10000.9, -5.0])
+        for value in (b"NaN", b"Infinity", b"-Infinity", b"1e19"):
+            with self.assertRaises(PushDecodeError):
+                decode_json_lines(b'{"app": "app1", "value": ' + value + b'}')
+        with self.assertRaises(PushDecodeError):
+            decode_remote_write(write_request([({"__name__": METRIC, "app_name": "app1"}, [(float("inf"), 1)])]),
+                                METRIC, "app_name")
+
+    def test_merge_keeps_last_value(self):
+        batches = [(["app1", "app2"], np.array([1.0, 2.0]), {}), (["app2", "app3"], np.array([20.0, 30.0]), {})]
+        names, values = merge_batches(batches)
+        self.assertEqual(dict(zip(names, values.tolist())), {"app1": 1.0, "app2": 20.0, "app3": 30.0})
+
+    def test_process_queue(self):
+        queue = PushQueue(maxsize=2, processes=True)
+        self.assertTrue(queue.put(["app1"], np.array([1.0])))
+        batches = []
+        for _ in range(50):
+            batches += queue.drain()
+            if batches:
+                break
+            time.sleep(0.01)
+        self.assertEqual(batches[0][0], ["app1"])
+
+class TestPushEndpoint(unittest.TestCase):
+    def setUp(self):
+        import app as app_module
+        self.app_module = app_module
+        self.client = app_module.app.test_client()
+        self.queue = PushQueue(maxsize=2)
+        patcher = patch('app.push_queue', self.queue)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_remote_write_feeds_tick(self):
+        """Test that a large snappy remote-write push is stored and counted at the next tick."""
+        series = [({"__name__": METRIC, "app_name": f"app{i}"}, [(float(i), 1000)]) for i in range(20000)]
+        response = self.client.post('/api/v1/write', data=snappy_literals(write_request(series)),
+                                    headers={"Content-Type": "application/x-protobuf", "Content-Encoding": "snappy"})
+        self.assertEqual(response.status_code, 204)
+
+        manager = MetricsManager()
+        manager.write_to_file = False
+        with patch('pipeline.push_queue', self.queue), patch('pipeline.metrics_manager', manager), \
+                patch('pipeline.THRESHOLD', 19990), patch('pipeline.DISPLAY_INTERVAL', 0):
+            self.app_module.generate_tick()
+        latest = manager.metrics_history[-1][1]
+        self.assertEqual((len(latest), latest["app123"]), (20000, 123))
+        self.assertEqual(manager.exceedance_count["app19995"], 1)
+        self.assertEqual(self.queue.drain(), [])
+
+    def test_json_lines_and_backpressure(self):
+        """Test that pushes beyond the queue size are refused with 429 until a tick drains it."""
+        body = "\n".join(json.dumps({"app": f"app{i}", "value": i}) for i in range(1000)) + "\n"
+        for _ in range(2):
+            self.assertEqual(self.client.post('/api/v1/write', data=body, content_type="application/x-ndjson").status_code, 204)
+        response = self.client.post('/api/v1/write', data=body, content_type="application/x-ndjson")
+        self.assertEqual(response.status_code, 429)
+        self.assertIn("Retry-After", response.headers)
+        self.assertEqual(len(self.queue.drain()), 2)
+
+    def test_rejected_bodies(self):
+        self.assertEqual(self.client.post('/api/v1/write', data=b'{"app": "a"}').status_code, 400)
+        with patch('app.PUSH_MAX_BODY_BYTES', 10):
+            self.assertEqual(self.client.post('/api/v1/write', data=b'{"app": "a", "value": 1}').status_code, 413)
+        with patch('app.push_queue', None):
+            self.assertEqual(self.client.post('/api/v1/write', data=b'').status_code, 404)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from checkpoint import save_checkpoint, restore_checkpoint
+from file_writer import BackgroundWriter
+from metrics_manager import MetricsManager
+from retention import Compactor, json_chunk_paths, load_rollup, rollup_paths
+from rollups import aggregate
+
+DAY = 86400
+TIERS = {"1m": (60, 2 * DAY), "1h": (3600, 30 * DAY)}
+
+class TestCompaction(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.log_path = os.path.join(self.temp_dir.name, "metrics_log.txt")
+        self.rollup_dir = os.path.join(self.temp_dir.name, "rollups")
+        self.writer = BackgroundWriter(background=False)
+        self.addCleanup(self.writer.close)
+
+    def new_manager(self, file_format="json"):
+        with patch('metrics_manager.METRICS_FILE_FORMAT', file_format), \
+                patch('metrics_manager.METRICS_COLUMNAR_DIR', os.path.join(self.temp_dir.name, "columnar")):
+            manager = MetricsManager(metrics_file=self.log_path, writer=self.writer, delete_previous=False)
+        manager.write_to_file = True
+        return manager
+
+    def compactor(self, manager, **kwargs):
+        options = {"raw_seconds": DAY, "chunk_seconds": 3600, "tiers": TIERS, "directory": self.rollup_dir}
+        options.update(kwargs)
+        return Compactor(manager, **options)
+
+    def run_ticks(self, manager, ticks):
+        for timestamp, metrics in ticks:
+            with patch('metrics_manager.time.time', return_value=timestamp):
+                manager.store_metrics(metrics)
+            manager.process_metrics(metrics, 10)
+
+    def test_json_log_rotates_then_compacts(self):
+        """Test that the JSON log is rotated, compacted into every tier once expired, and the chunk deleted."""
+        manager = self.new_manager()
+        self.run_ticks(manager, [(t, {"app1": t % 60, "app2": 5}) for t in range(0, 3600, 30)])
+        compactor = self.compactor(manager)
+
+        compactor.run(now=3600)
+        chunks = json_chunk_paths(self.log_path)
+        self.assertEqual([rotated for rotated, _ in chunks], [3600])
+        self.assertFalse(os.path.exists(self.log_path))
+        self.run_ticks(manager, [(3600, {"app1": 1})])  # The next tick starts a new log
+        self.assertTrue(os.path.exists(self.log_path))
+
+        compactor.run(now=3600 + DAY - 1)  # Not yet past the raw retention; rotates the new log
+        self.assertEqual([rotated for rotated, _ in json_chunk_paths(self.log_path)], [3600, 3599 + DAY])
+        compactor.run(now=3601 + DAY)
+        self.assertEqual([rotated for rotated, _ in json_chunk_paths(self.log_path)], [3599 + DAY])
+        self.assertEqual(compactor.chunks_compacted, 1)
+
+        app_names, starts, stats = load_rollup(rollup_paths(self.rollup_dir, "1h")[0][2])
+        self.assertEqual((app_names, starts.tolist()), (["app1", "app2"], [0]))
+        self.assertEqual(aggregate(stats, "count").tolist(), [[120, 120]])
+        self.assertEqual(aggregate(stats, "max").tolist(), [[30, 5]])
+        first, last, path = rollup_paths(self.rollup_dir, "1m")[0]
+        self.assertEqual((first, last), (0, 3540))
+
+        compactor.expire_rollups(now=3600 + 2 * DAY)  # Past the 1m tier's two days only
+        self.assertEqual(rollup_paths(self.rollup_dir, "1m"), [])
+        self.assertEqual(len(rollup_paths(self.rollup_dir, "1h")), 1)
+        self.assertEqual(compactor.files_expired, 1)
+
+    def test_range_query_reads_compacted_history(self):
+        """Test that after a restart a range query reads the compacted buckets on disk, then the ticks in memory."""
+        manager = self.new_manager()
+        self.run_ticks(manager, [(t, {"app1": t % 60, "app2": 5}) for t in range(0, 3600, 30)])
+        compactor = self.compactor(manager)
+        compactor.run(now=3600)
+        compactor.run(now=3601 + DAY)
+        self.assertEqual(compactor.chunks_compacted, 1)
+
+        restarted = MetricsManager(delete_previous=False)
+        restarted.write_to_file = False
+        restarted.archive = compactor.archive
+        self.run_ticks(restarted, [(2 * DAY, {"app1": 7, "app3": 1})])
+        source, result = restarted.query_range(["app1", "app2", "app3", "app1"], 0, 2 * DAY, 3600, "count")
+        self.assertTrue(source.startswith("1h (disk)+"))
+        self.assertEqual(result["app1"], [(0, 120.0), (2 * DAY, 1.0)])
+        self.assertEqual(result["app3"], [(2 * DAY, 1.0)])
+        self.assertEqual(result["app2"], [(0, 120.0)])  # Only on disk, not reported since the restart
+        self.assertNotIn("app4", restarted.query_range(["app4"], 0, 2 * DAY, 3600)[1])
+        source, result = restarted.query_range(["app1"], 0, 1800, 60, "max")
+        self.assertEqual(source, "1m (disk)+raw")
+        self.assertEqual(result["app1"][:2], [(0, 30.0), (60, 30.0)])
+
+    def test_columnar_segments_and_bounded_runs(self):
+        """Test that closed segments are compacted oldest first, one run's byte budget at a time."""
+        manager = self.new_manager("columnar")
+        manager.columnar_log.max_ticks = 10
+        self.run_ticks(manager, [(t * 60, {"app1": t}) for t in range(25)])  # Two closed segments and an open one
+        compactor = self.compactor(manager, raw_seconds=60, max_bytes=1)
+
+        compactor.run(now=1300)
+        self.assertEqual(compactor.chunks_compacted, 1)
+        compactor.run(now=1300)
+        compactor.run(now=1300)
+        self.assertEqual(compactor.chunks_compacted, 2)  # The segment still being written is kept
+        self.assertEqual([(first, last) for first, last, _ in rollup_paths(self.rollup_dir, "1m")],
+                         [(0, 540), (600, 1140)])
+
+    def test_checkpoint_replays_rotated_chunks(self):
+        """Test that ticks logged after a checkpoint are replayed even when the log was rotated since."""
+        checkpoint_path = os.path.join(self.temp_dir.name, "checkpoint.npz")
+        manager = self.new_manager()
+        self.run_ticks(manager, [(100 + i, {"app1": 20}) for i in range(3)])
+        save_checkpoint(manager, checkpoint_path)
+        self.run_ticks(manager, [(200, {"app1": 20, "app2": 30})])
+        self.compactor(manager).run(now=3800)
+        self.run_ticks(manager, [(3900, {"app1": 1, "app2": 30})])
+
+        restored = self.new_manager()
+        self.assertEqual(restore_checkpoint(restored, 10, checkpoint_path), 2)
+        self.assertEqual(restored.exceedance_count["app2"], 2)
+        self.assertEqual([timestamp for timestamp, _ in restored.metrics_history], [100, 101, 102, 200, 3900])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+import time
+import unittest
+from unittest.mock import patch
+import numpy as np
+from metrics_history import AppIndex, MetricsHistory
+from metrics_manager import MetricsManager
+from rollups import COUNT, Rollup, aggregate
+
+ROLLUPS = {"1m": (60, 1440), "1h": (3600, 720)}
+
+class TestRollup(unittest.TestCase):
+    def test_buckets(self):
+        """Test that ticks fold into aligned buckets and the oldest bucket is dropped."""
+        index = AppIndex()
+        rollup = Rollup(60, 2, index)
+        columns = index.columns(["app1", "app2"])
+        for timestamp, values in ((60, [1, 10]), (100, [5, 20]), (130, [7, 30]), (185, [2, 40])):
+            rollup.add(timestamp, columns, np.array(values))
+        self.assertEqual((len(rollup), rollup.oldest), (2, 120))
+        starts, stats = rollup.stats(0, 1000, columns)
+        self.assertEqual(starts.tolist(), [120, 180])
+        self.assertEqual(aggregate(stats, "max").tolist(), [[7, 30], [2, 40]])
+
+    def test_late_apps(self):
+        """Test that apps registered after a bucket was filled read as empty in it."""
+        index = AppIndex()
+        rollup = Rollup(60, 10, index)
+        rollup.add(0, index.columns(["app1"]), np.array([1]))
+        rollup.add(60, index.columns([f"app{i}" for i in range(40)]), np.arange(40))
+        starts, stats = rollup.stats(0, 120, np.array([1, 39]))
+        self.assertEqual(stats[:, COUNT].tolist(), [[0, 0], [1, 1]])
+
+class TestQueryRange(unittest.TestCase):
+    def setUp(self):
+        self.history = MetricsHistory(max_ticks=500, rollups=ROLLUPS)
+        self.columns = self.history.app_index.columns(["app1", "app2"])
+        for tick in range(400):  # Wraps the ring buffer
+            self.history.append_values(1000 + tick * 15, self.columns, np.array([tick, 2 * tick]))
+
+    def test_sources_agree(self):
+        """Test that a rollup answers like the raw ticks it summarizes."""
+        source, starts, stats = self.history.query_range(self.columns, 1200, 4000, 60)
+        raw = MetricsHistory(max_ticks=500, rollups={})
+        raw_columns = raw.app_index.columns(["app1", "app2"])
+        for tick in range(400):
+            raw.append_values(1000 + tick * 15, raw_columns, np.array([tick, 2 * tick]))
+        raw_source, raw_starts, raw_stats = raw.query_range(raw_columns, 1200, 4000, 60)
+        self.assertEqual((source, raw_source), ("1m", "raw"))
+        self.assertEqual(starts.tolist(), raw_starts.tolist())
+        for aggregation in ("avg", "min", "max", "sum", "count"):
+            np.testing.assert_array_equal(aggregate(stats, aggregation), aggregate(raw_stats, aggregation))
+        self.assertEqual(starts[0], 1200)
+        self.assertEqual(aggregate(stats, "avg")[0].tolist(), [15.5, 31])  # Ticks 14 to 17
+
+    def test_raw_for_fine_steps(self):
+        """Test that steps finer than every rollup read the raw ticks, and evicted ticks are gone."""
+        history = MetricsHistory(max_ticks=100, rollups=ROLLUPS)
+        columns = history.app_index.columns(["app1"])
+        for tick in range(150):
+            history.append_values(tick * 15, columns, np.array([tick]))
+        source, starts, stats = history.query_range(columns, 0, 3000, 15)
+        self.assertEqual(source, "raw")
+        self.assertEqual(len(starts), 100)
+        self.assertEqual(starts[0], 50 * 15)
+        source, starts, stats = history.query_range(columns, 0, 3000, 60)
+        self.assertEqual((source, starts[0]), ("1m", 0))
+
+    def test_long_range_uses_hours(self):
+        """Test that a query over 30 days reads hourly buckets and stays fast."""
+        history = MetricsHistory(max_ticks=2880, rollups=ROLLUPS)
+        columns = history.app_index.columns([f"app{i}" for i in range(1000)])
+        values = np.arange(1000)
+        for tick in range(30 * 24 * 4):  # 30 days at a 15 minute interval
+            history.append_values(tick * 900, columns, values)
+        start = time.perf_counter()
+        source, starts, stats = history.query_range(columns[:10], 0, 30 * 86400, 3600)
+        elapsed = time.perf_counter() - start
+        self.assertEqual((source, len(starts)), ("1h", 720))
+        self.assertEqual(aggregate(stats, "count")[:, 0].tolist(), [4] * 720)
+        self.assertLess(elapsed, 0.5)
+
+class TestQueryRangeRoute(unittest.TestCase):
+    def setUp(self):
+        import app as app_module
+        self.client = app_module.app.test_client()
+        manager = MetricsManager(history_max_ticks=100)
+        manager.write_to_file = False
+        columns = manager.app_index.columns(["app1", "app2"])
+        for tick in range(8):
+            manager.metrics_history.append_values(600 + tick * 30, columns, np.array([tick, 100]))
+        patcher = patch('app.metrics_manager', manager)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_query(self):
+        response = self.client.get('/api/v1/query_range?app=app1&app=missing&start=600&end=839&step=120&agg=max')
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()["data"]
+        self.assertEqual(data["source"], "raw")  # The default rollups are coarser than the step
+        self.assertEqual(data["result"], [{"metric": {"__name__": "bigquery_written_bytes", "app_name": "app1"},
+                                           "values": [[600, 3.0], [720, 7.0]]}])
+
+    def test_invalid(self):
+        for query in ("start=600&end=839", "app=app1&step=0", "app=app1&agg=median", "app=app1&start=x",
+                      "app=app1&start=0&end=1000000000&step=1"):
+            with self.subTest(query=query):
+                response = self.client.get(f'/api/v1/query_range?{query}')
+                self.assertEqual((response.status_code, response.get_json()["status"]), (400, "error"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import time
+import threading
+import unittest
+from unittest.mock import patch
+from scheduler import Job, Scheduler
+
+class FakeClock:
+    """Monotonic and wall clocks that only move when the job sleeps or works."""
+
+    def __init__(self, start=100.0, wall_offset=1000.25):
+        self.now = start
+        self.wall_offset = wall_offset
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now + self.wall_offset
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+class TestJob(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        for name in ("monotonic", "time", "sleep"):
+            patcher = patch(f"scheduler.time.{name}", getattr(self.clock, name))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.starts = []
+
+    def work(self, durations):
+        durations = iter(durations)
+
+        def func():
+            self.starts.append(self.clock.time())
+            self.clock.now += next(durations, 0.0)
+        return func
+
+    def test_runs_on_boundaries_without_drift(self):
+        """Test that run time does not push later runs off the wall-clock boundaries."""
+        job = Job("tick", 5, self.work([0.3, 1.2, 0.7, 4.9]), overrun="skip")
+        job.run(max_runs=5)
+        self.assertEqual(self.starts[0], 1100.25)  # First run immediately
+        self.assertEqual(self.starts[1:], [1105, 1110, 1115, 1120])
+        self.assertEqual((job.runs, job.overruns, job.skipped), (5, 0, 0))
+        self.assertEqual(len(self.clock.sleeps), 5)
+
+    def test_skip_overrun(self):
+        """Test that a run longer than the interval skips the missed ticks."""
+        job = Job("tick", 5, self.work([0, 12, 0]), overrun="skip")
+        job.run(max_runs=3)
+        self.assertEqual(self.starts[1:], [1105, 1120])
+        self.assertEqual((job.overruns, job.skipped), (1, 2))
+
+    def test_catch_up_overrun(self):
+        """Test that catch_up runs missed ticks back to back, up to max_catch_up."""
+        job = Job("tick", 5, self.work([0, 22]), overrun="catch_up", max_catch_up=2)
+        job.run(max_runs=5)
+        # 22s run: due times 1110-1125 passed; the two most recent run at once, then back on the boundary
+        self.assertEqual(self.starts[1:], [1105, 1127, 1127, 1130])
+        self.assertEqual(job.skipped, 2)
+
+    def test_error_does_not_sleep_twice(self):
+        """Test that a failing run is counted and followed by a single wait for the next boundary."""
+        def fail():
+            raise RuntimeError("boom")
+
+        job = Job("tick", 5, fail)
+        with self.assertLogs("app.scheduler", level="ERROR"):
+            job.run(max_runs=2)
+        self.assertEqual(job.errors, 2)
+        self.assertEqual(self.clock.sleeps, [4.75, 5])
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            Job("tick", 5, lambda: None, overrun="later")
+
+class TestScheduler(unittest.TestCase):
+    def test_independent_cadences(self):
+        """Test that jobs run on their own threads at their own intervals."""
+        scheduler = Scheduler()
+        runs = {"fast": 0, "slow": 0}
+        scheduler.add_job("fast", 0.02, lambda: runs.__setitem__("fast", runs["fast"] + 1))
+        scheduler.add_job("slow", 10, lambda: runs.__setitem__("slow", runs["slow"] + 1))
+        scheduler.start()
+        time.sleep(0.2)
+        scheduler.stop(timeout=1)
+        self.assertGreaterEqual(runs["fast"], 3)
+        self.assertEqual(runs["slow"], 1)
+        self.assertEqual(scheduler.stats()["slow"]["runs"], 1)
+        self.assertFalse(any(t.name.startswith("job-") for t in threading.enumerate()))
+
+if __name__ == "__main__":
+    unittest.main()
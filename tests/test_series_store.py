@@ -0,0 +1,161 @@
+import unittest
+from unittest.mock import patch
+import numpy as np
+from ingestion import parse_series
+from metrics_manager import MetricsManager
+from series_store import SeriesStore, parse_selector
+from config import METRIC_NAME
+
+def labels(**pairs):
+    return tuple(sorted(pairs.items()))
+
+class TestParseSelector(unittest.TestCase):
+    def test_parse(self):
+        self.assertEqual(parse_selector('up{job="api", env!~"dev|test",path=~"/a\\"b"}'),
+                         ("up", [("job", "=", "api"), ("env", "!~", "dev|test"), ("path", "=~", '/a"b')]))
+        self.assertEqual(parse_selector('{__name__="up"}'), (None, [("__name__", "=", "up")]))
+        self.assertEqual(parse_selector("up"), ("up", []))
+
+    def test_invalid(self):
+        for text in ("", "up{job=api}", 'up{job="a"', 'up{job=~"("}'):
+            with self.subTest(text=text), self.assertRaises(ValueError):
+                parse_selector(text)
+
+class TestSeriesStore(unittest.TestCase):
+    def setUp(self):
+        self.store = SeriesStore()
+        self.store.store("requests", [labels(job="api", env="prod"), labels(job="api", env="dev"),
+                                      labels(job="db", env="prod")], np.array([5.0, 50.0, 500.0]))
+        self.store.store("errors", [labels(job="api"), labels(job="db", env="prod")], np.array([1.0, 2.0]))
+        self.store.process("requests", 10)
+        self.store.process("errors", 1)
+
+    def selected(self, metric=None, matchers=()):
+        view = self.store.view()
+        return [view.names[i] for i in view.select(metric, matchers)]
+
+    def test_matchers(self):
+        """Test equality, regex and negative matchers, including empty values meaning an absent label."""
+        self.assertEqual(self.selected("requests", [("env", "=", "prod")]),
+                         ['requests{env="prod",job="api"}', 'requests{env="prod",job="db"}'])
+        self.assertEqual(self.selected(None, [("job", "=~", "a.*"), ("env", "!=", "dev")]),
+                         ['requests{env="prod",job="api"}', 'errors{job="api"}'])
+        self.assertEqual(self.selected("errors", [("env", "=", "")]), ['errors{job="api"}'])
+        self.assertEqual(self.selected(None, [("__name__", "!~", "req.*")]),
+                         ['errors{job="api"}', 'errors{env="prod",job="db"}'])
+        self.assertEqual(self.selected("requests", [("job", "=", "missing")]), [])
+
+    def test_counts_and_render(self):
+        """Test per-metric thresholds and rendering of the selected series."""
+        view = self.store.view()
+        ids = view.select()
+        self.assertEqual(view.top_exceedances(3, ids),
+                         [('requests{env="dev",job="api"}', 1), ('requests{env="prod",job="db"}', 1),
+                          ('errors{env="prod",job="db"}', 1)])
+        self.assertEqual(view.render(view.select("errors")), 'errors{job="api"} 1\nerrors{env="prod",job="db"} 2\n')
+
+    def test_view_is_stable(self):
+        """Test that a view keeps its tick while the store takes new series and values."""
+        view = self.store.view()
+        for i in range(3000):  # Grows the ID arrays past their first allocation
+            self.store.store("requests", [labels(job=f"job{i}")], np.array([float(i)]))
+        self.assertEqual(len(view.select("requests")), 3)
+        self.assertEqual(view.values(view.select("requests", [("job", "=", "api")])).tolist(), [5.0, 50.0])
+        self.assertEqual(len(self.store.view().select("requests", [("job", "=~", "job1.*")])), 1111)
+
+class TestManagerSeries(unittest.TestCase):
+    @patch('metrics_manager.METRIC_THRESHOLDS', {"queue_depth": 100})
+    def test_scraped_series_feed_the_store(self):
+        """Test that every scraped metric is stored and counted at its own threshold."""
+        manager = MetricsManager()
+        manager.write_to_file = False
+        text = ('queue_depth{queue="a"} 150\nqueue_depth{queue="b"} 50\n'
+                'latency_seconds{route="/x"} 20000\n')
+        manager.store_metrics({"app1": 20000})
+        manager.store_series(parse_series(text))
+        manager.process_metrics({"app1": 20000}, 10000)
+        manager.process_series(10000)
+
+        view = manager.publish_snapshot().series
+        self.assertEqual(view.top_exceedances(5, view.select()),
+                         [('bigquery_written_bytes{app_name="app1"}', 1), ('queue_depth{queue="a"}', 1),
+                          ('latency_seconds{route="/x"}', 1)])
+
+    def test_metric_name_is_read_from_the_manager(self):
+        """Test that METRIC_NAME's series are not copied into the store and match like stored series."""
+        manager = MetricsManager()
+        manager.write_to_file = False
+        manager.store_metrics({"app1": 20000, "etl-a": 5, "etl-b": 30000})
+        manager.store_metrics({"etl-b": 20000, "etl-a": 7})  # app1 did not report
+        manager.process_metrics({"etl-b": 20000, "etl-a": 7}, 10000)
+        view = manager.publish_snapshot().series
+        self.assertNotIn(METRIC_NAME, manager.series.metrics)
+
+        def selected(metric, matchers):
+            return [view.name(i) for i in view.select(metric, matchers)]
+        self.assertEqual(selected(METRIC_NAME, [("app_name", "=~", "etl-.*")]),
+                         [f'{METRIC_NAME}{{app_name="etl-a"}}', f'{METRIC_NAME}{{app_name="etl-b"}}'])
+        self.assertEqual(selected(None, [("app_name", "=", "etl-a"), ("app_name", "!~", "app.*")]),
+                         [f'{METRIC_NAME}{{app_name="etl-a"}}'])
+        self.assertEqual(selected(METRIC_NAME, [("job", "=", "api")]), [])  # A label the series do not carry
+        self.assertEqual(len(selected(METRIC_NAME, [("job", "=", "")])), 3)
+        self.assertEqual(selected("requests", []), [])
+        ids = view.select(METRIC_NAME)
+        self.assertEqual(view.render(ids), f'{METRIC_NAME}{{app_name="etl-a"}} 7\n{METRIC_NAME}{{app_name="etl-b"}} 20000\n')
+        self.assertEqual(view.top_exceedances(1, ids), [(f'{METRIC_NAME}{{app_name="etl-b"}}', 1)])
+
+    def test_metric_name_counts_follow_the_top_apps(self):
+        """Test that METRIC_NAME's series counts are the ones /exceeding ranks by, adaptive or approximate."""
+        for manager in (MetricsManager(threshold_mode="sigma"), MetricsManager(top_x_mode="approximate")):
+            manager.write_to_file = False
+            for tick in range(20):
+                metrics = {"app1": 100 + tick % 3, "app2": 100 if tick < 19 else 5000}
+                manager.store_metrics(metrics)
+                manager.process_metrics(metrics, 10000)
+            snapshot = manager.publish_snapshot()
+            with self.subTest(threshold_mode=manager.threshold_mode, top_x_mode=manager.top_x_mode):
+                view = snapshot.series
+                top = [(name.split('"')[1], count) for name, count in view.top_exceedances(2, view.select(METRIC_NAME))]
+                self.assertEqual(top, snapshot.get_top_exceedance_apps(2))
+
+    def test_pickled_view(self):
+        """Test that a view sent to another process still selects METRIC_NAME's series by app."""
+        import pickle
+        manager = MetricsManager()
+        manager.write_to_file = False
+        manager.store_metrics({"app1": 20000, "app2": 5})
+        view = pickle.loads(pickle.dumps(manager.publish_snapshot())).series
+        self.assertEqual(view.render(view.select(METRIC_NAME, [("app_name", "=", "app2")])),
+                         f'{METRIC_NAME}{{app_name="app2"}} 5\n')
+
+class TestSeriesRoutes(unittest.TestCase):
+    def setUp(self):
+        import app as app_module
+        self.client = app_module.app.test_client()
+        manager = MetricsManager()
+        manager.write_to_file = False
+        for _ in range(2):
+            manager.store_metrics({"app1": 20000, "app2": 5})
+            manager.store_series({"requests": ([labels(job="api"), labels(job="db")], [20000.0, 1.0])})
+            manager.process_metrics({"app1": 20000, "app2": 5}, 10000)
+            manager.process_series(10000)
+        manager.publish_snapshot()
+        patcher = patch('app.metrics_manager', manager)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_metrics_match(self):
+        response = self.client.get('/metrics?match[]=requests{job="db"}&match[]=bigquery_written_bytes{app_name="app2"}')
+        self.assertEqual(response.data.decode(), 'bigquery_written_bytes{app_name="app2"} 5\nrequests{job="db"} 1\n')
+        self.assertEqual(self.client.get('/metrics?match[]=requests{job=db}').status_code, 400)
+
+    @patch('app.DISPLAY_MODE', 'page')
+    def test_exceeding_by_metric(self):
+        response = self.client.get('/exceeding?metric=requests')
+        self.assertIn(b'requests{job=&#34;api&#34;}', response.data)
+        self.assertIn(b'<td>2</td>', response.data)
+        self.assertNotIn(b'app1', response.data)
+        self.assertEqual(self.client.get('/exceeding?metric=requests&window=5m').status_code, 400)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+import os
+import unittest
+from unittest.mock import patch
+from app import app
+from metrics_manager import MetricsManager
+from serving import SharedSnapshotBuffer, SharedSnapshotView
+from config import METRIC_NAME
+
+class TestSharedSnapshotBuffer(unittest.TestCase):
+    def setUp(self):
+        self.owner = SharedSnapshotBuffer(create=True, slot_size=4096)
+        self.addCleanup(self.owner.unlink)
+        self.addCleanup(self.owner.close)
+        self.reader = SharedSnapshotBuffer(self.owner.name)
+        self.addCleanup(self.reader.close)
+        self.manager = MetricsManager()
+        self.manager.write_to_file = False
+
+    def tick(self, metrics):
+        self.manager.store_metrics(metrics)
+        self.manager.process_metrics(metrics, 10)
+        self.manager.render_exposition()
+        return self.manager.publish_snapshot()
+
+    def test_publish_and_read(self):
+        """Test that readers get the published snapshot and only unpickle new ticks."""
+        self.assertIsNone(self.reader.read())
+        self.manager.snapshot_listeners.append(self.owner.publish)
+        self.tick({"app1": 5, "app2": 20})
+
+        snapshot = self.reader.read()
+        self.assertEqual(snapshot.values.tolist(), [5, 20])
+        self.assertEqual(snapshot.get_top_exceedance_apps(5), [("app2", 1)])
+        self.assertEqual(snapshot.exposition.body, self.manager.exposition.current.body)
+        self.assertFalse(snapshot.values.flags.writeable)
+        self.assertIs(self.reader.read(), snapshot)
+
+        self.tick({"app1": 50, "app2": 20})
+        self.assertEqual(self.reader.read().get_top_exceedance_apps(5), [("app2", 2), ("app1", 1)])
+
+    def test_grows_for_large_snapshots(self):
+        """Test that a snapshot larger than a slot moves to a bigger data segment."""
+        self.manager.snapshot_listeners.append(self.owner.publish)
+        self.tick({"app1": 1})
+        self.assertEqual(self.reader.read().app_names, ("app1",))
+
+        self.tick({f"app{i}": i for i in range(5000)})
+        self.assertEqual(len(self.reader.read().app_names), 5000)
+        self.assertEqual(len(self.owner._owned), 1)  # The outgrown segment was removed
+
+    @unittest.skipUnless(hasattr(os, "fork"), "requires fork")
+    def test_publish_from_another_process(self):
+        """Test that a snapshot published by a forked generator is read by the parent."""
+        pid = os.fork()
+        if pid == 0:
+            try:
+                self.owner.publish(self.tick({"app1": 42}))
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+        self.assertEqual(self.reader.read().values.tolist(), [42])
+
+class TestSharedSnapshotView(unittest.TestCase):
+    def setUp(self):
+        self.buffer = SharedSnapshotBuffer(create=True)
+        self.addCleanup(self.buffer.unlink)
+        self.addCleanup(self.buffer.close)
+        self.view = SharedSnapshotView(self.buffer)
+        self.client = app.test_client()
+        patcher = patch('app.metrics_manager', self.view)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch('app.DISPLAY_MODE', 'page')
+    def test_routes_serve_shared_snapshot(self):
+        """Test that /metrics and /exceeding answer from the shared buffer."""
+        self.assertEqual(self.view.get_top_exceedance_apps(5), [])
+        self.assertEqual(self.client.get('/metrics').status_code, 200)  # Falls back before the first tick
+
+        manager = MetricsManager()
+        manager.write_to_file = False
+        manager.store_metrics({"app1": 20000})
+        manager.process_metrics({"app1": 20000}, 10)
+        manager.render_exposition()
+        self.buffer.publish(manager.publish_snapshot())
+
+        response = self.client.get('/metrics')
+        self.assertEqual(response.data, manager.exposition.current.body)
+        self.assertIn(f'{METRIC_NAME}{{app_name="app1"}} 20000'.encode(), response.data)
+        self.assertIn(b'app1', self.client.get('/exceeding?window=5m').data)
+
+    @patch('pipeline.init_logging')  # Leave the log file alone
+    @patch('app.serve')
+    def test_production_mode(self, mock_serve, mock_init_logging):
+        """Test that --server production hands the app to the production server."""
+        import app as app_module
+
+        app_module.main(["--server", "production", "--workers", "2", "--port", "8000"])
+        args, kwargs = mock_serve.call_args
+        self.assertEqual(args, (app_module.app, app_module.metrics_manager, app_module.run_generation_process,
+                                app_module.use_shared_snapshots))
+        self.assertEqual((kwargs["workers"], kwargs["port"]), (2, 8000))
+
+if __name__ == "__main__":
+    unittest.main()
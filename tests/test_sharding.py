@@ -0,0 +1,65 @@
+import unittest
+from unittest.mock import patch
+import numpy as np
+from exceedance import ExceedanceCounter, merge_top_k, top_k
+from metrics_manager import MetricsManager
+from sharding import ShardedPipeline
+from config import METRIC_NAME
+
+class TestMergeTopK(unittest.TestCase):
+    def test_matches_global_top_k(self):
+        """Test that merging per-range top-k results equals the top k of the whole array."""
+        counts = np.random.default_rng(1).integers(0, 10, size=1000)
+        parts = [(top_k(counts[start:start + 250], 20) + start) for start in range(0, 1000, 250)]
+        columns = np.concatenate(parts)
+        merged, merged_counts = merge_top_k(columns, counts[columns], 20)
+        self.assertEqual(merged.tolist(), top_k(counts, 20).tolist())
+        self.assertEqual(merged_counts.tolist(), counts[top_k(counts, 20)].tolist())
+
+class TestShardedPipeline(unittest.TestCase):
+    def setUp(self):
+        self.pipeline = ShardedPipeline(num_apps=1000, shards=3, top_x=5, seed=7, windows={"5m": 300})
+        self.addCleanup(self.pipeline.close)
+
+    def test_tick_matches_shared_counts(self):
+        """Test that merged shard rankings equal a ranking over the full shared counts."""
+        for _ in range(5):
+            rankings = self.pipeline.tick(6000, timestamp=100)
+        counter = ExceedanceCounter(counts=self.pipeline.counts.copy())
+        counter.app_index.columns(self.pipeline.app_names)
+        self.assertEqual(rankings[(5, None)], counter.top(5))
+        self.assertEqual(rankings[(5, "5m")], rankings[(5, None)])  # Every tick is inside the window
+        self.assertTrue(((self.pipeline.values >= 1) & (self.pipeline.values <= 12000)).all())
+
+    def test_manager_reads_shard_counts(self):
+        """Test that an attached manager ranks and publishes the shard counts."""
+        manager = MetricsManager()
+        manager.write_to_file = False
+        self.pipeline.attach(manager)
+        rankings = self.pipeline.tick(6000)
+        manager.store_values(self.pipeline.app_names, self.pipeline.values)
+        snapshot = manager.publish_snapshot(rankings)
+        self.assertEqual(manager.get_top_exceedance_apps(5), rankings[(5, None)])
+        self.assertEqual(snapshot.get_top_exceedance_apps(3), rankings[(5, None)][:3])
+        self.assertEqual(manager.get_top_exceedance_apps(5, window="5m"), rankings[(5, "5m")])
+
+        self.pipeline.close()
+        self.assertEqual(manager.exceedance_count.top(5), rankings[(5, None)])  # Still readable after close
+
+    def test_generate_tick_counts_series(self):
+        """Test that after a sharded tick the METRIC_NAME series rank by the counts the shards keep."""
+        import pipeline
+
+        manager = MetricsManager()
+        manager.write_to_file = False
+        self.pipeline.attach(manager)
+        with patch('pipeline.sharded_pipeline', self.pipeline), patch('pipeline.metrics_manager', manager), \
+                patch('pipeline.DISPLAY_INTERVAL', 0), patch('pipeline.THRESHOLD', 6000):
+            pipeline.generate_tick()
+        view = manager.snapshot.series
+        series_counts = view.counts(view.select(METRIC_NAME))
+        self.assertEqual(series_counts.tolist(), self.pipeline.counts.tolist())
+        self.assertGreater(int(series_counts.sum()), 0)
+
+if __name__ == "__main__":
+    unittest.main()
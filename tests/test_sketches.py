@@ -0,0 +1,141 @@
+import time
+import unittest
+from unittest.mock import patch
+import numpy as np
+from exceedance import ExceedanceCounter
+from metrics_history import AppIndex
+from metrics_manager import MetricsManager
+from config import SKETCH_CAPACITY
+from sketches import CountMinSketch, SpaceSavingCounter, SpaceSavingWindow
+
+def zipf_ticks(apps, ticks, seed=0):
+    """Yield per-tick exceedance masks where app i exceeds with a probability falling off like 1 / (i + 1)."""
+    rng = np.random.default_rng(seed)
+    probabilities = 1 / np.arange(1, apps + 1)
+    for _ in range(ticks):
+        yield rng.random(apps) < probabilities
+
+class TestCountMinSketch(unittest.TestCase):
+    def test_never_undercounts(self):
+        """Test that estimates are upper bounds and exact without collisions."""
+        sketch = CountMinSketch(width=1 << 10, depth=4)
+        keys = np.arange(5000)
+        for repeat in range(3):
+            sketch.add(keys[:100 * (repeat + 1)])
+        estimates = sketch.query(keys)
+        truth = np.zeros(5000, dtype=np.int64)
+        truth[:100] += 3
+        truth[100:200] += 2
+        truth[200:300] += 1
+        self.assertTrue((estimates >= truth).all())
+        self.assertEqual(sketch.total, 600)
+        self.assertEqual(CountMinSketch(width=1 << 16).query(keys[:5]).tolist(), [0] * 5)
+
+    def test_width_power_of_two(self):
+        with self.assertRaises(ValueError):
+            CountMinSketch(width=1000)
+
+class TestSpaceSavingCounter(unittest.TestCase):
+    def test_exact_below_capacity(self):
+        """Test that counts are exact with no error while every app fits."""
+        index = AppIndex()
+        counter = SpaceSavingCounter(index, capacity=10, width=1 << 8)
+        columns = index.columns(["app1", "app2", "app3"])
+        counter.add(columns, np.array([True, False, True]))
+        counter.add(columns, np.array([True, True, False]))
+        self.assertEqual(counter.top(2), [("app1", 2), ("app2", 1)])
+        self.assertEqual((counter["app3"], counter["unknown"]), (1, 0))
+        self.assertEqual(counter.summary().errors.tolist(), [0, 0, 0])
+
+    def test_bounds_and_heavy_hitters(self):
+        """Test that on a skewed load the counts bound the truth and the heavy apps are found."""
+        apps = 20000
+        index = AppIndex()
+        columns = index.columns([f"app{i}" for i in range(apps)])
+        exact = ExceedanceCounter(index)
+        counter = SpaceSavingCounter(index, capacity=200, width=1 << 12)
+        for exceeded in zipf_ticks(apps, 200):
+            exact.add(columns, exceeded)
+            counter.add(columns, exceeded)
+
+        summary = counter.summary()
+        truth = exact.counts[summary.columns]
+        self.assertEqual(len(counter), 200)
+        self.assertTrue((summary.counts >= truth).all())
+        self.assertTrue((summary.counts - summary.errors <= truth).all())
+        total = int(exact.counts.sum())
+        heavy = np.flatnonzero(exact.counts > total / 200)
+        self.assertTrue(np.isin(heavy, summary.columns).all())
+        self.assertEqual([name for name, _ in counter.top(10)], [name for name, _ in exact.top(10)])
+        self.assertLess(counter.nbytes, exact.counts.nbytes)
+
+class TestSpaceSavingWindow(unittest.TestCase):
+    def test_expiry_and_merge(self):
+        """Test that buckets leave the window like the exact window's and merge into upper bounds."""
+        index = AppIndex()
+        columns = index.columns(["app1", "app2", "app3"])
+        window = SpaceSavingWindow(60, 6, index, capacity=2)
+        window.add(0, columns, np.array([True, True, False]))
+        window.add(15, columns, np.array([False, True, True]))
+        window.add(16, columns, np.array([True, True, True]))  # app1 is evicted from the full bucket
+        self.assertEqual(window.top(1, now=30), [("app2", 3)])
+        summary = window.summary()
+        self.assertEqual((summary.columns.tolist(), summary.counts.tolist()), ([0, 1], [2, 3]))
+        self.assertEqual(summary.errors.tolist(), [1, 0])  # app1 may have been counted once more in the second bucket
+        self.assertEqual(window.top(3, now=65), [("app2", 2), ("app3", 2)])  # The bucket at 0 expired
+        self.assertEqual(window.top(3, now=200), [])
+
+class TestApproximateManager(unittest.TestCase):
+    def setUp(self):
+        import app as app_module
+        self.client = app_module.app.test_client()
+        self.manager = MetricsManager(top_x_mode="approximate")
+        self.manager.write_to_file = False
+        now = time.time()
+        for tick in range(5):
+            self.manager.process_metrics({"app1": 20, "app2": 5 + tick * 3, "app3": 30}, 10, timestamp=now)
+
+    def test_assigned_counts_stay_approximate(self):
+        """Test that assigning exceedance_count keeps a Space-Saving counter within its capacity."""
+        self.manager.exceedance_count = {f"app{i}": i for i in range(SKETCH_CAPACITY + 10)}
+        self.assertIsInstance(self.manager.exceedance_count, SpaceSavingCounter)
+        self.assertEqual(len(self.manager.exceedance_count), SKETCH_CAPACITY)
+        top = SKETCH_CAPACITY + 9
+        self.assertEqual(self.manager.exceedance_count.top(2), [(f"app{top}", top), (f"app{top - 1}", top - 1)])
+        self.assertEqual(self.manager.exceedance_count["app1"], 0)  # Evicted
+
+    def test_snapshot_rankings(self):
+        """Test that rankings keep their shape and pickled snapshots keep the summaries."""
+        import pickle
+        snapshot = self.manager.publish_snapshot()
+        self.assertEqual(snapshot.get_top_exceedance_apps(3), [("app1", 5), ("app3", 5), ("app2", 3)])
+        self.assertEqual(snapshot.get_exceedance_errors([("app1", 5)], "5m"), [0])
+        restored = pickle.loads(pickle.dumps(snapshot))
+        self.assertEqual(restored.get_top_exceedance_apps(2, "1h"), [("app1", 5), ("app3", 5)])
+        self.assertFalse(restored.counts.counts.flags.writeable)
+
+    def test_exceeding_page(self):
+        self.manager.publish_snapshot()
+        with patch('app.metrics_manager', self.manager), patch('app.DISPLAY_MODE', 'page'), \
+                patch('app.TOP_X_MODE', 'approximate'):
+            response = self.client.get('/exceeding')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Top 3 Apps Exceeding Threshold', response.data)
+        self.assertIn(b'Max. Overcount', response.data)
+
+    def test_counters_stay_bounded(self):
+        """Test that many apps leave the counters and windows within capacity and add no per-app series."""
+        from config import METRIC_NAME
+        metrics = {f"app{i}": 20 for i in range(SKETCH_CAPACITY * 3)}
+        self.manager.process_metrics(metrics, 10, timestamp=time.time())
+        self.assertEqual(len(self.manager.exceedance_count), SKETCH_CAPACITY)
+        for window in self.manager.exceedance_windows.values():
+            self.assertLessEqual(len(window.summary().columns), SKETCH_CAPACITY)
+        self.assertNotIn(METRIC_NAME, self.manager.series.metrics)
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            MetricsManager(top_x_mode="fuzzy")
+
+if __name__ == "__main__":
+    unittest.main()
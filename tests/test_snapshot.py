@@ -0,0 +1,95 @@
+import re
+import threading
+import unittest
+import numpy as np
+from unittest.mock import patch
+from app import app
+from metrics_manager import MetricsManager
+
+class TestMetricsSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.manager = MetricsManager()
+        self.manager.write_to_file = False
+
+    def test_snapshot_is_immutable(self):
+        """Test that a published snapshot cannot be changed by readers or later ticks."""
+        self.manager.store_metrics({"app1": 5, "app2": 20})
+        self.manager.process_metrics({"app1": 5, "app2": 20}, 10)
+        snapshot = self.manager.publish_snapshot()
+        with self.assertRaises(AttributeError):
+            snapshot.values = None
+        with self.assertRaises(ValueError):
+            snapshot.counts[0] = 100
+
+        self.manager.store_metrics({"app1": 50, "app2": 50})
+        self.manager.process_metrics({"app1": 50, "app2": 50}, 10)
+        self.assertEqual(snapshot.values.tolist(), [5, 20])
+        self.assertEqual(snapshot.get_top_exceedance_apps(5), [("app2", 1)])
+        self.assertEqual(self.manager.publish_snapshot().get_top_exceedance_apps(5), [("app2", 2), ("app1", 1)])
+
+    def test_readers_see_last_published_tick(self):
+        """Test that get_top_exceedance_apps answers from the published snapshot."""
+        self.manager.process_metrics({"app1": 20}, 10)
+        self.assertEqual(self.manager.get_top_exceedance_apps(5), [("app1", 1)])  # Nothing published yet
+        self.manager.publish_snapshot()
+        self.manager.process_metrics({"app2": 20, "app3": 20}, 10)
+        self.assertEqual(self.manager.get_top_exceedance_apps(5), [("app1", 1)])
+        self.manager.publish_snapshot()
+        self.assertEqual(self.manager.get_top_exceedance_apps(5, window="5m"),
+                         [("app1", 1), ("app2", 1), ("app3", 1)])
+
+    @patch('app.DISPLAY_MODE', 'page')
+    def test_concurrent_scrapers(self):
+        """Test that scrapers never fail or see a torn tick while the generator keeps publishing."""
+        num_apps, ticks = 200, 300
+        app_names = tuple(f"app{i}" for i in range(num_apps))
+        stop = threading.Event()
+        errors = []
+
+        def tick(number):
+            values = np.full(num_apps, number, dtype=np.int64)  # Every app reports the tick number
+            self.manager.store_values(app_names, values)
+            self.manager.render_exposition()
+            self.manager.process_values(app_names, values, 0)
+            self.manager.publish_snapshot()
+
+        def generate():
+            try:
+                for number in range(2, ticks + 1):
+                    tick(number)
+            except Exception as e:  # Surface generator failures in the main thread
+                errors.append(e)
+            finally:
+                stop.set()
+
+        def scrape():
+            client = app.test_client()
+            try:
+                while not stop.is_set():
+                    body = client.get('/metrics').get_data(as_text=True)
+                    values = set(re.findall(r"\} (\d+)$", body, re.MULTILINE))
+                    if len(values) > 1:
+                        errors.append(AssertionError(f"Torn /metrics body with values {sorted(values)}"))
+                    self.assertEqual(client.get('/exceeding').status_code, 200)
+
+                    top_apps = self.manager.get_top_exceedance_apps(10)
+                    if len({count for _, count in top_apps}) > 1:
+                        errors.append(AssertionError(f"Torn ranking {top_apps}"))
+                    self.manager.get_top_exceedance_apps(10, window="5m")
+            except Exception as e:
+                errors.append(e)
+
+        tick(1)  # Publish before scraping so no request falls back to freshly generated metrics
+        with patch('app.metrics_manager', self.manager):
+            scrapers = [threading.Thread(target=scrape) for _ in range(4)]
+            for thread in scrapers:
+                thread.start()
+            generate()
+            for thread in scrapers:
+                thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(self.manager.snapshot.counts.tolist(), [ticks] * num_apps)
+
+if __name__ == "__main__":
+    unittest.main()
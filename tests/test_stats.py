@@ -0,0 +1,102 @@
+import unittest
+from unittest.mock import patch
+import numpy as np
+from config import STATS_WARMUP_TICKS
+from metrics_history import AppIndex
+from metrics_manager import MetricsManager
+from stats import AppStatistics
+
+class TestAppStatistics(unittest.TestCase):
+    def setUp(self):
+        self.index = AppIndex()
+        self.columns = self.index.columns(["steady", "noisy"])
+        self.statistics = AppStatistics(self.index, alpha=0.1, bins=64, value_range=(1, 1e6), quantile=0.99)
+
+    def test_ewma_and_variance(self):
+        """Test that the baseline and spread follow an exponentially weighted mean and variance."""
+        rng = np.random.default_rng(0)
+        for _ in range(2000):
+            self.statistics.update(self.columns, np.array([100.0, rng.normal(1000, 50)]))
+        self.assertEqual(self.statistics.count.tolist()[:2], [2000, 2000])
+        self.assertAlmostEqual(self.statistics.mean[0], 100)
+        self.assertAlmostEqual(self.statistics.mean[1], 1000, delta=50)
+        self.assertEqual(self.statistics.std(self.columns)[0], 0)
+        self.assertAlmostEqual(self.statistics.std(self.columns)[1], 50, delta=15)
+
+    def test_quantiles_within_bin_error(self):
+        """Test that the tracked and computed quantiles agree with the exact ones up to half a bin."""
+        rng = np.random.default_rng(1)
+        samples = rng.lognormal(7, 1, size=(3000, 2))
+        for row in samples:
+            self.statistics.update(self.columns, row)
+        half_bin = np.exp(self.statistics._log_gamma / 2)
+        for q in (0.5, 0.99):
+            estimates = self.statistics.quantile(q, self.columns)
+            exact = np.quantile(samples, q, axis=0)
+            self.assertTrue(((estimates / exact < half_bin ** 2) & (exact / estimates < half_bin ** 2)).all(), q)
+
+    def test_tracked_quantile_after_shift_and_halving(self):
+        """Test that the incrementally tracked bin matches a full recount when values shift and rows are halved."""
+        index = AppIndex()
+        columns = index.columns([f"app{i}" for i in range(200)])
+        statistics = AppStatistics(index, bins=32, quantile=0.95)
+        rng = np.random.default_rng(2)
+        for tick in range(400):
+            statistics.update(columns, rng.lognormal(5 + (tick > 250) * 2, 1, size=200))
+            if tick % 97 == 0:
+                statistics._halve(columns[:40])
+        cumulative = np.cumsum(statistics.histograms[:200].astype(np.int64), axis=1)
+        rank = np.ceil(0.95 * cumulative[:, -1])
+        self.assertEqual(statistics._quantile_bin[:200].tolist(), np.argmax(cumulative >= rank[:, None], axis=1).tolist())
+
+    def test_thresholds(self):
+        """Test that adaptive thresholds apply after the warm-up and static thresholds ignore the statistics."""
+        for value in range(1, 41):
+            self.statistics.update(self.columns, np.array([100.0, 10.0 * value]))
+        sigma = self.statistics.thresholds(self.columns, "sigma", 5000, sigmas=3, warmup=30)
+        np.testing.assert_allclose(sigma, self.statistics.mean[:2] + 3 * self.statistics.std(self.columns))
+        self.assertEqual(self.statistics.thresholds(self.columns, "sigma", 5000, warmup=50).tolist(), [5000, 5000])
+        self.assertEqual(self.statistics.thresholds(self.columns, "static", 5000), 5000)
+        self.assertLess(self.statistics.thresholds(self.columns, "quantile", 5000, warmup=30)[0], 110)
+        with self.assertRaises(ValueError):
+            self.statistics.thresholds(self.columns, "median", 5000)
+
+class TestAdaptiveManager(unittest.TestCase):
+    def test_sigma_mode_flags_outliers(self):
+        """Test that each app is compared with its own baseline instead of the global threshold."""
+        manager = MetricsManager(threshold_mode="sigma")
+        manager.write_to_file = False
+        rng = np.random.default_rng(3)
+        for _ in range(100):
+            manager.process_metrics({"small": rng.normal(100, 5), "large": rng.normal(50000, 500)}, 10000)
+        manager.process_metrics({"small": 500, "large": 50000}, 10000)
+        self.assertGreaterEqual(manager.exceedance_count["small"], 1)
+        # Above THRESHOLD during the STATS_WARMUP_TICKS warm-up, then rarely above its own baseline
+        self.assertLess(manager.exceedance_count["large"], STATS_WARMUP_TICKS + 5)
+
+    def test_stats_route(self):
+        import app as app_module
+        manager = MetricsManager(threshold_mode="quantile")
+        manager.write_to_file = False
+        for value in range(1, 101):
+            manager.process_metrics({"app1": value}, 10)
+        client = app_module.app.test_client()
+        with patch('app.metrics_manager', manager):
+            response = client.get('/api/v1/stats?app=app1&app=missing')
+            self.assertEqual(client.get('/api/v1/stats').status_code, 400)
+        data = response.get_json()["data"]
+        self.assertEqual(data["thresholdMode"], "quantile")
+        [result] = data["result"]
+        self.assertEqual((result["app_name"], result["count"]), ("app1", 100))
+        self.assertAlmostEqual(result["p50"], 50, delta=15)
+        self.assertEqual(result["threshold"], result["p99"])
+
+    def test_stats_disabled(self):
+        import app as app_module
+        manager = MetricsManager()
+        with patch('app.metrics_manager', manager):
+            response = app_module.app.test_client().get('/api/v1/stats?app=app1')
+        self.assertEqual(response.status_code, 404)
+
+if __name__ == "__main__":
+    unittest.main()